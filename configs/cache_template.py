@@ -1,34 +1,193 @@
+import json
 import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from dotenv import load_dotenv
 
 from configs.database import Session
+from libs.version_marker import template_version
 from models import LookupTemplate
 from templates.templates import templates
 from flask_caching import Cache
 
-session = Session()
+load_dotenv(override=True)
+
+# How often a read checks the shared template version for changes made by other workers
+TEMPLATE_VERSION_CHECK_INTERVAL = float(os.environ.get("TEMPLATE_VERSION_CHECK_INTERVAL", 1))
+# Templates as last published by the realtime listener, so the other workers don't query them
+TEMPLATE_SNAPSHOT_PATH = os.environ.get("TEMPLATE_SNAPSHOT_PATH", "cache/lookup_templates.json")
+
 cache = Cache()
 logger = logging.getLogger(__name__)
 
 
 def get_lookup_templates():
-    lookup_templates = session.query(LookupTemplate).all()
-    return [template.__dict__ for template in lookup_templates]
+    with Session() as session:
+        lookup_templates = session.query(LookupTemplate).all()
+        return [template.__dict__ for template in lookup_templates]
+
+
+# Template contents by name, and the template names by lookup_template id
+TemplateSnapshot = namedtuple("TemplateSnapshot", ["version", "templates", "names"])
+
+
+def changed_names(old, new):
+    return {name for name in old.keys() | new.keys() if old.get(name) != new.get(name)}
+
+
+class TemplateStore:
+    """Process-local snapshot of the lookup templates.
+
+    The snapshot is immutable and swapped in whole, so reads need no lock. It is tagged
+    with the `template_version` it was loaded at; at most once per `check_interval` a
+    read compares that with the shared marker and reloads when another process bumped it.
+    The process publishing a change also writes the templates to `snapshot_path`, and
+    the others reload from that file when its version matches, else from the database.
+    """
+
+    def __init__(self, version_marker=template_version, check_interval=TEMPLATE_VERSION_CHECK_INTERVAL,
+                 snapshot_path=TEMPLATE_SNAPSHOT_PATH):
+        self.version_marker = version_marker
+        self.check_interval = check_interval
+        self.snapshot_path = snapshot_path
+        self._snapshot = TemplateSnapshot(None, MappingProxyType({}), MappingProxyType({}))
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._reloads = 0
+        self._changes = 0
+
+    def _current(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            # Whoever gets the lock reloads, the other readers keep using the old snapshot
+            if self.version_marker.read() != self._snapshot.version and self._lock.acquire(blocking=False):
+                try:
+                    self._load()
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    def _swap(self, version, templates, names):
+        previous = self._snapshot
+        self._snapshot = TemplateSnapshot(version, MappingProxyType(templates), MappingProxyType(names))
+        # Nothing to compare with on the first load
+        return changed_names(previous.templates, templates) if previous.version is not None else set()
+
+    def _read_published(self, version):
+        try:
+            with open(self.snapshot_path) as file:
+                published = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return published["templates"] if published.get("version") == version else None
+
+    def _write_published(self):
+        snapshot = self._snapshot
+        templates = [
+            {"id": template_id, "name": name, "content": snapshot.templates.get(name)}
+            for template_id, name in snapshot.names.items()
+        ]
+        temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump({"version": snapshot.version, "templates": templates}, file)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Could not publish lookup templates: {e}")
+
+    def _load(self, from_database=False):
+        # Read before loading, so a change committed meanwhile triggers another reload
+        version = self.version_marker.read()
+        lookup_templates = None if from_database else self._read_published(version)
+        if lookup_templates is None:
+            try:
+                lookup_templates = get_lookup_templates()
+            except Exception as e:
+                logger.error(f"Could not load lookup templates: {e}")
+                return set()
+        self._reloads += 1
+        return self._swap(
+            version,
+            {template['name']: template['content'] for template in lookup_templates},
+            {template['id']: template['name'] for template in lookup_templates},
+        )
+
+    def get(self, name):
+        return self._current().templates.get(name)
+
+    def version(self):
+        return self._current().version
+
+    def reload(self):
+        """Load every template, returns the names whose content changed."""
+        with self._lock:
+            return self._load()
+
+    def publish(self):
+        """Reload from the database after lookup_template changed and have the other workers follow."""
+        with self._lock:
+            self.version_marker.bump()
+            names = self._load(from_database=True)
+            self._write_published()
+            return names
+
+    def apply(self, upserts, deleted_ids):
+        """Apply inserted/updated lookup_template rows and deleted ids without a reload.
+
+        Returns the names whose content changed. The other workers follow through the
+        version marker.
+        """
+        with self._lock:
+            if self._snapshot.version is None:
+                # Nothing loaded to apply the changes to
+                self.version_marker.bump()
+                names = self._load(from_database=True)
+                self._write_published()
+                return names
+
+            templates = dict(self._snapshot.templates)
+            names = dict(self._snapshot.names)
+            for template_id in deleted_ids:
+                templates.pop(names.pop(template_id, None), None)
+            for record in upserts:
+                previous_name = names.get(record['id'])
+                if previous_name is not None and previous_name != record['name']:
+                    templates.pop(previous_name, None)
+                names[record['id']] = record['name']
+                templates[record['name']] = record['content']
+
+            self._changes += 1
+            changed = self._swap(self.version_marker.bump(), templates, names)
+            self._write_published()
+            return changed
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "size": len(snapshot.templates),
+            "reloads": self._reloads,
+            "changes": self._changes,
+        }
+
+
+template_store = TemplateStore()
 
 
 def init_lookup_templates_cache():
-    lookup_templates = get_lookup_templates()
-    lookup_templates_dict = {template['name']: template['content'] for template in lookup_templates}
-    cache.set("lookup_templates", lookup_templates_dict)
+    template_store.reload()
 
 
 def get_template_content_by_name(name):
-    if cache:
-        lookup_templates_dict = cache.get("lookup_templates")
-        if lookup_templates_dict:
-            template = lookup_templates_dict.get(name)
-            if template:
-                return template
-    # Fallback to sms_templates if the key is not found in the cache
+    template = template_store.get(name)
+    if template:
+        return template
+    # Fallback to sms_templates if the key is not found in the store
     fallback_template = templates.get(name)
     if fallback_template:
         return fallback_template
@@ -37,27 +196,32 @@ def get_template_content_by_name(name):
 
 
 def update_lookup_templates_cache():
-    lookup_templates = get_lookup_templates()
-    lookup_templates_dict = {template['name']: template['content'] for template in lookup_templates}
-    cache.set("lookup_templates", lookup_templates_dict)
+    return template_store.publish()
 
 
-def get_tax_message(tax_status):
-    tax_status_mapping = {
-        "TAX_DEBT": get_template_content_by_name("has_tax_debt"),
-        "FORECLOSED": get_template_content_by_name("foreclosed"),
-        "FORFEITED": get_template_content_by_name("forfeited"),
-        "NO_INFORMATION": None,
-    }
+# Template sent with the /more replies for each status (None: nothing to send)
+TAX_STATUS_TEMPLATES = {
+    "TAX_DEBT": "has_tax_debt",
+    "FORECLOSED": "foreclosed",
+    "FORFEITED": "forfeited",
+    "NO_INFORMATION": None,
+}
+RENTAL_STATUS_TEMPLATES = {
+    "REGISTERED": "registered",
+    "UNREGISTERED": "unregistered",
+    "NO_INFORMATION": None,
+}
 
-    return tax_status_mapping.get(tax_status, "Invalid tax status")
 
+def get_tax_message(tax_status):
+    if tax_status not in TAX_STATUS_TEMPLATES:
+        return "Invalid tax status"
+    name = TAX_STATUS_TEMPLATES[tax_status]
+    return get_template_content_by_name(name) if name else None
 
-def get_rental_message(rental_status):
-    rental_status_mapping = {
-        "REGISTERED": get_template_content_by_name("registered"),
-        "UNREGISTERED": get_template_content_by_name("unregistered"),
-        "NO_INFORMATION": None,
-    }
 
-    return rental_status_mapping.get(rental_status, "Invalid rental status")
+def get_rental_message(rental_status):
+    if rental_status not in RENTAL_STATUS_TEMPLATES:
+        return "Invalid rental status"
+    name = RENTAL_STATUS_TEMPLATES[rental_status]
+    return get_template_content_by_name(name) if name else None
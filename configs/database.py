@@ -2,13 +2,17 @@ import os
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from libs.connection_leaks import ConnectionLeakDetector
+from libs.db_metrics import InstrumentedQueuePool, instrument_engine
 
 load_dotenv(override=True)
 db_url = os.environ.get("DATABASE_URL")
 
 engine = create_engine(
     db_url,
+    poolclass=InstrumentedQueuePool,
     pool_size=15,
     max_overflow=0,
     pool_pre_ping=True,
@@ -20,4 +24,15 @@ engine = create_engine(
     },
 )
 
+instrument_engine(engine)
+
 Session = sessionmaker(bind=engine)
+
+# One session per thread for request handlers and jobs, removed when their app context
+# ends (see main.py). Code running elsewhere uses `with Session() as session:`.
+db_session = scoped_session(Session)
+
+DB_LEAK_DETECTION = os.environ.get("DB_LEAK_DETECTION", "true").lower() == "true"
+DB_LEAK_THRESHOLD_SECONDS = float(os.environ.get("DB_LEAK_THRESHOLD_SECONDS", 30))
+
+leak_detector = ConnectionLeakDetector(engine, DB_LEAK_THRESHOLD_SECONDS) if DB_LEAK_DETECTION else None
@@ -0,0 +1,277 @@
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import MetaData
+
+from configs.cache_template import get_template_content_by_name
+from configs.database import engine
+from libs.version_marker import ingest_version
+
+load_dotenv(override=True)
+key = os.environ.get("OPENAI_API_KEY")
+QUERY_ENGINE_CACHE_DIR = os.environ.get("QUERY_ENGINE_CACHE_DIR", "cache/query_engine")
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = "address_lookup"
+TABLES = ["mi_wayne_detroit", "residential_rental_registrations"]
+
+# Columns the search_context SQL reads from mi_wayne_detroit
+LOOKUP_COLUMNS = ["address", "owner", "tax_due", "tax_status", "saddno", "saddstr", "szip5", "wkb_geometry"]
+
+# Every variant answers from mi_wayne_detroit; they only differ in the context template
+# telling the LLM which SQL to write. "tables" are the candidate tables for the prompt and
+# "columns" the per-table allowlist used to describe them (all columns if a table is missing).
+QUERY_ENGINE_VARIANTS = {
+    "owner": {
+        "tables": ["mi_wayne_detroit"],
+        "context": "search_context_with_sunit",
+        "columns": {"mi_wayne_detroit": LOOKUP_COLUMNS + ["sunit"]},
+    },
+    "owner_without_sunit": {
+        "tables": ["mi_wayne_detroit"],
+        "context": "search_context",
+        "columns": {"mi_wayne_detroit": LOOKUP_COLUMNS},
+    },
+}
+# The tax lookups ask the same question of the same row, so they share the owner engines
+QUERY_ENGINE_ALIASES = {"tax": "owner", "tax_without_sunit": "owner_without_sunit"}
+
+
+def describe_table(table, columns=None):
+    """Table description in the format llama_index puts in the text-to-SQL prompt."""
+    descriptions = []
+    for column in table.columns:
+        if columns is not None and column.name not in columns:
+            continue
+        if column.comment:
+            descriptions.append(f"{column.name} ({column.type!s}): '{column.comment}'")
+        else:
+            descriptions.append(f"{column.name} ({column.type!s})")
+
+    foreign_keys = [
+        f"{[element.parent.name]} -> {element.column.table.name}.{[element.column.name]}"
+        for element in sorted(table.foreign_keys, key=lambda element: element.parent.name)
+        if columns is None or element.parent.name in columns
+    ]
+
+    description = f"Table '{table.name}' has columns: {', '.join(descriptions)}, "
+    if table.comment:
+        description += f"with comment: ({table.comment}) "
+    return description + f"and foreign keys: {', '.join(foreign_keys)}."
+
+
+def text_to_sql():
+    # llama_index takes seconds to import, so it is only loaded once an engine is built
+    from configs.query_engine import text_to_sql
+    return text_to_sql
+
+
+class QueryEngineFactory:
+    """Builds the LLM text-to-SQL query engines on first use.
+
+    The address_lookup schema is reflected once per ingest version and pickled to
+    QUERY_ENGINE_CACHE_DIR, since the ingest scripts replace the tables wholesale; a
+    bumped version also rebuilds the engines. Table object indexes for variants with
+    several candidate tables are persisted there too, and all engines share one
+    SQLDatabase and one OpenAI client.
+    Build times are kept in `timings` and logged.
+    """
+
+    def __init__(self, cache_dir=QUERY_ENGINE_CACHE_DIR, version_marker=ingest_version):
+        self.cache_dir = cache_dir
+        self.version_marker = version_marker
+        self.timings = {}
+        self._engines = {}
+        self._sql_database = None
+        self._version = None
+        self._llm = None
+        self._lock = threading.RLock()
+
+    def schema_cache_path(self, version):
+        return os.path.join(self.cache_dir, f"address_lookup_metadata_{version}.pickle")
+
+    def _remove_older_schema_caches(self, version):
+        # Only older ones: another worker may already have written a newer version's
+        for path in glob.glob(self.schema_cache_path("*")):
+            cached_version = os.path.basename(path)[len("address_lookup_metadata_"):-len(".pickle")]
+            if cached_version.isdigit() and int(cached_version) < version:
+                os.remove(path)
+
+    def _check_version(self):
+        # Called with the lock held
+        version = self.version_marker.read()
+        if version != self._version:
+            if self._version is not None:
+                logger.info(f"Ingest version {version}, rebuilding query engines")
+            self._version = version
+            self._sql_database = None
+            self._engines = {}
+
+    def _timed(self, name, build):
+        start = time.perf_counter()
+        result = build()
+        self.timings[name] = time.perf_counter() - start
+        logger.info(f"Query engine {name} ready in {self.timings[name]:.3f}s")
+        return result
+
+    def _load_metadata(self, path):
+        try:
+            with open(path, "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schema cache {path}: {e}")
+            return None
+
+    def _build_sql_database(self):
+        path = self.schema_cache_path(self._version)
+        metadata = self._load_metadata(path)
+        cached = metadata is not None
+        if not cached:
+            metadata = MetaData(schema=SCHEMA)
+
+        # Tables already present in the metadata are not reflected again
+        sql_database = text_to_sql().SQLDatabase(engine, schema=SCHEMA, include_tables=TABLES, metadata=metadata)
+
+        if not cached:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as file:
+                pickle.dump(metadata, file)
+            os.replace(temp_path, path)
+            self._remove_older_schema_caches(self._version)
+
+        return sql_database
+
+    @property
+    def sql_database(self):
+        with self._lock:
+            self._check_version()
+            if self._sql_database is None:
+                self._sql_database = self._timed("schema", self._build_sql_database)
+            return self._sql_database
+
+    @property
+    def llm(self):
+        with self._lock:
+            if self._llm is None:
+                self._llm = text_to_sql().OpenAI(temperature=0.1, model="gpt-3.5-turbo", api_key=key)
+            return self._llm
+
+    def _build_object_index(self, sql_database, table_schema_objs):
+        llama = text_to_sql()
+        table_node_mapping = llama.SQLTableNodeMapping(sql_database)
+        # Keyed by the schema objects, so a changed search_context template gets a new index
+        digest = hashlib.sha1(repr(table_schema_objs).encode()).hexdigest()[:12]
+        persist_dir = os.path.join(self.cache_dir, f"object_index_{digest}")
+
+        if os.path.isdir(persist_dir):
+            try:
+                return llama.ObjectIndex.from_persist_dir(persist_dir, object_node_mapping=table_node_mapping)
+            except Exception as e:
+                logger.warning(f"Rebuilding object index {persist_dir}: {e}")
+
+        obj_index = llama.ObjectIndex.from_objects(table_schema_objs, table_node_mapping, llama.VectorStoreIndex)
+        obj_index.persist(persist_dir=persist_dir)
+        return obj_index
+
+    def _build_engine(self, variant):
+        llama = text_to_sql()
+        config = QUERY_ENGINE_VARIANTS[variant]
+        qa_prompt_tmpl = llama.PromptTemplate(get_template_content_by_name("search_prompt"))
+        context_str = get_template_content_by_name(config["context"])
+        table_schema_objs = [
+            llama.SQLTableSchema(table_name=table, context_str=context_str) for table in config["tables"]
+        ]
+
+        sql_database = llama.PrunedSQLDatabase.from_database(self.sql_database, config["columns"])
+
+        if len(table_schema_objs) == 1:
+            # Nothing to choose between: put the table schema and context straight into the
+            # prompt instead of paying for an embedding call to retrieve the only table.
+            query_engine = llama.NLSQLTableQueryEngine(
+                sql_database,
+                tables=config["tables"],
+                context_query_kwargs={schema_obj.table_name: schema_obj.context_str for schema_obj in table_schema_objs},
+                llm=self.llm,
+            )
+        else:
+            obj_index = self._build_object_index(sql_database, table_schema_objs)
+            query_engine = llama.SQLTableRetrieverQueryEngine(
+                sql_database, obj_index.as_retriever(similarity_top_k=1), llm=self.llm
+            )
+
+        query_engine.update_prompts(
+            {"sql_retriever:text_to_sql_prompt": qa_prompt_tmpl},
+        )
+        return query_engine
+
+    def get(self, variant):
+        variant = QUERY_ENGINE_ALIASES.get(variant, variant)
+        with self._lock:
+            self._check_version()
+            if variant not in self._engines:
+                self._engines[variant] = self._timed(variant, lambda: self._build_engine(variant))
+            return self._engines[variant]
+
+    def lazy(self, variant):
+        return LazyQueryEngine(self, variant)
+
+
+def schema_token_report():
+    """Prompt tokens per variant with the full and with the pruned table descriptions.
+
+    Uses the table definitions from models.py, so it needs neither a database nor the
+    OpenAI API. Falls back to ~4 characters per token when the tiktoken encoding can't
+    be downloaded.
+    """
+    import tiktoken
+
+    from models import Base
+    from templates.templates import templates
+
+    tables = {table.name: table for table in Base.metadata.tables.values()}
+    try:
+        encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+    except Exception as e:
+        logger.warning(f"Estimating token counts, tiktoken encoding unavailable: {e}")
+        encoding = None
+
+    def count_tokens(text):
+        if encoding is None:
+            return len(text) // 4
+        return len(encoding.encode(text))
+
+    def prompt_tokens(config, columns):
+        schema = "\n\n".join(
+            describe_table(tables[table], columns.get(table)) + " The table description is: "
+            + templates[config["context"]]
+            for table in config["tables"]
+        )
+        prompt = templates["search_prompt"].format(dialect="postgresql", schema=schema, query_str="")
+        return count_tokens(prompt)
+
+    return {
+        variant: (prompt_tokens(config, {}), prompt_tokens(config, config["columns"]))
+        for variant, config in QUERY_ENGINE_VARIANTS.items()
+    }
+
+
+class LazyQueryEngine:
+    def __init__(self, factory, variant):
+        self.factory = factory
+        self.variant = variant
+
+    def query(self, query_str):
+        return self.factory.get(self.variant).query(query_str)
+
+
+query_engine_factory = QueryEngineFactory()
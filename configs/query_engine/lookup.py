@@ -0,0 +1,208 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from dotenv import load_dotenv
+from sqlalchemy import case
+
+from configs.cache_template import get_template_content_by_name, template_store
+from configs.database import db_session
+from libs.parcel_snapshot import ParcelRecord, get_parcel_snapshot
+from libs.stages import stage
+from libs.version_marker import ingest_version
+from models import MiWayneDetroit, ParcelRentalMatch
+
+load_dotenv(override=True)
+
+LOOKUP_RESULT_CACHE_SIZE = int(os.environ.get("LOOKUP_RESULT_CACHE_SIZE", 5000))
+
+# Same columns, in the same order, as the SQL the LLM engines are prompted to write
+# (see the search_context templates), so map_keys_to_result/check_property_status
+# work unchanged on either engine's response.
+LOOKUP_COL_KEYS = ["owner", "rental_status", "tax_due", "tax_status"]
+
+
+def build_lookup_query(session, address, sunit=""):
+    # parcel_rental_matches is precomputed at ingest (see cron/rental_match.py), so the
+    # rental status is an indexed equality join instead of a spatial/trigram match.
+    rental_status_case = case(
+        (ParcelRentalMatch.record_id.isnot(None), "IS"), else_="IS NOT"
+    ).label("rental_status")
+
+    query = (
+        session.query(
+            MiWayneDetroit.ogc_fid,
+            MiWayneDetroit.address,
+            MiWayneDetroit.sunit,
+            MiWayneDetroit.owner,
+            rental_status_case,
+            MiWayneDetroit.tax_due,
+            MiWayneDetroit.tax_status,
+            MiWayneDetroit.szip5,
+        )
+        .outerjoin(ParcelRentalMatch, ParcelRentalMatch.ogc_fid == MiWayneDetroit.ogc_fid)
+        .filter(MiWayneDetroit.address.ilike(f"{address.strip()}%"))
+    )
+
+    if sunit:
+        query = query.filter(MiWayneDetroit.sunit.ilike(f"%{sunit}%"))
+
+    return query
+
+
+def format_tax_due(tax_due):
+    return f"${tax_due or 0:,.2f}"
+
+
+def render_owner_information(row, content=None):
+    if content is None:
+        content = get_template_content_by_name("owner_information")
+    if not content:
+        return ""
+
+    return content.format(
+        owner=row.owner or "an unknown owner",
+        address=row.address,
+        tax_due=format_tax_due(row.tax_due),
+        tax_status=row.tax_status or "unknown",
+    )
+
+
+class LookupResponse:
+    """Stand-in for the llama_index Response returned by the LLM query engines."""
+
+    def __init__(self, response="", metadata=None):
+        self.response = response
+        self.metadata = metadata or {}
+
+    def __str__(self):
+        return self.response
+
+
+def respond(row):
+    return LookupResponse(
+        response=render_owner_information(row),
+        metadata={
+            "result": [[getattr(row, key) for key in LOOKUP_COL_KEYS]],
+            "col_keys": LOOKUP_COL_KEYS,
+        },
+    )
+
+
+# Parcels matching a lookup, and the owner reply rendered for the first one (None if no match)
+LookupResult = namedtuple("LookupResult", ["rows", "response"])
+
+
+class LookupVersion:
+    """The data and template versions a lookup result was produced with.
+
+    The cached reply is rendered from the templates, so a template change has to
+    invalidate it just like new data does.
+    """
+
+    def read(self):
+        return ingest_version.read(), template_store.version()
+
+
+class LookupResultCache:
+    """Size-bounded LRU of lookup results, tagged with the version they were read at.
+
+    An entry from an older version is a miss, so bumping `ingest_version` after new data
+    is swapped in (or `template_version` after a template edit) invalidates every
+    worker's cache at once.
+    """
+
+    def __init__(self, max_size=LOOKUP_RESULT_CACHE_SIZE, version=None):
+        self.max_size = max_size
+        self.version = version or LookupVersion()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "stale": 0}
+
+    def get(self, key):
+        version = self.version.read()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counts["misses"] += 1
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                self._counts["stale"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counts["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value, version):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = sum(self._counts.values())
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                **self._counts,
+                "hit_rate": self._counts["hits"] / lookups if lookups else 0.0,
+            }
+
+
+lookup_result_cache = LookupResultCache()
+
+
+def find_parcels(address, sunit=""):
+    """Parcels matching the normalized address and unit, served from `lookup_result_cache`."""
+    key = (address.strip().upper(), sunit.strip().upper())
+    result = lookup_result_cache.get(key)
+    if result is not None:
+        return result
+
+    # Read before querying, so data swapped in meanwhile isn't cached under the new version
+    version = lookup_result_cache.version.read()
+    snapshot = get_parcel_snapshot()
+    if snapshot is not None:
+        rows = snapshot.search(address, sunit)
+    else:
+        rows = [
+            ParcelRecord(**{field: getattr(row, field) for field in ParcelRecord._fields})
+            for row in build_lookup_query(db_session, address, sunit).all()
+        ]
+
+    result = LookupResult(tuple(rows), respond(rows[0]) if rows else None)
+    lookup_result_cache.set(key, result, version)
+    return result
+
+
+class LookupQueryEngine:
+    """Answers owner/tax lookups with one parameterized query and the reply templates.
+
+    The LLM text-to-SQL engine, if given, is only used when no parcel matches.
+    """
+
+    def __init__(self, fallback_engine=None):
+        self.fallback_engine = fallback_engine
+
+    def respond(self, row):
+        return respond(row)
+
+    def query(self, address, sunit=""):
+        result = find_parcels(address, sunit)
+        if result.response is not None:
+            return result.response
+
+        if self.fallback_engine is not None:
+            with stage("llm_query_engine"):
+                if sunit:
+                    return self.fallback_engine.query(str({"address": address, "sunit": sunit}))
+                return self.fallback_engine.query(str({"address": address}))
+
+        return LookupResponse()
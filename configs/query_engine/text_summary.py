@@ -1,16 +1,19 @@
+import functools
 import logging
 import os
 
 from dotenv import load_dotenv
-from configs.database import Session
-from llama_index.llms.openai import OpenAI
 
 load_dotenv(override=True)
 key = os.environ.get("OPENAI_API_KEY")
-session = Session()
 logger = logging.getLogger(__name__)
 
-llm = OpenAI(model="gpt-4o")
+
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    # Built on first use: llama_index's OpenAI wrapper is slow to import
+    from llama_index.llms.openai import OpenAI
+    return OpenAI(model="gpt-4o")
 
 
 def generate_text_summary(summary_input, prompt=None):
@@ -19,4 +22,4 @@ def generate_text_summary(summary_input, prompt=None):
 
     joined_comments = " ".join(comments)
 
-    return llm.complete(f"{joined_comments}\n\nSummarize under 200 words: The theme will be " + prompt)
+    return get_llm().complete(f"{joined_comments}\n\nSummarize under 200 words: The theme will be " + prompt)
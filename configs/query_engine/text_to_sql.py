@@ -0,0 +1,31 @@
+# The llama_index side of the text-to-SQL engines, imported by QueryEngineFactory on first use
+from llama_index.core import PromptTemplate, SQLDatabase, VectorStoreIndex
+from llama_index.core.indices.struct_store.sql_query import (
+    NLSQLTableQueryEngine,
+    SQLTableRetrieverQueryEngine,
+)
+from llama_index.core.objects import ObjectIndex, SQLTableNodeMapping, SQLTableSchema
+from llama_index.llms.openai import OpenAI
+
+from configs.query_engine.factory import describe_table
+
+
+class PrunedSQLDatabase(SQLDatabase):
+    """A view of a shared SQLDatabase that only describes allowlisted columns.
+
+    Table descriptions come from the already reflected metadata rather than from a
+    new inspector round trip every time a prompt is built.
+    """
+
+    @classmethod
+    def from_database(cls, sql_database, columns):
+        pruned = cls.__new__(cls)
+        pruned.__dict__.update(sql_database.__dict__)
+        pruned._columns = columns
+        return pruned
+
+    def get_single_table_info(self, table_name):
+        table = self._metadata.tables.get(f"{self._schema}.{table_name}")
+        if table is None:
+            return super().get_single_table_info(table_name)
+        return describe_table(table, self._columns.get(table_name))
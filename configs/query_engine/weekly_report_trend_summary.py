@@ -6,19 +6,16 @@ from dotenv import load_dotenv
 
 from configs.database import Session
 from templates.templates import templates
-from llama_index.core import DocumentSummaryIndex
-from llama_index.llms.openai import OpenAI
-from llama_index.core.schema import Document
 
 load_dotenv(override=True)
 key = os.environ.get("OPENAI_API_KEY")
-session = Session()
 logger = logging.getLogger(__name__)
 
 
 def generate_report_summary(messages_history):
     try:
-        lookup_template = session.query(LookupTemplate).filter_by(name="sms_history_summary").first()
+        with Session() as session:
+            lookup_template = session.query(LookupTemplate).filter_by(name="sms_history_summary").first()
         if lookup_template:
             text = lookup_template.content
         else:
@@ -31,6 +28,12 @@ def generate_report_summary(messages_history):
     except Exception as e:
         logger.error(f"Error fetching template from database: {e}")
         return None
+
+    # Only the weekly report needs these, keep them out of the app's startup
+    from llama_index.core import DocumentSummaryIndex
+    from llama_index.core.schema import Document
+    from llama_index.llms.openai import OpenAI
+
     documents = [Document(doc_id=str(i), text=str(conversation)) for i, conversation in enumerate(messages_history.values())]
 
     summary_index = DocumentSummaryIndex.from_documents(documents)
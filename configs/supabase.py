@@ -4,44 +4,175 @@ from dotenv import load_dotenv
 from realtime import Channel
 from realtime.connection import Socket
 import asyncio
+import random
+import threading
+import time
 from typing import cast
 import logging
 
 
-from configs.cache_template import update_lookup_templates_cache
+from configs.cache_template import template_store
+from cron.parcel_replies import rerender_parcel_replies
+from libs.host_lock import HostLock
 
 load_dotenv(override=True)
 
 supabase_id = os.environ.get("SUPABASE_ID")
 api_key = os.environ.get("API_KEY")
 
+# Changes arriving within this window are applied to the templates together
+TEMPLATE_CHANGE_DEBOUNCE_SECONDS = float(os.environ.get("TEMPLATE_CHANGE_DEBOUNCE_SECONDS", 0.2))
+
+# Only the process holding this lock keeps a websocket open
+REALTIME_LEADER_LOCK_PATH = os.environ.get("REALTIME_LEADER_LOCK_PATH", "cache/realtime_listener.lock")
+REALTIME_LEADER_RETRY_SECONDS = float(os.environ.get("REALTIME_LEADER_RETRY_SECONDS", 10))
+REALTIME_BACKOFF_BASE = float(os.environ.get("REALTIME_BACKOFF_BASE", 1))
+REALTIME_BACKOFF_MAX = float(os.environ.get("REALTIME_BACKOFF_MAX", 60))
+# A connection that stayed up this long resets the backoff
+REALTIME_STABLE_SECONDS = 60
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class TemplateChanges:
+    """Coalesces lookup_template changes from the realtime channel.
+
+    INSERT/UPDATE/DELETE payloads are applied to `template_store` straight from their
+    records, a burst of them in one go once `debounce` seconds have passed since the
+    first. A (re)subscribe, or a payload the records can't be taken from (omitted or
+    truncated by the server), means changes may have been missed, so the templates are
+    reloaded from the database instead. Parcel replies using a changed template are
+    re-rendered afterwards.
+    """
+
+    def __init__(self, store=template_store, debounce=TEMPLATE_CHANGE_DEBOUNCE_SECONDS):
+        self.store = store
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._timer = None
+        self._reset()
+
+    def _reset(self):
+        self._upserts = {}
+        self._deleted_ids = set()
+        self._full_reload = False
+
+    def add(self, payload):
+        change_type = payload.get("type")
+        record = payload.get("record") or {}
+        old_record = payload.get("old_record") or {}
+        with self._lock:
+            if payload.get("errors"):
+                logger.warning(f"lookup_template change without its record: {payload.get('errors')}")
+                self._full_reload = True
+            elif change_type in ("INSERT", "UPDATE") and {"id", "name", "content"} <= record.keys():
+                self._deleted_ids.discard(record["id"])
+                self._upserts[record["id"]] = record
+            elif change_type == "DELETE" and "id" in old_record:
+                self._upserts.pop(old_record["id"], None)
+                self._deleted_ids.add(old_record["id"])
+            else:
+                logger.warning(f"Unexpected lookup_template change, reloading: {payload}")
+                self._full_reload = True
+            self._schedule()
+
+    def reload(self):
+        with self._lock:
+            self._full_reload = True
+            self._schedule()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            upserts, deleted_ids, full_reload = list(self._upserts.values()), self._deleted_ids, self._full_reload
+            self._reset()
+            self._timer = None
+
+        if full_reload:
+            names = self.store.publish()
+        elif upserts or deleted_ids:
+            names = self.store.apply(upserts, deleted_ids)
+        else:
+            return
+        logger.info(f"Applied lookup_template changes, changed templates: {sorted(names)}")
+        if names:
+            rerender_parcel_replies(sorted(names))
+
+
+template_changes = TemplateChanges()
+listener_lock = HostLock(REALTIME_LEADER_LOCK_PATH)
+
+
 def callback1(payload):
     logger.info(payload)
-    if payload.get('message') != "Subscribed to PostgresSQL":
-        update_lookup_templates_cache()
+    if "type" in payload:
+        template_changes.add(payload)
+    elif str(payload.get("message", "")).startswith("Subscribed"):
+        # Whatever changed while we weren't subscribed
+        template_changes.reload()
 
 
 async def connect_to_supabase():
-        URL = f"wss://{supabase_id}.supabase.co/realtime/v1/websocket?apikey={api_key}&vsn=1.0.0"
-        s = Socket(URL)
-        await s._connect()
-        # channel_1 = s.set_channel("realtime:public:lookup_template")
-        channel_1 = cast(Channel, s.set_channel("realtime:public:lookup_template"))
+    """Listen to lookup_template changes until the connection drops."""
+    URL = f"wss://{supabase_id}.supabase.co/realtime/v1/websocket?apikey={api_key}&vsn=1.0.0"
+    s = Socket(URL)
+    await s._connect()
+    channel_1 = cast(Channel, s.set_channel("realtime:public:lookup_template"))
+    channel_1.on("*", callback1)
+    await channel_1._join()
+    # Changes made while we weren't subscribed are only in the database
+    template_changes.reload()
+
+    tasks = [asyncio.create_task(s._listen()), asyncio.create_task(s._keep_alive())]
+    try:
+        # Either one returns once the connection is closed
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await s._close()
 
-        await asyncio.create_task(channel_1._join())
 
-        channel_1.on("*", callback1)
-        listen_task = asyncio.create_task(s._listen())
-        keep_alive_task = asyncio.create_task(s._keep_alive())
-        await asyncio.gather(listen_task, keep_alive_task)
-        # s.listen()
+def reconnect_delay(attempt):
+    return random.uniform(0, min(REALTIME_BACKOFF_MAX, REALTIME_BACKOFF_BASE * 2 ** attempt))
+
+
+async def listen_for_template_changes():
+    """Stay subscribed, reconnecting with backoff whenever the connection drops or fails."""
+    attempt = 0
+    while True:
+        connected_at = time.monotonic()
+        try:
+            await connect_to_supabase()
+            logger.warning("Realtime connection closed")
+        except Exception as e:
+            logger.error(f"Realtime connection failed: {e}")
+        if time.monotonic() - connected_at > REALTIME_STABLE_SECONDS:
+            attempt = 0
+        delay = reconnect_delay(attempt)
+        attempt += 1
+        logger.info(f"Reconnecting to realtime in {delay:.1f}s")
+        await asyncio.sleep(delay)
 
 
 def run_websocket_listener():
+    """Run the realtime listener in the one process per host that holds `listener_lock`.
+
+    Every worker calls this; the others keep retrying the lock and take over when the
+    listening process exits. They pick up template changes through `template_store`.
+    """
+    while not listener_lock.try_acquire():
+        time.sleep(REALTIME_LEADER_RETRY_SECONDS)
+
+    logger.info(f"Process {os.getpid()} is the realtime listener")
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.run_until_complete(connect_to_supabase())
+    loop.run_until_complete(listen_for_template_changes())
@@ -1,5 +1,14 @@
-CREATE_MESSAGE_URL = "https://public.missiveapp.com/v1/drafts"
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Pointed at scripts/loadtest/fake_missive.py for load tests
+MISSIVE_API_BASE_URL = os.environ.get("MISSIVE_API_BASE_URL", "https://public.missiveapp.com/v1").rstrip("/")
+
+CREATE_MESSAGE_URL = f"{MISSIVE_API_BASE_URL}/drafts"
 CONVERSATION_MESSAGES_URL = (
-    "https://public.missiveapp.com/v1/conversations/{conversation_id}/messages"
+    MISSIVE_API_BASE_URL + "/conversations/{conversation_id}/messages"
 )
-CREATE_POST_URL = "https://public.missiveapp.com/v1/posts"
+CREATE_POST_URL = f"{MISSIVE_API_BASE_URL}/posts"
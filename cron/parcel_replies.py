@@ -0,0 +1,135 @@
+import datetime
+
+from loguru import logger
+from sqlalchemy import case, insert, select, text, update
+from sqlalchemy.orm import Session as OrmSession
+
+from configs.database import engine
+from libs.parcel_snapshot import ParcelRecord
+from models import LookupTemplate, MiWayneDetroit, ParcelRentalMatch, ParcelReply
+from templates.templates import templates as default_templates
+from utils.parcel_replies import classify_parcel, render_parcel_replies
+
+BATCH_SIZE = 10000
+
+# Only one process renders at a time, the others wait their turn
+PARCEL_REPLIES_LOCK_ID = 7215001
+
+SWAP_PARCEL_REPLIES = [
+    "DROP TABLE IF EXISTS address_lookup.parcel_replies",
+    "ALTER TABLE address_lookup.parcel_replies_new RENAME TO parcel_replies",
+    "ALTER INDEX address_lookup.parcel_replies_new_pkey RENAME TO parcel_replies_pkey",
+]
+
+
+def load_templates(connection):
+    """The reply templates as the app resolves them: lookup_template rows over the defaults."""
+    rows = connection.execute(select(LookupTemplate.name, LookupTemplate.content)).all()
+    return {**default_templates, **{name: content for name, content in rows if content}}
+
+
+def parcel_rows_query():
+    rental_status_case = case(
+        (ParcelRentalMatch.record_id.isnot(None), "IS"), else_="IS NOT"
+    ).label("rental_status")
+    return (
+        select(
+            MiWayneDetroit.ogc_fid,
+            MiWayneDetroit.address,
+            MiWayneDetroit.sunit,
+            MiWayneDetroit.szip5,
+            MiWayneDetroit.owner,
+            rental_status_case,
+            MiWayneDetroit.tax_due,
+            MiWayneDetroit.tax_status,
+        )
+        .outerjoin(ParcelRentalMatch, ParcelRentalMatch.ogc_fid == MiWayneDetroit.ogc_fid)
+        .filter(MiWayneDetroit.address.isnot(None))
+    )
+
+
+def parcel_reply_values(row, templates, rendered_at):
+    record = ParcelRecord(**row._mapping)
+    classification = classify_parcel(record)
+    replies = render_parcel_replies(record, templates)
+    return {
+        "ogc_fid": record.ogc_fid,
+        "first_message": replies.first_message,
+        "following_message": replies.following_message,
+        "more_messages": replies.more_messages,
+        "tax_status": classification.lookup_tax_status,
+        "rental_status": classification.rental_status,
+        "template_names": replies.template_names,
+        "rendered_at": rendered_at,
+    }
+
+
+def render_in_batches(connection, query, templates, write):
+    rendered_at = datetime.datetime.now(datetime.timezone.utc)
+    count = 0
+    batch = []
+    for row in connection.execution_options(yield_per=BATCH_SIZE).execute(query):
+        batch.append(parcel_reply_values(row, templates, rendered_at))
+        if len(batch) == BATCH_SIZE:
+            write(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        write(batch)
+        count += len(batch)
+    return count
+
+
+def create_parcel_replies_table():
+    """Create an empty parcel_replies if no ingest has rendered one yet."""
+    ParcelReply.__table__.create(engine, checkfirst=True)
+
+
+def refresh_parcel_replies():
+    """Render the replies for every parcel into parcel_replies_new and swap it in."""
+    logger.info("Refreshing parcel replies...")
+    new_table = ParcelReply.__table__.to_metadata(ParcelReply.metadata, name="parcel_replies_new")
+    try:
+        with engine.connect() as read_connection, engine.begin() as connection:
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARCEL_REPLIES_LOCK_ID})
+            new_table.drop(connection, checkfirst=True)
+            new_table.create(connection)
+
+            templates = load_templates(connection)
+            count = render_in_batches(
+                read_connection, parcel_rows_query(), templates,
+                lambda batch: connection.execute(insert(new_table), batch),
+            )
+            connection.execute(text("ANALYZE address_lookup.parcel_replies_new"))
+            for statement in SWAP_PARCEL_REPLIES:
+                connection.execute(text(statement))
+        logger.info(f"Rendered replies for {count} parcels")
+    except Exception as e:
+        logger.error(f"Error refreshing parcel replies: {e}")
+    finally:
+        ParcelReply.metadata.remove(new_table)
+
+
+def rerender_parcel_replies(template_names):
+    """Re-render only the parcels whose replies use one of `template_names`."""
+    logger.info(f"Re-rendering parcel replies for templates {template_names}...")
+    try:
+        with engine.connect() as read_connection, engine.begin() as connection:
+            # Waits for a running refresh or re-render rather than skipping, which would leave
+            # parcel_replies on the old template until the next ingest. Runs on the template
+            # debounce timer's thread, so the realtime listener isn't held up.
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARCEL_REPLIES_LOCK_ID})
+
+            templates = load_templates(connection)
+            query = parcel_rows_query().join(ParcelReply, ParcelReply.ogc_fid == MiWayneDetroit.ogc_fid).filter(
+                ParcelReply.template_names.overlap(list(template_names))
+            )
+            # Bulk UPDATE by primary key, one executemany per batch
+            session = OrmSession(bind=connection)
+            count = render_in_batches(
+                read_connection, query, templates,
+                lambda batch: session.execute(update(ParcelReply), batch),
+            )
+        logger.info(f"Re-rendered replies for {count} parcels")
+    except Exception as e:
+        logger.error(f"Error re-rendering parcel replies: {e}")
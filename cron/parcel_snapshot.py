@@ -0,0 +1,35 @@
+from loguru import logger
+from sqlalchemy import case
+
+from configs.database import Session
+from libs.parcel_snapshot import PARCEL_SNAPSHOT_PATH, ParcelRecord, write_parcel_snapshot
+from models import MiWayneDetroit, ParcelRentalMatch
+
+
+def refresh_parcel_snapshot():
+    logger.info("Refreshing parcel snapshot...")
+    rental_status_case = case(
+        (ParcelRentalMatch.record_id.isnot(None), "IS"), else_="IS NOT"
+    ).label("rental_status")
+
+    try:
+        with Session() as session:
+            rows = (
+                session.query(
+                    MiWayneDetroit.ogc_fid,
+                    MiWayneDetroit.address,
+                    MiWayneDetroit.sunit,
+                    MiWayneDetroit.szip5,
+                    MiWayneDetroit.owner,
+                    rental_status_case,
+                    MiWayneDetroit.tax_due,
+                    MiWayneDetroit.tax_status,
+                )
+                .outerjoin(ParcelRentalMatch, ParcelRentalMatch.ogc_fid == MiWayneDetroit.ogc_fid)
+                .filter(MiWayneDetroit.address.isnot(None))
+                .yield_per(10000)
+            )
+            count = write_parcel_snapshot((ParcelRecord(*row) for row in rows))
+        logger.info(f"Parcel snapshot with {count} parcels written to {PARCEL_SNAPSHOT_PATH}")
+    except Exception as e:
+        logger.error(f"Error refreshing parcel snapshot: {e}")
@@ -4,6 +4,11 @@ from subprocess import PIPE, Popen
 from zipfile import ZipFile
 
 from dotenv import find_dotenv, load_dotenv
+from libs.db_metrics import db_call_site
+from libs.version_marker import ingest_version
+from .parcel_replies import refresh_parcel_replies
+from .parcel_snapshot import refresh_parcel_snapshot
+from .rental_match import refresh_rental_matches
 from .sftp_client import SFTPServerClient
 
 load_dotenv(find_dotenv())
@@ -14,6 +19,7 @@ password = os.getenv("SFTP_PASSWORD")
 port = int(os.getenv("SFTP_PORT", 22))
 
 
+@db_call_site("ingest")
 def fetch_data():
     logger.info("Starting Property data fetch...")
     temp_dir = "/tmp"
@@ -36,6 +42,12 @@ def fetch_data():
                 logger.info(f"Property script output: {stdout.decode()}")
             if stderr:
                 logger.error(f"Property script error: {stderr.decode()}")
+            if process.returncode == 0:
+                refresh_rental_matches()
+                refresh_parcel_replies()
+                refresh_parcel_snapshot()
+                # Cached lookups of the old data are dropped in every worker at once
+                ingest_version.bump()
         except Exception as e:
             logger.error("Error running Property script:", e)
     except Exception as e:
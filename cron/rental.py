@@ -1,7 +1,14 @@
 from loguru import logger
 from subprocess import PIPE, Popen
 
+from libs.db_metrics import db_call_site
+from libs.version_marker import ingest_version
+from .parcel_replies import refresh_parcel_replies
+from .parcel_snapshot import refresh_parcel_snapshot
+from .rental_match import refresh_rental_matches
 
+
+@db_call_site("ingest")
 def fetch_data():
     logger.info("Starting Rental data fetch...")
     try:
@@ -11,5 +18,11 @@ def fetch_data():
             logger.info(f"Rental script output: {stdout.decode()}")
         if stderr:
             logger.error(f"Rental script error: {stderr.decode()}")
+        if process.returncode == 0:
+            refresh_rental_matches()
+            refresh_parcel_replies()
+            refresh_parcel_snapshot()
+            # Cached lookups of the old data are dropped in every worker at once
+            ingest_version.bump()
     except Exception as e:
         logger.error("Error fetching rental data:", e)
@@ -0,0 +1,25 @@
+from loguru import logger
+from sqlalchemy import text
+
+from configs.database import engine
+from cron.rental_match_sql import BUILD_PARCEL_RENTAL_MATCHES, ENSURE_GIST_INDEX
+from models import ParcelRentalMatch
+
+
+def create_rental_matches_table():
+    """Create an empty parcel_rental_matches if no ingest has built one yet, since lookups join it."""
+    ParcelRentalMatch.__table__.create(engine, checkfirst=True)
+
+
+def refresh_rental_matches():
+    logger.info("Refreshing parcel rental matches...")
+    try:
+        # One transaction, so lookups see either the old or the new matches, never an empty table
+        with engine.begin() as connection:
+            for table in ("mi_wayne_detroit", "residential_rental_registrations"):
+                connection.execute(text(ENSURE_GIST_INDEX.format(table=table)))
+            for statement in BUILD_PARCEL_RENTAL_MATCHES:
+                connection.execute(text(statement))
+        logger.info("Parcel rental matches refreshed")
+    except Exception as e:
+        logger.error(f"Error refreshing parcel rental matches: {e}")
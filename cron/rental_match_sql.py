@@ -0,0 +1,48 @@
+# Kept apart from cron/rental_match.py, which needs the app database, so that
+# scripts/generate_benchmark_data.py can run them against another one
+
+# The ingest scripts replace mi_wayne_detroit/residential_rental_registrations wholesale,
+# so make sure the new tables have a GiST index on their geometry before the spatial join.
+ENSURE_GIST_INDEX = """
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE schemaname = 'address_lookup'
+          AND tablename = '{table}'
+          AND indexdef ILIKE '%USING gist (wkb_geometry)%'
+    ) THEN
+        CREATE INDEX ON address_lookup.{table} USING GIST (wkb_geometry);
+    END IF;
+END
+$$;
+"""
+
+# Same match rule the lookup used to evaluate per request, computed once for every parcel.
+# A parcel keeps its best scoring (then most recent) registration.
+BUILD_PARCEL_RENTAL_MATCHES = [
+    "DROP TABLE IF EXISTS address_lookup.parcel_rental_matches_new",
+    """
+    CREATE TABLE address_lookup.parcel_rental_matches_new AS
+    SELECT DISTINCT ON (mi_wayne_detroit.ogc_fid)
+        mi_wayne_detroit.ogc_fid,
+        residential_rental_registrations.record_id,
+        residential_rental_registrations.date_status,
+        strict_word_similarity(
+            upper(mi_wayne_detroit.saddstr), upper(residential_rental_registrations.street_name)
+        ) AS match_score
+    FROM address_lookup.mi_wayne_detroit
+    JOIN address_lookup.residential_rental_registrations
+        ON ST_DWithin(mi_wayne_detroit.wkb_geometry, residential_rental_registrations.wkb_geometry, 0.001)
+        AND mi_wayne_detroit.saddno = residential_rental_registrations.street_num
+        AND strict_word_similarity(
+            upper(mi_wayne_detroit.saddstr), upper(residential_rental_registrations.street_name)
+        ) > 0.8
+    ORDER BY mi_wayne_detroit.ogc_fid, match_score DESC, residential_rental_registrations.date_status DESC NULLS LAST
+    """,
+    "ALTER TABLE address_lookup.parcel_rental_matches_new ADD PRIMARY KEY (ogc_fid)",
+    "ANALYZE address_lookup.parcel_rental_matches_new",
+    "DROP TABLE IF EXISTS address_lookup.parcel_rental_matches",
+    "ALTER TABLE address_lookup.parcel_rental_matches_new RENAME TO parcel_rental_matches",
+    "ALTER INDEX address_lookup.parcel_rental_matches_new_pkey RENAME TO parcel_rental_matches_pkey",
+]
@@ -1,3 +1,6 @@
-def on_starting(server):
-    from main import start_mqtt
+def post_worker_init(worker):
+    # Every worker starts the listener thread, the one that wins the host lock listens
+    from main import start_mqtt, start_warmup
     start_mqtt()
+    # Each worker warms its own templates, pool and libraries, /ready reports when it's done
+    start_warmup()
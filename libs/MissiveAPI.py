@@ -1,18 +1,94 @@
+import asyncio
 import json
 import os
+import random
+import threading
 import time
 
 import aiohttp
 import requests
 from dotenv import load_dotenv
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 from constants.urls import CONVERSATION_MESSAGES_URL, CREATE_MESSAGE_URL, CREATE_POST_URL
+from libs.rate_limit import TokenBucket
 
 load_dotenv(override=True)
 
+MISSIVE_POOL_SIZE = int(os.environ.get("MISSIVE_POOL_SIZE", 10))
+MISSIVE_CONNECT_TIMEOUT = float(os.environ.get("MISSIVE_CONNECT_TIMEOUT", 5))
+MISSIVE_READ_TIMEOUT = float(os.environ.get("MISSIVE_READ_TIMEOUT", 30))
+MISSIVE_KEEPALIVE_TIMEOUT = float(os.environ.get("MISSIVE_KEEPALIVE_TIMEOUT", 60))
+# Account-wide limits, split evenly between the WEB_CONCURRENCY gunicorn workers since each
+# process has its own bucket
+MISSIVE_RATE_LIMIT = float(os.environ.get("MISSIVE_RATE_LIMIT", 5))
+MISSIVE_RATE_LIMIT_BURST = int(os.environ.get("MISSIVE_RATE_LIMIT_BURST", 5))
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+MISSIVE_RATE_LIMIT_MAX_WAIT = float(os.environ.get("MISSIVE_RATE_LIMIT_MAX_WAIT", 60))
+MISSIVE_MAX_RETRIES = int(os.environ.get("MISSIVE_MAX_RETRIES", 4))
+MISSIVE_BACKOFF_BASE = float(os.environ.get("MISSIVE_BACKOFF_BASE", 0.5))
+MISSIVE_BACKOFF_MAX = float(os.environ.get("MISSIVE_BACKOFF_MAX", 30))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Missive may already have acted on a POST that timed out or got a 5xx (a draft with
+# "send": True is an SMS), so those are only retried when throttled or never connected
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+UNSENT_RETRY_STATUSES = {429}
+
+# One bucket for every client in the process, since they all share the account's limit
+missive_rate_limiter = TokenBucket(
+    MISSIVE_RATE_LIMIT / WEB_CONCURRENCY, max(1, MISSIVE_RATE_LIMIT_BURST // WEB_CONCURRENCY)
+)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff; a Retry-After in seconds from Missive wins."""
+    if retry_after:
+        try:
+            return min(float(retry_after), MISSIVE_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(MISSIVE_BACKOFF_MAX, MISSIVE_BACKOFF_BASE * 2 ** attempt))
+
+
+def connect_failed(error):
+    """True if the request never reached Missive: a connect timeout, refused or unknown host."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+
+def connect_failed_async(error):
+    if isinstance(error, aiohttp.ClientConnectorError):
+        return True
+    # aiohttp raises the same error for connect and read timeouts, only the message differs
+    timed_out = isinstance(error, aiohttp.ServerTimeoutError)
+    return timed_out and str(error).startswith("Connection timeout")
+
+
+class MissiveRetryableError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"Missive responded {status}")
+        self.retry_after = retry_after
+
 
 class MissiveAPI:
-    def __init__(self):
+    """Missive client keeping pooled keep-alive connections for the sync and async paths.
+
+    The requests session is created per process (so it is never shared across a gunicorn
+    fork) and the aiohttp session per event loop, dropping those of loops that have since
+    closed; call `close` / `close_async` to release them. Requests wait for a token from
+    `rate_limiter`. GETs are retried with backoff on 429/5xx responses and connection
+    errors, POSTs only on 429 and failed connects; `stats()` counts what happened.
+    """
+
+    def __init__(self, pool_size=MISSIVE_POOL_SIZE, connect_timeout=MISSIVE_CONNECT_TIMEOUT,
+                 read_timeout=MISSIVE_READ_TIMEOUT, keepalive_timeout=MISSIVE_KEEPALIVE_TIMEOUT,
+                 rate_limiter=missive_rate_limiter, max_retries=MISSIVE_MAX_RETRIES):
         self.email = os.environ.get("EMAIL")
         self.phone_number = os.environ.get("PHONE_NUMBER")
         self.headers = {
@@ -20,6 +96,185 @@ class MissiveAPI:
             "Authorization": f"Bearer {os.environ.get('MISSIVE_SECRET')}",
         }
         self.organization = os.environ.get("MISSIVE_ORGANIZATION")
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.keepalive_timeout = keepalive_timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+        self._async_sessions = {}
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self._counts = {"sent": 0, "throttled": 0, "retried": 0, "dropped": 0}
+
+    @property
+    def session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    async def _get_async_session(self):
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1]),
+            )
+            with self._lock:
+                dead = [
+                    self._async_sessions.pop(dead_loop)
+                    for dead_loop in list(self._async_sessions) if dead_loop.is_closed()
+                ]
+                self._async_sessions[loop] = session
+            for dead_session in dead:
+                await self._discard_async_session(dead_session)
+        return session
+
+    async def _discard_async_session(self, session):
+        # A session left behind by a finished event loop (e.g. each asyncio.run).
+        # session.close() would schedule work on that closed loop, so the connector is
+        # detached and closed here instead; it only drops the dead loop's connections.
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            await connector.close()
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def _reserve(self, url):
+        wait = self.rate_limiter.reserve(MISSIVE_RATE_LIMIT_MAX_WAIT)
+        if wait is None:
+            self._count("dropped")
+            logger.error(f"Dropped Missive request to {url}: rate limit wait over {MISSIVE_RATE_LIMIT_MAX_WAIT}s")
+        elif wait:
+            self._count("throttled")
+        return wait
+
+    def _request(self, method, url, **kwargs):
+        """Rate-limited request with retries; returns the response, or None once given up."""
+        idempotent = method in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else UNSENT_RETRY_STATUSES
+        for attempt in range(self.max_retries + 1):
+            wait = self._reserve(url)
+            if wait is None:
+                return None
+            time.sleep(wait)
+
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code in retry_statuses:
+                    retry_after = response.headers.get("Retry-After")
+                    response.close()
+                    raise MissiveRetryableError(response.status_code, retry_after)
+                response.raise_for_status()  # Raise exception if not a 2xx response
+                self._count("sent")
+                return response
+            except (MissiveRetryableError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not (idempotent or isinstance(e, MissiveRetryableError) or connect_failed(e)):
+                    self._count("dropped")
+                    logger.error(
+                        f"Missive {method} to {url} failed and may have gone through, not retrying: {e}"
+                    )
+                    return None
+                if attempt == self.max_retries:
+                    self._count("dropped")
+                    logger.error(f"Giving up on Missive request to {url} after {attempt + 1} attempts: {e}")
+                    return None
+                self._count("retried")
+                time.sleep(backoff_delay(attempt, getattr(e, "retry_after", None)))
+            except requests.exceptions.RequestException as e:
+                self._count("dropped")
+                logger.error(f"Missive request to {url} failed: {e}")
+                return None
+
+    async def _request_async(self, method, url, **kwargs):
+        idempotent = method in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else UNSENT_RETRY_STATUSES
+        for attempt in range(self.max_retries + 1):
+            wait = self._reserve(url)
+            if wait is None:
+                return None
+            await asyncio.sleep(wait)
+
+            try:
+                session = await self._get_async_session()
+                async with session.request(method, url, **kwargs) as response:
+                    if response.status in retry_statuses:
+                        raise MissiveRetryableError(response.status, response.headers.get("Retry-After"))
+                    response.raise_for_status()
+                    text = await response.text()
+                    self._count("sent")
+                    return text
+            except (MissiveRetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not (idempotent or isinstance(e, MissiveRetryableError) or connect_failed_async(e)):
+                    self._count("dropped")
+                    logger.error(
+                        f"Missive {method} to {url} failed and may have gone through, not retrying: {e}"
+                    )
+                    return None
+                if attempt == self.max_retries:
+                    self._count("dropped")
+                    logger.error(f"Giving up on Missive request to {url} after {attempt + 1} attempts: {e}")
+                    return None
+                self._count("retried")
+                await asyncio.sleep(backoff_delay(attempt, getattr(e, "retry_after", None)))
+            except aiohttp.ClientError as e:
+                self._count("dropped")
+                logger.error(f"Missive request to {url} failed: {e}")
+                return None
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    async def close_async(self):
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def _build_draft(
+        self,
+        message,
+        to_phone,
+        conversation_id=None,
+        add_label_list=None,
+        remove_label_list=None,
+    ):
+        body = {
+            "drafts": {
+                "body": str(message),
+                "from_field": {"phone_number": self.phone_number},
+                "organization": self.organization,
+                "to_fields": [{"phone_number": to_phone}],
+                "add_shared_labels": add_label_list or [],
+                "remove_shared_labels": remove_label_list or [],
+                "send": True,  # Send right away
+            },
+        }
+
+        if conversation_id is not None:
+            body["drafts"]["conversation"] = conversation_id
+
+        return json.dumps(body)
 
     async def send_sms_async(
         self,
@@ -29,48 +284,40 @@ class MissiveAPI:
         add_label_list=None,
         remove_label_list=None,
     ):
-        if add_label_list is None:
-            add_label_list = []
-        if remove_label_list is None:
-            remove_label_list = []
-        try:
-            body = {
-                "drafts": {
-                    "body": str(message),
-                    "from_field": {"phone_number": self.phone_number},
-                    "organization": self.organization,
-                    "to_fields": [{"phone_number": to_phone}],
-                    "add_shared_labels": add_label_list,
-                    "remove_shared_labels": remove_label_list,
-                    "send": True,  # Send right away
-                },
-            }
-
-            if conversation_id is not None:
-                body["drafts"]["conversation"] = conversation_id
-
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                        CREATE_MESSAGE_URL,
-                        headers=self.headers,
-                        data=json.dumps(body),
-                ) as response:
-                    return await response.text()
-
-        except requests.exceptions.RequestException:
-            return None
+        body = self._build_draft(message, to_phone, conversation_id, add_label_list, remove_label_list)
+        return await self._request_async("POST", CREATE_MESSAGE_URL, data=body)
+
+    async def send_sms_batch_async(self, messages):
+        """Send a list of `send_sms_sync` keyword dicts over the shared connection pool.
+
+        Messages of the same conversation go out one after another in list order, while
+        different conversations are sent concurrently. Returns the responses in list order.
+        """
+        conversations = {}
+        for index, message in enumerate(messages):
+            key = message.get("conversation_id") or message["to_phone"]
+            conversations.setdefault(key, []).append(index)
+
+        results = [None] * len(messages)
+
+        async def send_conversation(indexes):
+            for index in indexes:
+                results[index] = await self.send_sms_async(**messages[index])
+
+        await asyncio.gather(*(send_conversation(indexes) for indexes in conversations.values()))
+        return results
 
     def get_conversation_messages(self, conversation_id):
+        start_timestamp = int(time.time()) - 7 * 24 * 60 * 60
+        url = CONVERSATION_MESSAGES_URL.format(
+            conversation_id=conversation_id, until=start_timestamp
+        )
+        response = self._request("GET", url)
+        if response is None:
+            return None
         try:
-            start_timestamp = int(time.time()) - 7 * 24 * 60 * 60
-            url = CONVERSATION_MESSAGES_URL.format(
-                conversation_id=conversation_id, until=start_timestamp
-            )
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()  # Raise exception if not a 2xx response
             return response.json()
-
-        except requests.exceptions.RequestException:
+        except ValueError:
             return None
 
     def extract_preview_content(self, conversation_id):
@@ -92,34 +339,12 @@ class MissiveAPI:
         add_label_list=None,
         remove_label_list=None,
     ):
-        if add_label_list is None:
-            add_label_list = []
-        if remove_label_list is None:
-            remove_label_list = []
-        try:
-            body = {
-                "drafts": {
-                    "body": str(message),
-                    "from_field": {"phone_number": self.phone_number},
-                    "organization": self.organization,
-                    "to_fields": [{"phone_number": to_phone}],
-                    "add_shared_labels": add_label_list,
-                    "remove_shared_labels": remove_label_list,
-                    "send": True,  # Send right away
-                },
-            }
-
-            if conversation_id is not None:
-                body["drafts"]["conversation"] = conversation_id
-
-            response = requests.post(
-                CREATE_MESSAGE_URL, headers=self.headers, data=json.dumps(body)
-            )
-            response.raise_for_status()  # Raise exception if not a 2xx response
-            return response
+        body = self._build_draft(message, to_phone, conversation_id, add_label_list, remove_label_list)
+        return self._request("POST", CREATE_MESSAGE_URL, data=body)
 
-        except requests.exceptions.RequestException:
-            return None
+    def send_sms_batch(self, messages):
+        """Send a list of `send_sms_sync` keyword dicts in order over one kept-alive connection."""
+        return [self.send_sms_sync(**message) for message in messages]
 
     def send_post_sync(self, markdowns, conversation_id):
         attachments = [{'markdown': markdown, 'color': 'good'} for markdown in markdowns]
@@ -134,11 +359,4 @@ class MissiveAPI:
             },
         }
 
-        try:
-            response = requests.post(
-                CREATE_POST_URL, headers=self.headers, data=json.dumps(body)
-            )
-            response.raise_for_status()  # Raise exception if not a 2xx response
-            return response
-        except requests.exceptions.RequestException:
-            return None
+        return self._request("POST", CREATE_POST_URL, data=json.dumps(body))
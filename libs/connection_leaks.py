@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+import time
+import traceback
+
+from loguru import logger
+from sqlalchemy import event
+
+# Frames kept from the stack that checked a connection out
+STACK_DEPTH = 30
+
+
+class ConnectionLeakDetector:
+    """Reports pooled connections held longer than `threshold` seconds.
+
+    The pool's checkout/checkin events record when, by which thread and from where each
+    connection was taken. A monitor thread, started per process on the first checkout,
+    logs every connection still out past the threshold once, with the acquiring stack.
+    """
+
+    def __init__(self, engine, threshold, interval=None):
+        self.threshold = threshold
+        self.interval = interval or max(threshold / 2, 1)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._checked_out = {}
+        self._reported = 0
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._checked_out = {}
+            threading.Thread(target=self._monitor, name="db-leak-detector", daemon=True).start()
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        if self._pid != os.getpid():
+            self._start()
+        # Source lines are only looked up when a leak is reported
+        stack = traceback.StackSummary.extract(
+            traceback.walk_stack(sys._getframe(1)), limit=STACK_DEPTH, lookup_lines=False
+        )
+        with self._lock:
+            self._checked_out[id(connection_record)] = {
+                "checked_out_at": time.monotonic(),
+                "thread": threading.current_thread().name,
+                "stack": stack,
+                "reported": False,
+            }
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self._checked_out.pop(id(connection_record), None)
+
+    def leaks(self):
+        """Connections checked out for longer than the threshold, oldest first."""
+        now = time.monotonic()
+        with self._lock:
+            held = [
+                (now - checkout["checked_out_at"], checkout)
+                for checkout in self._checked_out.values()
+                if now - checkout["checked_out_at"] > self.threshold
+            ]
+        return [
+            {
+                "age_seconds": age,
+                "thread": checkout["thread"],
+                "stack": "".join(reversed(checkout["stack"].format())),
+            }
+            for age, checkout in sorted(held, key=lambda leak: leak[0], reverse=True)
+        ]
+
+    def _monitor(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                new_leaks = [
+                    checkout for checkout in self._checked_out.values()
+                    if not checkout["reported"] and now - checkout["checked_out_at"] > self.threshold
+                ]
+                for checkout in new_leaks:
+                    checkout["reported"] = True
+                self._reported += len(new_leaks)
+
+            for checkout in new_leaks:
+                logger.warning(
+                    f"DB connection held for {now - checkout['checked_out_at']:.0f}s by thread "
+                    f"{checkout['thread']}, checked out at:\n{''.join(reversed(checkout['stack'].format()))}"
+                )
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "checked_out": len(self._checked_out),
+                "leaked": sum(
+                    1 for checkout in self._checked_out.values()
+                    if now - checkout["checked_out_at"] > self.threshold
+                ),
+                "reported": self._reported,
+            }
@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from libs.parcel_snapshot import ParcelRecord
+
+load_dotenv(override=True)
+
+CONVERSATION_STATE_PATH = os.environ.get("CONVERSATION_STATE_PATH", "cache/conversation_state.sqlite3")
+# Follow-ups older than this fall back to reading the Missive history, like before
+CONVERSATION_STATE_TTL = int(os.environ.get("CONVERSATION_STATE_TTL", 7 * 24 * 60 * 60))
+# How often `set` also deletes the expired rows, so the file doesn't keep growing
+CONVERSATION_STATE_PURGE_INTERVAL = int(os.environ.get("CONVERSATION_STATE_PURGE_INTERVAL", 60 * 60))
+
+
+class ConversationStateStore:
+    """Parcel resolved by /search for each conversation, kept in a local SQLite file.
+
+    The file is shared by every worker process, so /yes and /more find the state
+    whichever worker handled /search. Entries expire after `ttl` seconds and are
+    deleted by a `set` at most every `purge_interval` seconds.
+    """
+
+    def __init__(self, path=CONVERSATION_STATE_PATH, ttl=CONVERSATION_STATE_TTL,
+                 purge_interval=CONVERSATION_STATE_PURGE_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._purged_at = time.monotonic()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_state ("
+                "conversation_id TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def set(self, conversation_id, state):
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO conversation_state VALUES (?, ?, ?)",
+                (conversation_id, json.dumps(state), time.time() + self.ttl),
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Could not store state for conversation {conversation_id}: {e}")
+
+        if time.monotonic() - self._purged_at >= self.purge_interval:
+            # Racing threads may both purge, which is harmless
+            self._purged_at = time.monotonic()
+            try:
+                self.purge_expired()
+            except sqlite3.Error as e:
+                logger.error(f"Could not purge expired conversation state: {e}")
+
+    def get(self, conversation_id):
+        try:
+            row = self.connection.execute(
+                "SELECT state FROM conversation_state WHERE conversation_id = ? AND expires_at > ?",
+                (conversation_id, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Could not read state for conversation {conversation_id}: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def delete(self, conversation_id):
+        try:
+            self.connection.execute("DELETE FROM conversation_state WHERE conversation_id = ?", (conversation_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Could not clear state for conversation {conversation_id}: {e}")
+
+    def purge_expired(self):
+        return self.connection.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def set_parcel(self, conversation_id, row):
+        """Remember the row a lookup resolved to (a ParcelRecord or a build_lookup_query row)."""
+        record = {field: getattr(row, field, None) for field in ParcelRecord._fields}
+        if record["tax_due"] is not None:
+            record["tax_due"] = float(record["tax_due"])
+        self.set(conversation_id, {"parcel": record})
+
+    def get_parcel(self, conversation_id):
+        state = self.get(conversation_id)
+        if not state:
+            return None
+        return ParcelRecord(**state["parcel"])
+
+
+conversation_state_store = ConversationStateStore()
@@ -0,0 +1,105 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from libs.metrics import registry
+
+# The code the current statements run for, set with `db_call_site`
+_call_site = contextvars.ContextVar("db_call_site", default="other")
+
+checkout_seconds = registry.histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the pool: waiting, connecting and pre-ping",
+)
+connect_seconds = registry.histogram("db_pool_connect_seconds", "Time to open a new database connection")
+pre_ping_seconds = registry.histogram("db_pool_pre_ping_seconds", "Time spent on pool_pre_ping checks")
+statement_seconds = registry.histogram(
+    "db_statement_seconds", "Statement execution time by call site", labelnames=("call_site",)
+)
+checkout_timeouts = registry.counter("db_pool_checkout_timeouts_total", "Checkouts that timed out waiting")
+invalidations = registry.counter("db_pool_invalidations_total", "Connections invalidated (e.g. failed pre-ping)")
+
+
+@contextmanager
+def db_call_site(name):
+    """Tag the statements run inside (as a `with` block or a decorator) with `name`."""
+    token = _call_site.set(name)
+    try:
+        yield
+    finally:
+        _call_site.reset(token)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool timing every checkout, waits for a free connection included."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            checkout_timeouts.inc()
+            raise
+        finally:
+            checkout_seconds.observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine, registry=registry):
+    """Record connect, pre-ping and statement timings for `engine`, and its pool gauges in `registry`."""
+    connecting = threading.local()
+
+    @event.listens_for(engine, "do_connect")
+    def before_connect(dialect, connection_record, cargs, cparams):
+        connecting.started = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def after_connect(dbapi_connection, connection_record):
+        started = getattr(connecting, "started", None)
+        if started is not None:
+            connect_seconds.observe(time.perf_counter() - started)
+            connecting.started = None
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        invalidations.inc()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["statement_started"].pop()
+        statement_seconds.observe(time.perf_counter() - started, call_site=_call_site.get())
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("statement_started"):
+            connection.info["statement_started"].pop()
+
+    # There is no event around the pre-ping, the dialect's ping is wrapped instead
+    do_ping = engine.dialect.do_ping
+
+    def timed_ping(dbapi_connection):
+        started = time.perf_counter()
+        try:
+            return do_ping(dbapi_connection)
+        finally:
+            pre_ping_seconds.observe(time.perf_counter() - started)
+
+    engine.dialect.do_ping = timed_ping
+
+    registry.gauge("db_pool_size", "Configured pool size", function=lambda: engine.pool.size())
+    registry.gauge("db_pool_checked_out", "Connections in use", function=lambda: engine.pool.checkedout())
+    registry.gauge("db_pool_checked_in", "Idle connections in the pool", function=lambda: engine.pool.checkedin())
+    registry.gauge(
+        "db_pool_overflow", "Connections open beyond the pool size (negative: not yet opened)",
+        function=lambda: engine.pool.overflow(),
+    )
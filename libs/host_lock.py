@@ -0,0 +1,48 @@
+import fcntl
+import os
+
+
+class HostLock:
+    """Non-blocking exclusive flock, so only one process on the host holds it at a time.
+
+    The lock is released by the kernel when the holder exits, so another process
+    that keeps calling `try_acquire` takes over from a dead one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._pid = None
+
+    def try_acquire(self):
+        if self.held():
+            return True
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file = open(self.path, "a+")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+
+        file.seek(0)
+        file.truncate()
+        file.write(str(os.getpid()))
+        file.flush()
+        self._file = file
+        self._pid = os.getpid()
+        return True
+
+    def held(self):
+        # A forked child shares the descriptor but isn't the holder
+        return self._file is not None and self._pid == os.getpid()
+
+    def release(self):
+        if self.held():
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._file = None
+        self._pid = None
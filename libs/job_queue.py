@@ -0,0 +1,97 @@
+import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
+
+from loguru import logger
+
+
+class JobQueue:
+    """Bounded in-process job queue served by a fixed pool of worker threads.
+
+    Workers are started on the first enqueue in each process, so a queue created before
+    gunicorn forks still gets its own threads in every worker. `context` is an optional
+    context manager factory each job runs in (e.g. `app.app_context`).
+    """
+
+    def __init__(self, workers=4, max_size=100, context=None):
+        self.workers = workers
+        self.max_size = max_size
+        self.context = context or nullcontext
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._in_flight = 0
+        self._counts = {"enqueued": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            jobs = queue.Queue(maxsize=self.max_size)
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, args=(jobs,), name=f"job-worker-{index}", daemon=True)
+                thread.start()
+            self._queue = jobs
+            # Last, since enqueue checks it without the lock: a caller that sees this
+            # process's pid must also see the queue its workers serve
+            self._pid = os.getpid()
+
+    def enqueue(self, name, func, *args, **kwargs):
+        """Queue `func(*args, **kwargs)`; returns False if the queue is full."""
+        if self._pid != os.getpid():
+            self._start()
+
+        try:
+            self._queue.put_nowait((name, func, args, kwargs, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._counts["rejected"] += 1
+            logger.error(f"Job queue full, rejected {name}")
+            return False
+
+        with self._lock:
+            self._counts["enqueued"] += 1
+        return True
+
+    def _work(self, jobs):
+        while True:
+            name, func, args, kwargs, enqueued_at = jobs.get()
+            with self._lock:
+                self._in_flight += 1
+
+            status = "completed"
+            try:
+                with self.context():
+                    func(*args, **kwargs)
+            except Exception as e:
+                status = "failed"
+                logger.exception(f"Job {name} failed: {e}")
+
+            # Latency covers the time spent waiting in the queue as well as running
+            latency = time.monotonic() - enqueued_at
+            with self._lock:
+                self._in_flight -= 1
+                self._counts[status] += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+            jobs.task_done()
+
+    def join(self):
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            finished = self._counts["completed"] + self._counts["failed"]
+            return {
+                "depth": self._queue.qsize(),
+                "max_size": self.max_size,
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                **self._counts,
+                "latency_avg_seconds": self._latency_total / finished if finished else 0.0,
+                "latency_max_seconds": self._latency_max,
+            }
@@ -0,0 +1,192 @@
+import bisect
+import threading
+from collections import deque
+
+# Seconds, from a fast index lookup to a slow OpenAI call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _labels(self, key, **extra):
+        return list(zip(self.labelnames, key)) + list(extra.items())
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{name}{format_labels(labels)} {value}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """A value that is set, or read from `function` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is not None:
+            return [(self.name, [], self.function())]
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", self._labels(key, le=bound), cumulative))
+            samples.append((f"{self.name}_count", self._labels(key), cumulative))
+            samples.append((f"{self.name}_sum", self._labels(key), counts[-1]))
+        return samples
+
+
+class Summary(Metric):
+    """Quantiles over the last `window` observations, with the total count and sum."""
+
+    type = "summary"
+
+    def __init__(self, name, documentation, labelnames=(), quantiles=(0.5, 0.95, 0.99), window=1024):
+        super().__init__(name, documentation, labelnames)
+        self.quantiles = tuple(quantiles)
+        self.window = window
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [deque(maxlen=self.window), 0, 0.0]
+            entry[0].append(value)
+            entry[1] += 1
+            entry[2] += value
+
+    def snapshot(self):
+        """{label values: ({quantile: value}, count, sum)}"""
+        with self._lock:
+            values = {key: (sorted(recent), count, total) for key, (recent, count, total) in self._values.items()}
+        return {
+            key: (
+                {quantile: recent[min(int(quantile * len(recent)), len(recent) - 1)] for quantile in self.quantiles},
+                count,
+                total,
+            )
+            for key, (recent, count, total) in values.items()
+        }
+
+    def samples(self):
+        samples = []
+        for key, (quantiles, count, total) in self.snapshot().items():
+            for quantile, value in quantiles.items():
+                samples.append((self.name, self._labels(key, quantile=quantile), value))
+            samples.append((f"{self.name}_count", self._labels(key), count))
+            samples.append((f"{self.name}_sum", self._labels(key), total))
+        return samples
+
+
+class MetricsRegistry:
+    """The process' metrics, rendered in the Prometheus text format.
+
+    Each gunicorn worker has its own registry, so a scrape sees the worker that served it.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def summary(self, name, documentation, labelnames=(), quantiles=(0.5, 0.95, 0.99), window=1024):
+        return self.register(Summary(name, documentation, labelnames, quantiles, window))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
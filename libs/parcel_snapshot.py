@@ -0,0 +1,180 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv(override=True)
+
+PARCEL_SNAPSHOT_PATH = os.environ.get("PARCEL_SNAPSHOT_PATH", "cache/parcel_snapshot.bin")
+PARCEL_SNAPSHOT_CHECK_INTERVAL = float(os.environ.get("PARCEL_SNAPSHOT_CHECK_INTERVAL", 5))
+
+MAGIC = b"PARCELS1"
+HEADER_LENGTH = struct.Struct("<I")
+
+# Only the columns the SMS flow reads. Rows have the same attribute names as the
+# rows returned by build_lookup_query, so either can be used to answer a lookup.
+ParcelRecord = namedtuple(
+    "ParcelRecord",
+    ["ogc_fid", "address", "sunit", "szip5", "owner", "rental_status", "tax_due", "tax_status"],
+)
+
+# "key" is the upper-cased address the rows are sorted by, used for bisect prefix search
+COLUMNS = ["key"] + list(ParcelRecord._fields)
+
+
+def _encode(value):
+    return b"" if value is None else str(value).encode()
+
+
+def write_parcel_snapshot(records, path=PARCEL_SNAPSHOT_PATH):
+    rows = sorted(
+        ([(record.address or "").upper()] + list(record) for record in records),
+        key=lambda row: (row[0].encode(), _encode(row[COLUMNS.index("sunit")])),
+    )
+
+    columns = {}
+    blobs = []
+    position = 0
+    for index, name in enumerate(COLUMNS):
+        offsets = array("I", [0])
+        data = bytearray()
+        for row in rows:
+            data += _encode(row[index])
+            offsets.append(len(data))
+        # Keep every offsets array 4-byte aligned so it can be cast in place
+        data += b"\0" * (-len(data) % 4)
+
+        columns[name] = {"offsets": position, "data": position + len(offsets) * offsets.itemsize}
+        position = columns[name]["data"] + len(data)
+        blobs += [offsets.tobytes(), bytes(data)]
+
+    header = json.dumps(
+        {"rows": len(rows), "byteorder": sys.byteorder, "created_at": time.time(), "columns": columns}
+    ).encode()
+    header += b" " * (-(len(MAGIC) + HEADER_LENGTH.size + len(header)) % 4)
+
+    # Written next to the target and renamed, so readers never map a half-written file
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        for blob in blobs:
+            file.write(blob)
+    os.replace(temp_path, path)
+
+    return len(rows)
+
+
+class _Column:
+    def __init__(self, buffer, offsets, data, rows):
+        self.rows = rows
+        self.offsets = buffer[offsets:data].cast("I")
+        self.data = buffer[data:]
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+
+class ParcelSnapshot:
+    """Read-only view of a parcel snapshot file.
+
+    The file is memory-mapped, so every worker process maps the same page cache pages
+    instead of loading its own copy of the parcels.
+    """
+
+    def __init__(self, path=PARCEL_SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(file.fileno())
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a parcel snapshot")
+        (header_length,) = HEADER_LENGTH.unpack_from(self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + HEADER_LENGTH.size
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {header['byteorder']}-endian machine")
+
+        self.rows = header["rows"]
+        self.created_at = header["created_at"]
+        buffer = memoryview(self._mmap)[header_start + header_length:]
+        self._columns = {
+            name: _Column(buffer, spec["offsets"], spec["data"], self.rows)
+            for name, spec in header["columns"].items()
+        }
+
+    def __len__(self):
+        return self.rows
+
+    def record(self, index):
+        values = {name: self._columns[name][index].decode() for name in ParcelRecord._fields}
+        values["ogc_fid"] = int(values["ogc_fid"])
+        values["tax_due"] = float(values["tax_due"]) if values["tax_due"] else None
+        return ParcelRecord(**values)
+
+    def search(self, address, sunit=""):
+        """Same matches as `address ILIKE 'address%' [AND sunit ILIKE '%sunit%']`."""
+        keys = self._columns["key"]
+        prefix = address.strip().upper().encode()
+        sunit = sunit.upper().encode()
+
+        results = []
+        index = bisect.bisect_left(keys, prefix)
+        while index < self.rows and keys[index].startswith(prefix):
+            if not sunit or sunit in self._columns["sunit"][index].upper():
+                results.append(self.record(index))
+            index += 1
+        return results
+
+
+_snapshot = None
+_snapshot_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_parcel_snapshot():
+    """Return the current snapshot, or None if none has been built yet.
+
+    The file is re-checked every PARCEL_SNAPSHOT_CHECK_INTERVAL seconds, so a snapshot
+    rebuilt by the ingest in one worker is picked up by all the others.
+    """
+    global _snapshot, _snapshot_checked_at
+
+    if time.monotonic() - _snapshot_checked_at < PARCEL_SNAPSHOT_CHECK_INTERVAL:
+        return _snapshot
+
+    with _snapshot_lock:
+        if time.monotonic() - _snapshot_checked_at < PARCEL_SNAPSHOT_CHECK_INTERVAL:
+            return _snapshot
+        _snapshot_checked_at = time.monotonic()
+
+        try:
+            stat = os.stat(PARCEL_SNAPSHOT_PATH)
+        except FileNotFoundError:
+            _snapshot = None
+            return None
+
+        if _snapshot is None or _snapshot.file_id != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                _snapshot = ParcelSnapshot(PARCEL_SNAPSHOT_PATH)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not open parcel snapshot {PARCEL_SNAPSHOT_PATH}: {e}")
+                _snapshot = None
+
+    return _snapshot
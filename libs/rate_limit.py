@@ -0,0 +1,41 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    `reserve` takes a token straight away and returns how long the caller has to wait
+    before using it, so sync callers can `time.sleep` and async ones `asyncio.sleep` on
+    the same bucket.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, max_wait=None):
+        """Take a token and return the seconds to wait, or None if that exceeds `max_wait`."""
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def acquire(self, max_wait=None):
+        wait = self.reserve(max_wait)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
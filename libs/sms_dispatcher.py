@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from libs.stages import stage
+
+load_dotenv(override=True)
+
+SMS_MIN_GAP_SECONDS = float(os.environ.get("SMS_MIN_GAP_SECONDS", 2))
+SMS_SENDER_WORKERS = int(os.environ.get("SMS_SENDER_WORKERS", 2))
+MERGE_OUTBOUND_SMS = os.environ.get("MERGE_OUTBOUND_SMS", "false").lower() == "true"
+
+# Longest body adjacent messages are merged into (Twilio splits anything longer anyway)
+MAX_MERGED_LENGTH = 1600
+
+
+class OutboundMessage(NamedTuple):
+    body: str
+    add_label_list: Optional[list] = None
+    mergeable: bool = False
+
+
+class SmsDispatcher:
+    """Sends SMS in order per conversation, at least `min_gap` seconds apart.
+
+    `dispatch` only queues the messages and returns. One scheduler thread hands due
+    conversations to a small pool of sender threads; a conversation's next message is
+    only scheduled once the previous one has been sent, so order is kept while many
+    conversations are served concurrently. Adjacent messages that are both mergeable
+    and have the same labels are sent as one SMS.
+    """
+
+    def __init__(self, send, min_gap=SMS_MIN_GAP_SECONDS, workers=SMS_SENDER_WORKERS,
+                 max_merged_length=MAX_MERGED_LENGTH):
+        self.send = send
+        self.min_gap = min_gap
+        self.workers = workers
+        self.max_merged_length = max_merged_length
+        self._condition = threading.Condition()
+        self._pid = None
+        self._pending = {}
+        self._last_sent = {}
+        self._due = []
+        self._sequence = itertools.count()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def _start(self):
+        with self._condition:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sms-sender")
+            threading.Thread(target=self._schedule, name="sms-scheduler", daemon=True).start()
+
+    def dispatch(self, conversation_id, to_phone, messages):
+        if self._pid != os.getpid():
+            self._start()
+
+        key = conversation_id or to_phone
+        messages = [message for message in messages if message.body]
+        if not messages:
+            return
+
+        with self._condition:
+            if key in self._pending:
+                # Already scheduled: the new messages go out after the queued ones
+                self._pending[key][1].extend(messages)
+                return
+
+            self._pending[key] = (to_phone, deque(messages))
+            due_at = max(time.monotonic(), self._last_sent.get(key, 0) + self.min_gap)
+            heapq.heappush(self._due, (due_at, next(self._sequence), key))
+            self._idle.clear()
+            self._condition.notify()
+
+    def _schedule(self):
+        while True:
+            with self._condition:
+                while not self._due or self._due[0][0] > time.monotonic():
+                    timeout = self._due[0][0] - time.monotonic() if self._due else None
+                    self._condition.wait(timeout)
+                _, _, key = heapq.heappop(self._due)
+            self._executor.submit(self._send_next, key)
+
+    def _next_message(self, messages):
+        message = messages.popleft()
+        while (
+            messages
+            and message.mergeable
+            and messages[0].mergeable
+            and messages[0].add_label_list == message.add_label_list
+            and len(message.body) + len(messages[0].body) + 2 <= self.max_merged_length
+        ):
+            message = message._replace(body=f"{message.body}\n\n{messages.popleft().body}")
+        return message
+
+    def _send_next(self, key):
+        with self._condition:
+            to_phone, messages = self._pending[key]
+            message = self._next_message(messages)
+
+        try:
+            with stage("missive_send"):
+                self.send(
+                    message.body,
+                    to_phone=to_phone,
+                    conversation_id=key if key != to_phone else None,
+                    add_label_list=message.add_label_list,
+                )
+        except Exception as e:
+            logger.exception(f"Failed to send SMS to conversation {key}: {e}")
+
+        with self._condition:
+            now = time.monotonic()
+            self._last_sent[key] = now
+            # Forget conversations that have been quiet for longer than the gap
+            for quiet_key in [k for k, sent_at in self._last_sent.items() if now - sent_at > self.min_gap]:
+                del self._last_sent[quiet_key]
+
+            if messages:
+                heapq.heappush(self._due, (now + self.min_gap, next(self._sequence), key))
+                self._condition.notify()
+            else:
+                del self._pending[key]
+                if not self._pending:
+                    self._idle.set()
+
+    def wait_idle(self, timeout=None):
+        """Block until every dispatched message has been sent (for scripts and tests)."""
+        return self._idle.wait(timeout)
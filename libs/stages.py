@@ -0,0 +1,110 @@
+import functools
+import os
+import time
+
+import sentry_sdk
+from dotenv import load_dotenv
+
+from libs.metrics import registry
+
+load_dotenv(override=True)
+
+# Off: `stage` hands out one shared no-op context manager and `traced_job` returns the job as is
+STAGE_TIMING_ENABLED = os.environ.get("STAGE_TIMING_ENABLED", "true").lower() == "true"
+
+stage_seconds = registry.histogram(
+    "lookup_stage_seconds", "Time spent in each stage of the SMS lookup pipeline", labelnames=("stage",)
+)
+stage_quantiles = registry.summary(
+    "lookup_stage_quantile_seconds", "p50/p95/p99 of recent runs of each lookup stage", labelnames=("stage",)
+)
+
+
+class _Stage:
+    __slots__ = ("name", "span", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        # A child span of the job's transaction, a no-op span outside of one
+        self.span = sentry_sdk.start_span(op="lookup.stage", description=self.name)
+        self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.started
+        stage_seconds.observe(elapsed, stage=self.name)
+        stage_quantiles.observe(elapsed, stage=self.name)
+        self.span.__exit__(exc_type, exc_value, traceback)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """Time the `with` block as lookup stage `name`."""
+    if not STAGE_TIMING_ENABLED:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def timed_stage(name):
+    """Decorator timing every call as lookup stage `name`."""
+    def decorator(func):
+        if not STAGE_TIMING_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_job(name, func):
+    """`func` run as a Sentry transaction that continues the current request's trace.
+
+    Jobs run on the queue's worker threads after the request has returned, so their
+    stage spans would otherwise have no transaction to attach to.
+    """
+    if not STAGE_TIMING_ENABLED:
+        return func
+
+    headers = {
+        header: value
+        for header, value in (("sentry-trace", sentry_sdk.get_traceparent()), ("baggage", sentry_sdk.get_baggage()))
+        if value
+    }
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        with sentry_sdk.isolation_scope():
+            transaction = sentry_sdk.continue_trace(headers, op="queue.task", name=name)
+            with sentry_sdk.start_transaction(transaction):
+                return func(*args, **kwargs)
+    return run
+
+
+def stage_percentiles():
+    """{stage: {"p50": s, "p95": s, "p99": s, "count": n}} over each stage's recent runs."""
+    return {
+        key[0]: {
+            **{f"p{round(quantile * 100)}": value for quantile, value in quantiles.items()},
+            "count": count,
+        }
+        for key, (quantiles, count, total) in stage_quantiles.snapshot().items()
+    }
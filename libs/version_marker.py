@@ -0,0 +1,58 @@
+import fcntl
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+INGEST_VERSION_PATH = os.environ.get("INGEST_VERSION_PATH", "cache/ingest_version")
+TEMPLATE_VERSION_PATH = os.environ.get("TEMPLATE_VERSION_PATH", "cache/template_version")
+
+
+class VersionMarker:
+    """Integer version kept in a small file, so every worker process sees the same value.
+
+    `bump` increments it under an exclusive lock and swaps the file in with a rename,
+    `read` only re-reads the file when a stat shows it has been replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file_id = None
+        self._version = 0
+
+    def read(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+
+        file_id = (stat.st_ino, stat.st_mtime_ns)
+        if file_id != self._file_id:
+            with open(self.path) as file:
+                content = file.read().strip()
+            self._version = int(content) if content else 0
+            self._file_id = file_id
+        return self._version
+
+    def bump(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._file_id = None
+            version = self.read() + 1
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(str(version))
+            os.replace(temp_path, self.path)
+        return version
+
+
+# Bumped once new property/rental data and everything derived from it is in place
+ingest_version = VersionMarker(INGEST_VERSION_PATH)
+
+# Bumped whenever lookup_template changes, so every worker reloads its templates
+template_version = VersionMarker(TEMPLATE_VERSION_PATH)
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv(override=True)
+
+# A failed step (e.g. the database not accepting connections yet) is retried after this long
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", 5))
+
+
+class Warmup:
+    """Runs the slow first-use work (templates, DB pool, lazily imported libraries) on a
+    background thread once the process is serving, so readiness can be reported apart
+    from liveness.
+
+    Steps run in the order they were added; the process is ready once every step has
+    succeeded. `context` is an optional context manager factory the steps run in.
+    """
+
+    def __init__(self, retry_seconds=WARMUP_RETRY_SECONDS, context=None):
+        self.retry_seconds = retry_seconds
+        self.context = context
+        self._steps = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._results = {}
+
+    def step(self, name, func):
+        self._steps.append((name, func))
+        return func
+
+    def start(self):
+        """Start warming up in this process, once; returns the thread or None."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return None
+            self._pid = os.getpid()
+            self._results = {}
+        thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _run_step(self, name, func):
+        started = time.perf_counter()
+        try:
+            if self.context is not None:
+                with self.context():
+                    func()
+            else:
+                func()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed, retrying in {self.retry_seconds:g}s: {e}")
+            with self._lock:
+                self._results[name] = {"ready": False, "error": str(e)}
+            return False
+        with self._lock:
+            self._results[name] = {"ready": True, "seconds": round(time.perf_counter() - started, 3)}
+        return True
+
+    def run(self):
+        started = time.monotonic()
+        for name, func in self._steps:
+            while not self._run_step(name, func):
+                time.sleep(self.retry_seconds)
+        logger.info(f"Warmed up in {time.monotonic() - started:.1f}s")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": all(self._results.get(name, {}).get("ready") for name, _ in self._steps),
+                "started": self._pid == os.getpid(),
+                "steps": {name: self._results.get(name, {"ready": False}) for name, _ in self._steps},
+            }
+
+
+warmup = Warmup()
@@ -4,29 +4,39 @@ import threading
 from pathlib import Path
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from loguru import logger
+from sentry_sdk.integrations.flask import FlaskIntegration
 from sentry_sdk.integrations.loguru import LoggingLevels, LoguruIntegration
+from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+from sqlalchemy import text
 from werkzeug.middleware.proxy_fix import ProxyFix
 import sentry_sdk
 
-from configs.cache_template import init_lookup_templates_cache, cache
-from configs.query_engine.owner_information import init_owner_query_engine
-from configs.query_engine.owner_information_without_sunit import init_owner_query_engine_without_sunit
-from configs.query_engine.tax_information import init_tax_query_engine
-from configs.query_engine.tax_information_without_sunit import init_tax_query_engine_without_sunit
+from configs.cache_template import init_lookup_templates_cache, cache, template_store
+from configs.database import db_session, engine, leak_detector
+from configs.query_engine.lookup import LookupQueryEngine, lookup_result_cache
+from configs.query_engine.factory import QUERY_ENGINE_VARIANTS, query_engine_factory
+from configs.query_engine.text_summary import get_llm
 from configs.supabase import run_websocket_listener
+from cron.parcel_replies import create_parcel_replies_table
+from cron.rental_match import create_rental_matches_table
 from exceptions import APIException
-from libs.MissiveAPI import MissiveAPI
+from libs.job_queue import JobQueue
+from libs.metrics import CONTENT_TYPE, registry
+from libs.stages import stage_percentiles, traced_job
+from libs.warmup import warmup
 from middlewares.jwt_middleware import require_authentication
+from middlewares.record_middleware import RECORD_WEBHOOKS_PATH, RecordMiddleware
 from services.services import (
-    extract_address_information,
-    handle_match,
+    missive_client,
     search_service,
+    yes_search_service,
     more_search_service, get_conversation_data, get_conversation_summary,
 )
-from utils.address_normalizer import extract_latest_address
+from utils.address_normalizer import normalization_cache, scourgify_normalize
+from utils.fast_address_normalizer import fast_path_tables
 
 load_dotenv(override=True)
 
@@ -35,10 +45,13 @@ sentry_loguru = LoguruIntegration(
     event_level=LoggingLevels.ERROR.value,  # Send errors as events
 )
 
+# The auto-enabled integrations import every supported library that is installed (the
+# OpenAI one also downloads a tokenizer), so only the ones this app relies on are listed
 sentry_sdk.init(
     dsn=os.environ.get("SENTRY_DNS"),
     enable_tracing=True,
-    integrations=[sentry_loguru],
+    auto_enabling_integrations=False,
+    integrations=[sentry_loguru, FlaskIntegration(), SqlalchemyIntegration()],
 )
 
 logger.add(sys.stderr, format="{time} {level} {message}", level="INFO")
@@ -53,14 +66,68 @@ CORS(app, origins=[SUMMARY_CONVO_URL])
 os.makedirs('cache', exist_ok=True)
 cache.init_app(app=app, config={"CACHE_TYPE": "FileSystemCache", 'CACHE_DIR': Path('./cache')})
 
-with app.app_context():
+# The LLM text-to-SQL engines are only used when explicitly enabled, as a fallback for
+# addresses the deterministic lookup can't match. They are built on first use.
+LLM_FALLBACK_ENABLED = os.environ.get("LLM_QUERY_ENGINE_FALLBACK", "false").lower() == "true"
+
+owner_query_engine = LookupQueryEngine(
+    fallback_engine=query_engine_factory.lazy("owner") if LLM_FALLBACK_ENABLED else None
+)
+owner_query_engine_without_sunit = LookupQueryEngine(
+    fallback_engine=query_engine_factory.lazy("owner_without_sunit") if LLM_FALLBACK_ENABLED else None
+)
+tax_query_engine = LookupQueryEngine(
+    fallback_engine=query_engine_factory.lazy("tax") if LLM_FALLBACK_ENABLED else None
+)
+tax_query_engine_without_sunit = LookupQueryEngine(
+    fallback_engine=query_engine_factory.lazy("tax_without_sunit") if LLM_FALLBACK_ENABLED else None
+)
+
+
+def load_templates():
+    # A failed load is only logged by the store, fail the step so it is retried
     init_lookup_templates_cache()
+    if template_store.stats()["version"] is None:
+        raise RuntimeError("Lookup templates could not be loaded")
+
+
+def ping_database():
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
 
+def create_derived_tables():
+    # Built by the ingest, created empty here for a database no ingest has run against
+    create_rental_matches_table()
+    create_parcel_replies_table()
 
-owner_query_engine = init_owner_query_engine()
-owner_query_engine_without_sunit = init_owner_query_engine_without_sunit()
-tax_query_engine = init_tax_query_engine()
-tax_query_engine_without_sunit = init_tax_query_engine_without_sunit()
+
+def warm_address_normalizer():
+    # Imports scourgify and usaddress, which the first unusual address would otherwise wait for
+    fast_path_tables()
+    scourgify_normalize("1234 NE MAIN STREET APT 2, DETROIT MI 48226")
+
+
+def warm_query_engines():
+    for variant in QUERY_ENGINE_VARIANTS:
+        query_engine_factory.get(variant)
+
+
+# Run after the process is serving, /ready reports when they are done
+warmup.context = app.app_context
+warmup.step("templates", load_templates)
+warmup.step("database", ping_database)
+warmup.step("derived_tables", create_derived_tables)
+warmup.step("address_normalizer", warm_address_normalizer)
+warmup.step("llm", get_llm)
+if LLM_FALLBACK_ENABLED:
+    warmup.step("query_engines", warm_query_engines)
+
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    # Also runs after every queued job, they run in an app context
+    db_session.remove()
 
 
 @app.errorhandler(APIException)
@@ -71,102 +138,111 @@ def handle_invalid_usage(error):
 
 
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+if RECORD_WEBHOOKS_PATH:
+    app.wsgi_app = RecordMiddleware(app.wsgi_app, RECORD_WEBHOOKS_PATH)
 
-missive_client = MissiveAPI()
 CACHE_TTL = 24 * 60 * 60
 
+# Webhooks are acknowledged right away and the lookups run on this bounded worker pool
+job_queue = JobQueue(
+    workers=int(os.environ.get("LOOKUP_WORKERS", 4)),
+    max_size=int(os.environ.get("LOOKUP_QUEUE_SIZE", 100)),
+    context=app.app_context,
+)
+
 @app.route("/", methods=["GET"])
 def health_check():
     return "OK"
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    # "/" only says the process is up, this also waits for the warm-up
+    stats = warmup.stats()
+    return jsonify(stats), 200 if stats["ready"] else 503
+
+
+def get_webhook_data():
+    data = request.get_json(silent=True) or {}
+    conversation_id = data.get("conversation", {}).get("id")
+    to_phone = data.get("message", {}).get("from_field", {}).get("id")
+    if not conversation_id or not to_phone:
+        raise APIException("Missing conversation id or sender phone number", 400)
+    return data, conversation_id, to_phone
+
+
+def enqueue_lookup(name, func, **kwargs):
+    if not job_queue.enqueue(name, traced_job(name, func), **kwargs):
+        return jsonify({"error": "Too many lookups in progress, try again later"}), 503
+    return jsonify({"message": "Accepted"}), 202
+
+
 @app.route("/search", methods=["POST"])
 # @require_authentication
 def search():
-    try:
-        data = request.get_json()
-        conversation_id = data.get("conversation", {}).get("id")
-        to_phone = data.get("message", {}).get("from_field", {}).get("id")
-        message = data.get("message", {}).get("preview")
-        response, status = search_service(
-            query=message, conversation_id=conversation_id, to_phone=to_phone,
-            owner_query_engine_without_sunit=owner_query_engine_without_sunit
-        )
-        return jsonify(response), status
+    data, conversation_id, to_phone = get_webhook_data()
+    message = data.get("message", {}).get("preview")
+    if not message:
+        raise APIException("Missing message preview", 400)
 
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        logger.exception(e)
-        return jsonify({"error": str(e)}), 500
+    return enqueue_lookup(
+        "search", search_service,
+        query=message, conversation_id=conversation_id, to_phone=to_phone,
+    )
 
 
 @app.route("/yes", methods=["POST"])
 def yes():
-    try:
-        data = request.get_json()
-        conversation_id = data.get("conversation", {}).get("id")
-        to_phone = data.get("message", {}).get("from_field", {}).get("id")
-        messages = missive_client.extract_preview_content(conversation_id=conversation_id)
-        normalized_address = extract_latest_address(
-            messages=messages, conversation_id=conversation_id, to_phone=to_phone
-        )
-        if not normalized_address:
-            logger.error("Couldn't parse address from history messages", messages)
-            return (
-                jsonify({"message": "Couldn't parse address from history messages"}),
-                200,
-            )
-
-        address, sunit = extract_address_information(normalized_address)
-
-        if sunit:
-            query_result = owner_query_engine.query(str({"address": address, "sunit": sunit}))
-        else:
-            query_result = owner_query_engine_without_sunit.query(str({"address": {address}}))
-
-        if "result" not in query_result.metadata:
-            logger.error(query_result)
-
-        handle_match(
-            response=query_result,
-            conversation_id=conversation_id,
-            to_phone=to_phone,
-        )
-        return jsonify({"message": "Success"}), 200
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        logger.exception(e)
-        return jsonify({"error": str(e)}), 500
+    data, conversation_id, to_phone = get_webhook_data()
+
+    return enqueue_lookup(
+        "yes", yes_search_service,
+        conversation_id=conversation_id, to_phone=to_phone,
+        owner_query_engine=owner_query_engine, owner_query_engine_without_sunit=owner_query_engine_without_sunit
+    )
 
 
 @app.route("/more", methods=["POST"])
 def more():
-    try:
-        data = request.get_json()
-        conversation_id = data.get("conversation", {}).get("id")
-        to_phone = data.get("message", {}).get("from_field", {}).get("id")
-        shared_labels = data.get("conversation", {}).get("shared_labels", [])
-        shared_label_ids = [label.get("id") for label in shared_labels]
+    data, conversation_id, to_phone = get_webhook_data()
+    shared_labels = data.get("conversation", {}).get("shared_labels", [])
+    shared_label_ids = [label.get("id") for label in shared_labels]
+
+    if shared_label_ids and os.environ.get("MISSIVE_LOOKUP_TAG_ID") in shared_label_ids:
+        return enqueue_lookup(
+            "more", more_search_service,
+            conversation_id=conversation_id, to_phone=to_phone,
+            tax_query_engine=tax_query_engine, tax_query_engine_without_sunit=tax_query_engine_without_sunit
+        )
 
-        if shared_label_ids and os.environ.get("MISSIVE_LOOKUP_TAG_ID") in shared_label_ids:
+    else:
+        return (
+            jsonify({"error": "There was no ADDRESS_LOOKUP_TAG, try again later"}),
+            200,
+        )
 
-            more_search_service(
-                conversation_id=conversation_id, to_phone=to_phone,
-                tax_query_engine=tax_query_engine, tax_query_engine_without_sunit=tax_query_engine_without_sunit
-            )
 
-            return jsonify({"message": "Success"}), 200
+@app.route("/jobs", methods=["GET"])
+def jobs():
+    return jsonify({
+        **job_queue.stats(),
+        "missive": missive_client.stats(),
+        "address_cache": normalization_cache.stats(),
+        "lookup_cache": lookup_result_cache.stats(),
+        "templates": template_store.stats(),
+        "warmup": warmup.stats(),
+        "stages": stage_percentiles(),
+        "db_pool": {
+            "size": engine.pool.size(),
+            "checked_out": engine.pool.checkedout(),
+            **(leak_detector.stats() if leak_detector else {}),
+        },
+    }), 200
 
-        else:
-            return (
-                jsonify({"error": "There was no ADDRESS_LOOKUP_TAG, try again later"}),
-                200,
-            )
 
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        logger.exception("", e)
-        return jsonify({"error": str(e)}), 500
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), content_type=CONTENT_TYPE)
 
 
 @app.route("/fetch_property", methods=["GET"])
@@ -220,6 +296,11 @@ def start_mqtt():
     t.start()
 
 
+def start_warmup():
+    warmup.start()
+
+
 if __name__ == "__main__":
     start_mqtt()
+    start_warmup()
     app.run(port=8080, host="0.0.0.0")
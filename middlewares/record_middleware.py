@@ -0,0 +1,52 @@
+import io
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Where webhook traffic is recorded for scripts/loadtest/replay.py (unset: not recorded)
+RECORD_WEBHOOKS_PATH = os.environ.get("RECORD_WEBHOOKS_PATH")
+
+RECORDED_PATHS = ("/search", "/yes", "/more", "/conversations/")
+
+
+class RecordMiddleware:
+    """WSGI middleware appending each webhook request to a JSONL file.
+
+    Records method, path, query string and body of the requests `replay.py` can send
+    again. The payloads hold phone numbers and message text, so keep recordings out of
+    the repository.
+    """
+
+    def __init__(self, app, path):
+        self.app = app
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path.startswith(RECORDED_PATHS):
+            try:
+                length = int(environ.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                length = 0
+            body = environ["wsgi.input"].read(length) if length else b""
+            # The app still gets to read the body
+            environ["wsgi.input"] = io.BytesIO(body)
+            self.record({
+                "time": time.time(),
+                "method": environ.get("REQUEST_METHOD"),
+                "path": path,
+                "query_string": environ.get("QUERY_STRING", ""),
+                "body": body.decode("utf-8", errors="replace"),
+            })
+        return self.app(environ, start_response)
+
+    def record(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self._lock, open(self.path, "a") as file:
+            file.write(line)
@@ -241,6 +241,30 @@ class ResidentialRentalRegistrations(Base):
     street_name = Column(String)
     address_id = Column(String)
 
+
+class ParcelRentalMatch(Base):
+    __tablename__ = "parcel_rental_matches"
+    __table_args__ = {"schema": "address_lookup"}
+
+    ogc_fid = Column(Integer, primary_key=True)
+    record_id = Column(String)
+    date_status = Column(DateTime(True))
+    match_score = Column(Float(53))
+
+
+class ParcelReply(Base):
+    __tablename__ = "parcel_replies"
+    __table_args__ = {"schema": "address_lookup"}
+
+    ogc_fid = Column(Integer, primary_key=True, autoincrement=False)
+    first_message = Column(TEXT)
+    following_message = Column(TEXT)
+    more_messages = Column(ARRAY(TEXT))
+    tax_status = Column(String)
+    rental_status = Column(String)
+    template_names = Column(ARRAY(String))
+    rendered_at = Column(DateTime(True))
+
     
 class LookupTemplate(Base):
     __tablename__ = "lookup_template"
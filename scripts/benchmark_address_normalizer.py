@@ -0,0 +1,43 @@
+import sys
+import time
+from pathlib import Path
+
+from scourgify import NormalizeAddress
+
+from utils.fast_address_normalizer import fast_normalize_address
+
+CORPUS_PATH = Path(__file__).parent.parent / "tests" / "data" / "message_previews.txt"
+
+
+def scourgify_normalize(address):
+    try:
+        return NormalizeAddress(address).normalize()
+    except Exception:
+        return None
+
+
+def fast_path_normalize(address):
+    return fast_normalize_address(address) or scourgify_normalize(address)
+
+
+def benchmark(normalize, previews, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for preview in previews:
+            normalize(preview)
+    return (time.perf_counter() - start) / (rounds * len(previews))
+
+
+def run_benchmark(path=CORPUS_PATH, rounds=20):
+    previews = Path(path).read_text().splitlines()
+    fast_path = sum(fast_normalize_address(preview) is not None for preview in previews)
+    print(f"{len(previews)} previews, {fast_path} ({fast_path / len(previews):.0%}) on the fast path")
+
+    scourgify_seconds = benchmark(scourgify_normalize, previews, rounds)
+    fast_seconds = benchmark(fast_path_normalize, previews, rounds)
+    print(f"{'scourgify'.ljust(24)} | {scourgify_seconds * 1e6:8.1f} us/address")
+    print(f"{'fast path + scourgify'.ljust(24)} | {fast_seconds * 1e6:8.1f} us/address | {scourgify_seconds / fast_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark(*sys.argv[1:2])
@@ -0,0 +1,615 @@
+"""Fill a local Postgres/PostGIS database with production-shaped synthetic data.
+
+    python -m scripts.generate_benchmark_data --database-url postgresql://localhost/outlier_bench --scale 1
+
+The tables are created from models.py, loaded with COPY, then indexed and analyzed, and
+parcel_rental_matches is built by the same statements as the ingest (cron/rental_match_sql.py).
+--scale 1 is about production size; the same --seed, --scale and --end give the same rows.
+lookup_template is not generated, copy it from staging for the app to start.
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from datetime import date, datetime, time as datetime_time, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.schema import CreateTable, DropTable
+
+from cron.rental_match_sql import BUILD_PARCEL_RENTAL_MATCHES, ENSURE_GIST_INDEX
+from models import (
+    Author,
+    Comments,
+    ConversationAssignee,
+    ConversationLabel,
+    LookupHistory,
+    MiWayneDetroit,
+    ParcelRentalMatch,
+    ResidentialRentalRegistrations,
+    TwilioMessage,
+    User,
+    WeeklyReport,
+)
+from services.analytics.config import BROADCAST_SOURCE_PHONE_NUMBER, IMPACT_LABEL_IDS, REPORTER_LABEL_IDS
+
+load_dotenv(override=True)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CORPUS_PATH = Path(__file__).parent.parent / "tests" / "data" / "message_previews.txt"
+
+GENERATED_MODELS = [
+    MiWayneDetroit,
+    ResidentialRentalRegistrations,
+    LookupHistory,
+    WeeklyReport,
+    Author,
+    User,
+    TwilioMessage,
+    ConversationLabel,
+    ConversationAssignee,
+    Comments,
+]
+
+# Row counts at --scale 1, about what production holds
+SCALE_1_ROWS = {
+    "parcels": 400_000,
+    "rentals": 45_000,
+    "authors": 120_000,
+    "messages": 3_000_000,
+    "conversation_labels": 300_000,
+    "assignees": 50_000,
+    "comments": 90_000,
+    "lookups": 250_000,
+    "weeks": 260,
+    "users": 25,
+}
+
+# Columns the analytics queries (services/analytics/queries.py) read that models.py does not declare
+EXTRA_COLUMNS = {
+    "twilio_messages": ("created_at",),
+    "conversations_labels": ("created_at",),
+    "lookup_history": ("created_at",),
+}
+
+COPY_BATCH_ROWS = 50_000
+
+# (direction, name, type); even streets run east-west, odd ones north-south
+STREETS = [
+    ("", "WOODWARD", "AVE"), ("W", "GRAND", "BLVD"), ("E", "JEFFERSON", "AVE"), ("", "LAFAYETTE", "BLVD"),
+    ("", "COMMONWEALTH", "ST"), ("", "CHEYENNE", "ST"), ("", "MAIN", "ST"), ("W", "MCNICHOLS", "RD"),
+    ("", "GRATIOT", "AVE"), ("", "MICHIGAN", "AVE"), ("W", "VERNOR", "HWY"), ("", "LIVERNOIS", "AVE"),
+    ("", "DEXTER", "AVE"), ("", "VAN DYKE", "ST"), ("", "CONNER", "ST"), ("", "MACK", "AVE"),
+    ("", "KERCHEVAL", "AVE"), ("", "FENKELL", "ST"), ("W", "SEVEN MILE", "RD"), ("E", "SEVEN MILE", "RD"),
+    ("W", "WARREN", "AVE"), ("E", "WARREN", "AVE"), ("", "JOY", "RD"), ("", "PLYMOUTH", "RD"),
+    ("", "SCHAEFER", "HWY"), ("", "GREENFIELD", "RD"), ("", "HARPER", "AVE"), ("", "CHENE", "ST"),
+] + [
+    ("", name, street_type)
+    for name in (
+        "ASHTON", "BRAILE", "CHERRYLAWN", "DAVISON", "EVERGREEN", "FAUST", "GLASTONBURY", "HARTWELL",
+        "INDIANA", "KENTUCKY", "LAUDER", "MENDOTA", "NORTHLAWN", "OHIO", "PINEHURST", "QUINCY",
+        "ROSEMONT", "SORRENTO", "TRACEY", "ULLMAN", "VASSAR", "WARD", "YOSEMITE", "ARCHDALE",
+        "BEAVERLAND", "COYLE", "DOLPHIN", "ERBIE", "FLANDERS", "GUNSTON", "HAYES", "ILENE",
+    )
+    for street_type in ("ST", "AVE", "CT")
+]
+MAX_HOUSE_NUMBER = 20_000
+# Detroit's bounding box
+LON_RANGE = (-83.28, -82.92)
+LAT_RANGE = (42.26, 42.44)
+PARCEL_HALF_WIDTH = 0.0001
+
+ZIP_CODES = [f"482{number:02d}" for number in range(1, 40) if number not in (20, 22, 29, 30, 31, 32, 33, 36)]
+FIRST_NAMES = [
+    "JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA", "DAVID", "ELIZABETH",
+    "WILLIAM", "BARBARA", "RICHARD", "SUSAN", "JOSEPH", "JESSICA", "THOMAS", "SARAH", "CHARLES", "KAREN",
+]
+LAST_NAMES = [
+    "SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ", "MARTINEZ",
+    "HERNANDEZ", "LOPEZ", "WILSON", "ANDERSON", "THOMAS", "TAYLOR", "MOORE", "JACKSON", "MARTIN", "LEE",
+]
+INSTITUTIONAL_OWNERS = [("DETROIT LAND BANK AUTHORITY", 8), ("CITY OF DETROIT-P&DD", 2)]
+# Raw tax_status values and their weights, see utils/check_property_status.py
+TAX_STATUSES = [("OK", 75), (None, 15), ("FORFEITED", 7), ("FORECLOSED", 3)]
+LOOKUP_TAX_STATUSES = {"OK": "NO_TAX_DEBT", "FORFEITED": "FORFEITED", "FORECLOSED": "FORFEITED"}
+USE_DESCRIPTIONS = [("SINGLE FAMILY", 70), ("TWO FAMILY FLAT", 12), ("VACANT LAND", 12), ("COMMERCIAL", 6)]
+
+LABELS = [(label_id, "Outlier Staff Use") for label_id in IMPACT_LABEL_IDS] + [
+    (label_id, "Automatic") for label_id in REPORTER_LABEL_IDS
+] + [(str(uuid.UUID(int=index + 1)), f"Zip/{zip_code}") for index, zip_code in enumerate(ZIP_CODES)]
+
+REPLIES = ["YES", "MORE", "Yes", "more", "Thanks!", "Thank you", "How do I report this?", "Who do I call?", "STOP"]
+ANSWERS = [
+    "{address} is owned by {owner}. Reply MORE for tax and rental information.",
+    "We could not find {address}. Please check the address and try again.",
+    "Thanks for reaching out! A reporter will follow up with you soon.",
+    "Text us an address in Detroit and we will look up who owns it.",
+]
+COMMENTS = [
+    "Followed up with the resident, waiting for a reply.",
+    "Landlord has several properties with tax debt.",
+    "Sent the rental registration info.",
+    "Possible story, flagging for the housing desk.",
+]
+
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def table_rng(seed, table):
+    """Every table draws from its own stream, so scaling one table leaves the others as they were."""
+    return random.Random(f"{seed}:{table}")
+
+
+def random_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def random_time(rng, start, end):
+    return start + timedelta(seconds=rng.uniform(0, (end - start).total_seconds()))
+
+
+def copy_value(value):
+    """`value` in the COPY text format."""
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, list):
+        value = "{" + ",".join(
+            '"' + str(item).replace("\\", "\\\\").replace('"', '\\"') + '"' for item in value
+        ) + "}"
+    elif isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_rows(connection, table, columns, rows):
+    """COPY `rows` into `columns` of `table`; returns the row count."""
+    for column in columns:
+        if column not in table.c and column not in EXTRA_COLUMNS.get(table.name, ()):
+            raise ValueError(f"{table.fullname} has no column {column}")
+    preparer = connection.dialect.identifier_preparer
+    statement = (
+        f"COPY {preparer.format_table(table)} ({', '.join(preparer.quote(column) for column in columns)}) FROM STDIN"
+    )
+    cursor = connection.connection.cursor()
+    count = 0
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(copy_value, row)))
+        buffer.write("\n")
+        count += 1
+        if count % COPY_BATCH_ROWS == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert(statement, buffer)
+    cursor.close()
+    return count
+
+
+def scaled_rows(scale):
+    return {name: max(1, round(rows * scale)) for name, rows in SCALE_1_ROWS.items()}
+
+
+class Dataset:
+    """Row generators for every table, sharing the parcels and conversations they refer to."""
+
+    def __init__(self, rows, seed, end, service_phone_number):
+        self.rows = rows
+        self.seed = seed
+        self.end = end
+        self.start = end - timedelta(days=730)
+        self.service_phone_number = service_phone_number
+        self.previews = CORPUS_PATH.read_text().splitlines()
+        # Filled while the parcels are generated
+        self.rental_parcels = []
+        self.looked_up_parcels = []
+        # Filled while the authors are generated: (phone number, conversation id, first message time)
+        self.conversations = []
+        self.user_ids = []
+
+    # -- address_lookup ----------------------------------------------------------------------
+
+    parcel_columns = [
+        "ogc_fid", "wkb_geometry", "parcelnumb", "parcelnumb_no_formatting", "address", "saddno", "saddpref",
+        "saddstr", "saddsttyp", "sunit", "scity", "city", "county", "state2", "szip", "szip5", "owner",
+        "mailadd", "mail_city", "mail_state2", "mail_zip", "usedesc", "yearbuilt", "taxable_value", "tax_due",
+        "tax_status", "taxyear", "lat", "lon", "ward", "council_district", "ll_uuid", "ll_updated_at",
+    ]
+
+    def parcels(self):
+        rng = table_rng(self.seed, "parcels")
+        count = self.rows["parcels"]
+        rental_share = self.rows["rentals"] / count
+        looked_up_share = min(1.0, 20_000 / count)
+        per_street = -(-count // len(STREETS))
+        step = max(2, MAX_HOUSE_NUMBER // per_street)
+        ogc_fid = 0
+        block = 0
+        while ogc_fid < count:
+            street_index = block % len(STREETS)
+            direction, street, street_type = STREETS[street_index]
+            house_number = str(1 + (block // len(STREETS)) * step + rng.randrange(step))
+            block += 1
+            position = int(house_number) / MAX_HOUSE_NUMBER
+            along = street_index / len(STREETS)
+            if street_index % 2 == 0:
+                lon, lat = LON_RANGE[0] + position * (LON_RANGE[1] - LON_RANGE[0]), LAT_RANGE[0] + along * (
+                    LAT_RANGE[1] - LAT_RANGE[0]
+                )
+            else:
+                lon, lat = LON_RANGE[0] + along * (LON_RANGE[1] - LON_RANGE[0]), LAT_RANGE[0] + position * (
+                    LAT_RANGE[1] - LAT_RANGE[0]
+                )
+            address = " ".join(part for part in (house_number, direction, street, street_type) if part)
+            zip_code = ZIP_CODES[int(along * len(ZIP_CODES) + position * 7) % len(ZIP_CODES)]
+            # Some buildings are condos, one parcel per unit
+            units = [None] if rng.random() > 0.03 else [f"APT {unit}" for unit in range(1, rng.randint(3, 12))]
+            for sunit in units:
+                if ogc_fid >= count:
+                    break
+                ogc_fid += 1
+                if rng.random() < 0.12:
+                    owner = weighted(rng, INSTITUTIONAL_OWNERS)
+                elif rng.random() < 0.15:
+                    owner = f"{rng.choice(LAST_NAMES)} PROPERTIES LLC"
+                else:
+                    owner = f"{rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES)}"
+                tax_status = weighted(rng, TAX_STATUSES)
+                tax_due = round(rng.lognormvariate(7, 1), 2) if tax_status != "OK" and rng.random() < 0.6 else 0.0
+                x, y = lon + rng.uniform(-0.00005, 0.00005), lat + rng.uniform(-0.00005, 0.00005)
+                parcel_number = f"{zip_code[-2:]}{int(house_number):06d}{ogc_fid % 1000:03d}"
+                if rng.random() < rental_share:
+                    self.rental_parcels.append((house_number, direction, street, x, y, parcel_number))
+                if rng.random() < looked_up_share:
+                    self.looked_up_parcels.append(
+                        (address, zip_code, LOOKUP_TAX_STATUSES.get(tax_status, "TAX_DEBT" if tax_due else None))
+                    )
+                yield (
+                    ogc_fid,
+                    "POLYGON(({0} {1},{2} {1},{2} {3},{0} {3},{0} {1}))".format(
+                        x - PARCEL_HALF_WIDTH, y - PARCEL_HALF_WIDTH, x + PARCEL_HALF_WIDTH, y + PARCEL_HALF_WIDTH
+                    ),
+                    f"{parcel_number[:2]}{parcel_number[2:8]}.{parcel_number[8:]}",
+                    parcel_number,
+                    address,
+                    house_number,
+                    direction or None,
+                    street,
+                    street_type,
+                    sunit,
+                    "DETROIT",
+                    "DETROIT",
+                    "WAYNE",
+                    "MI",
+                    zip_code,
+                    zip_code,
+                    owner,
+                    address if rng.random() < 0.6 else f"PO BOX {rng.randint(1, 9999)}",
+                    "DETROIT",
+                    "MI",
+                    zip_code,
+                    weighted(rng, USE_DESCRIPTIONS),
+                    rng.randint(1900, 1975),
+                    round(rng.uniform(2_000, 80_000), 2),
+                    tax_due,
+                    tax_status,
+                    str(self.end.year - 1),
+                    f"{y:.6f}",
+                    f"{x:.6f}",
+                    str(1 + int(along * 22)),
+                    str(1 + int(position * 7)),
+                    random_uuid(rng),
+                    self.end,
+                )
+
+    rental_columns = [
+        "ogc_fid", "wkb_geometry", "record_id", "date_status", "parcel_id", "lon", "lat", "ObjectId",
+        "street_num", "street_dir", "street_name", "address_id",
+    ]
+
+    def rentals(self):
+        rng = table_rng(self.seed, "rentals")
+        for ogc_fid, (house_number, direction, street, x, y, parcel_number) in enumerate(self.rental_parcels, 1):
+            x, y = x + rng.uniform(-0.0002, 0.0002), y + rng.uniform(-0.0002, 0.0002)
+            yield (
+                ogc_fid,
+                f"POINT({x} {y})",
+                f"BSE2{self.end.year % 100:02d}-{ogc_fid:06d}",
+                random_time(rng, self.end - timedelta(days=3 * 365), self.end),
+                parcel_number,
+                x,
+                y,
+                ogc_fid,
+                house_number,
+                direction or None,
+                street,
+                str(100_000 + ogc_fid),
+            )
+
+    # -- public ----------------------------------------------------------------------------
+
+    def lookups(self):
+        rng = table_rng(self.seed, "lookups")
+        for lookup_id in range(1, self.rows["lookups"] + 1):
+            address, zip_code, tax_status = rng.choice(self.looked_up_parcels)
+            yield (
+                lookup_id,
+                address,
+                zip_code,
+                tax_status,
+                "REGISTERED" if rng.random() < 0.15 else "UNREGISTERED",
+                random_time(rng, self.start, self.end),
+            )
+
+    def weekly_reports(self):
+        rng = table_rng(self.seed, "weekly_reports")
+        last_monday = self.end.date() - timedelta(days=self.end.weekday() + 7)
+        for week in range(self.rows["weeks"]):
+            values = [rng.randint(0, 400) for _ in range(len(WeeklyReport.__table__.c) - 2)]
+            yield (week + 1, last_monday - timedelta(weeks=self.rows["weeks"] - 1 - week), *values)
+
+    def users(self):
+        rng = table_rng(self.seed, "users")
+        for index in range(self.rows["users"]):
+            user_id = random_uuid(rng)
+            self.user_ids.append(user_id)
+            name = f"{rng.choice(FIRST_NAMES).title()} {rng.choice(LAST_NAMES).title()}"
+            yield user_id, f"reporter{index}@example.org", name, None
+
+    def authors(self):
+        rng = table_rng(self.seed, "authors")
+        for phone in rng.sample(range(10 ** 7), self.rows["authors"]):
+            phone_number = f"+1313{phone:07d}"
+            self.conversations.append((phone_number, random_uuid(rng), random_time(rng, self.start, self.end)))
+            known = rng.random() < 0.4
+            yield (
+                phone_number,
+                f"{rng.choice(FIRST_NAMES).title()} {rng.choice(LAST_NAMES).title()}" if known else None,
+                rng.random() < 0.05,
+                rng.choice(ZIP_CODES) if known else None,
+                f"resident{phone}@example.org" if known and rng.random() < 0.3 else None,
+            )
+
+    def messages(self):
+        rng = table_rng(self.seed, "messages")
+        average = self.rows["messages"] / len(self.conversations)
+        broadcasts = 2 * self.rows["weeks"]
+        for phone_number, conversation_id, started in self.conversations:
+            inbound_references = [phone_number + self.service_phone_number]
+            outbound_references = [self.service_phone_number + phone_number]
+            delivered_at = started
+            broadcast = None
+            if rng.random() < 0.3:
+                broadcast = rng.randint(1, broadcasts)
+                yield self.message(
+                    rng, "We're Outlier Media. Text us any Detroit address to find out who owns it.",
+                    delivered_at, [BROADCAST_SOURCE_PHONE_NUMBER + phone_number],
+                    BROADCAST_SOURCE_PHONE_NUMBER, phone_number,
+                )
+            for index in range(max(1, round(rng.expovariate(1 / average)))):
+                delivered_at += timedelta(seconds=rng.expovariate(1 / 21_600))
+                if delivered_at > self.end:
+                    break
+                if rng.random() < 0.45:
+                    preview = rng.choice(self.previews) if index == 0 or rng.random() < 0.4 else rng.choice(REPLIES)
+                    yield self.message(
+                        rng, preview, delivered_at, inbound_references, phone_number, self.service_phone_number,
+                        reply_to_broadcast=broadcast if index == 0 else None,
+                    )
+                else:
+                    preview = rng.choice(ANSWERS).format(
+                        address=rng.choice(self.previews).upper(), owner=rng.choice(LAST_NAMES)
+                    )
+                    yield self.message(
+                        rng, preview, delivered_at, outbound_references, self.service_phone_number, phone_number
+                    )
+
+    message_columns = [
+        "id", "preview", "type", "delivered_at", "references", "external_id", "attachments", "from_field",
+        "to_field", "is_broadcast_reply", "reply_to_broadcast", "created_at",
+    ]
+
+    def message(self, rng, preview, delivered_at, references, from_field, to_field, reply_to_broadcast=None):
+        return (
+            random_uuid(rng),
+            preview,
+            "sms",
+            delivered_at,
+            references,
+            f"SM{rng.getrandbits(128):032x}",
+            None,
+            from_field,
+            to_field,
+            reply_to_broadcast is not None,
+            reply_to_broadcast,
+            delivered_at - timedelta(seconds=rng.uniform(0, 2)),
+        )
+
+    def conversation_labels(self):
+        rng = table_rng(self.seed, "conversation_labels")
+        weights = [3] * len(IMPACT_LABEL_IDS) + [10] * len(REPORTER_LABEL_IDS) + [5] * (len(LABELS) - len(
+            IMPACT_LABEL_IDS) - len(REPORTER_LABEL_IDS))
+        label_ids = [uuid.UUID(label_id) for label_id, _ in LABELS]
+        for label_row_id in range(1, self.rows["conversation_labels"] + 1):
+            _, conversation_id, started = rng.choice(self.conversations)
+            created_at = random_time(rng, started, max(started, self.end))
+            yield (
+                label_row_id,
+                conversation_id,
+                rng.choices(label_ids, weights)[0],
+                created_at,
+                rng.random() < 0.2,
+                created_at,
+            )
+
+    def assignees(self):
+        rng = table_rng(self.seed, "assignees")
+        for assignee_id in range(1, self.rows["assignees"] + 1):
+            closed = rng.random() < 0.6
+            yield (
+                assignee_id, False, closed, closed and rng.random() < 0.5, False, False, True,
+                rng.random() < 0.05, False, rng.choice(self.conversations)[1], rng.choice(self.user_ids),
+            )
+
+    def comments(self):
+        rng = table_rng(self.seed, "comments")
+        for _ in range(self.rows["comments"]):
+            _, conversation_id, started = rng.choice(self.conversations)
+            created_at = random_time(rng, started, max(started, self.end))
+            is_task = rng.random() < 0.1
+            yield (
+                random_uuid(rng), created_at, rng.choice(COMMENTS),
+                created_at + timedelta(days=rng.uniform(0, 14)) if is_task and rng.random() < 0.7 else None,
+                rng.choice(self.user_ids), is_task, conversation_id, None,
+            )
+
+    def loads(self):
+        """(model, columns, rows) in load order; later generators use what earlier ones collected."""
+        weekly_report_columns = [column.name for column in WeeklyReport.__table__.c]
+        return [
+            (MiWayneDetroit, self.parcel_columns, self.parcels),
+            (ResidentialRentalRegistrations, self.rental_columns, self.rentals),
+            (LookupHistory, ["id", "address", "zip_code", "tax_status", "rental_status", "created_at"], self.lookups),
+            (WeeklyReport, weekly_report_columns, self.weekly_reports),
+            (User, ["id", "email", "name", "avatar_url"], self.users),
+            (Author, ["phone_number", "name", "unsubscribed", "zipcode", "email"], self.authors),
+            (TwilioMessage, self.message_columns, self.messages),
+            (
+                ConversationLabel,
+                ["id", "conversation_id", "label_id", "updated_at", "is_archived", "created_at"],
+                self.conversation_labels,
+            ),
+            (
+                ConversationAssignee,
+                ["id", "unassigned", "closed", "archived", "trashed", "junked", "assigned", "flagged", "snoozed",
+                 "conversation_id", "user_id"],
+                self.assignees,
+            ),
+            (
+                Comments,
+                ["id", "created_at", "body", "task_completed_at", "user_id", "is_task", "conversation_id",
+                 "attachment"],
+                self.comments,
+            ),
+        ]
+
+
+def sequence_name(column):
+    """The sequence in a `nextval(...)` server default, as models.py declares for the ingested tables."""
+    if column.server_default is None:
+        return None
+    match = re.search(r"nextval\('(.+)'::regclass\)", str(column.server_default.arg))
+    return match.group(1) if match else None
+
+
+def create_tables(connection, drop):
+    tables = [model.__table__ for model in GENERATED_MODELS]
+    existing = [table.fullname for table in tables if inspect(connection).has_table(table.name, table.schema)]
+    if existing and not drop:
+        raise SystemExit(f"{', '.join(existing)} already exist, rerun with --drop to replace them")
+
+    for statement in (
+        "CREATE EXTENSION IF NOT EXISTS postgis",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE SCHEMA IF NOT EXISTS address_lookup",
+    ):
+        connection.execute(text(statement))
+    if drop:
+        for table in tables + [ParcelRentalMatch.__table__]:
+            connection.execute(DropTable(table, if_exists=True))
+        connection.execute(text("DROP TABLE IF EXISTS public.labels"))
+
+    for table in tables:
+        for column in table.primary_key.columns:
+            sequence = sequence_name(column)
+            if sequence:
+                connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {sequence}"))
+        # Indexes are built after the load, which is much faster than maintaining them row by row
+        connection.execute(CreateTable(table))
+        for column in EXTRA_COLUMNS.get(table.name, ()):
+            connection.execute(text(f"ALTER TABLE {table.fullname} ADD COLUMN {column} TIMESTAMP WITH TIME ZONE"))
+
+    # Joined by the weekly impact/reporter queries, not in models.py
+    connection.execute(text("CREATE TABLE public.labels (id UUID PRIMARY KEY, name VARCHAR)"))
+    connection.execute(
+        text("INSERT INTO public.labels (id, name) VALUES (:id, :name)"),
+        [{"id": label_id, "name": name} for label_id, name in LABELS],
+    )
+
+
+def finish_table(connection, table):
+    for index in table.indexes:
+        index.create(connection)
+    if table.schema == "address_lookup":
+        connection.execute(text(ENSURE_GIST_INDEX.format(table=table.name)))
+    for column in table.primary_key.columns:
+        sequence = sequence_name(column)
+        if sequence is None and column.autoincrement is not False and str(column.type) == "INTEGER":
+            sequence = connection.execute(
+                text("SELECT pg_get_serial_sequence(:table, :column)"),
+                {"table": table.fullname, "column": column.name},
+            ).scalar()
+        if sequence:
+            connection.execute(text(
+                f"SELECT setval('{sequence}', COALESCE((SELECT max({column.name}) FROM {table.fullname}), 1))"
+            ))
+
+
+def generate(engine, rows, seed, end, drop=False):
+    dataset = Dataset(rows, seed, end, os.environ.get("PHONE_NUMBER") or "+13135550100")
+    with engine.begin() as connection:
+        create_tables(connection, drop)
+
+    for model, columns, generator in dataset.loads():
+        table = model.__table__
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            count = copy_rows(connection, table, columns, generator())
+            finish_table(connection, table)
+        logger.info(f"{table.fullname}: {count} rows in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        for statement in BUILD_PARCEL_RENTAL_MATCHES:
+            connection.execute(text(statement))
+    logger.info(f"address_lookup.parcel_rental_matches built in {time.perf_counter() - started:.1f}s")
+
+    # ANALYZE cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a production-shaped benchmark database")
+    parser.add_argument("--database-url", default=os.environ.get("BENCHMARK_DATABASE_URL"),
+                        help="defaults to BENCHMARK_DATABASE_URL, never to DATABASE_URL")
+    parser.add_argument("--scale", type=float, default=1.0, help="1 is about production size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(),
+                        help="date the generated history runs up to (YYYY-MM-DD)")
+    parser.add_argument("--drop", action="store_true", help="replace the tables if they exist")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or BENCHMARK_DATABASE_URL is required")
+
+    rows = scaled_rows(args.scale)
+    logger.info(f"Generating {rows} with seed {args.seed}")
+    end = datetime.combine(args.end, datetime_time(), tzinfo=timezone.utc)
+    generate(create_engine(args.database_url), rows, args.seed, end, drop=args.drop)
+
+
+if __name__ == "__main__":
+    main()
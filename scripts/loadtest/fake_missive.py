@@ -0,0 +1,33 @@
+import uuid
+import zlib
+from pathlib import Path
+
+from scripts.loadtest.fake_server import FakeHandler, parse_args, route, serve
+
+CORPUS_PATH = Path(__file__).parent.parent.parent / "tests" / "data" / "message_previews.txt"
+PREVIEWS = CORPUS_PATH.read_text().splitlines()
+
+
+class FakeMissiveHandler(FakeHandler):
+    """The Missive endpoints the app calls, under /v1 (set MISSIVE_API_BASE_URL=http://host:port/v1)."""
+
+    routes = [
+        route("POST", r"/v1/drafts", "create_draft"),
+        route("GET", r"/v1/conversations/(?P<conversation_id>[^/]+)/messages", "conversation_messages"),
+        route("POST", r"/v1/posts", "create_post"),
+    ]
+
+    def create_draft(self, payload):
+        return 200, {"drafts": {"id": str(uuid.uuid4())}}
+
+    def conversation_messages(self, payload, conversation_id):
+        # The same conversation always has the same address in its history
+        preview = PREVIEWS[zlib.crc32(conversation_id.encode()) % len(PREVIEWS)]
+        return 200, {"messages": [{"id": str(uuid.uuid4()), "preview": preview}]}
+
+    def create_post(self, payload):
+        return 200, {"posts": {"id": str(uuid.uuid4())}}
+
+
+if __name__ == "__main__":
+    serve(FakeMissiveHandler, parse_args("Fake Missive API", 8090).parse_args())
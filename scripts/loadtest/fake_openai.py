@@ -0,0 +1,74 @@
+import random
+import time
+import uuid
+import zlib
+
+from scripts.loadtest.fake_server import FakeHandler, parse_args, route, serve
+
+EMBEDDING_DIMENSIONS = 1536
+REPLY = "This is a canned reply from the fake OpenAI server."
+
+
+class FakeOpenAIHandler(FakeHandler):
+    """OpenAI-compatible chat, completion and embedding endpoints (set OPENAI_API_BASE=http://host:port/v1).
+
+    Streaming is not supported; the app doesn't stream.
+    """
+
+    routes = [
+        route("POST", r"/v1/chat/completions", "chat_completion"),
+        route("POST", r"/v1/completions", "completion"),
+        route("POST", r"/v1/embeddings", "embeddings"),
+    ]
+    reply = REPLY
+
+    def usage(self):
+        return {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+
+    def chat_completion(self, payload):
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply},
+                "logprobs": None,
+                "finish_reason": "stop",
+            }],
+            "usage": self.usage(),
+        }
+
+    def completion(self, payload):
+        return 200, {
+            "id": f"cmpl-{uuid.uuid4().hex}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-3.5-turbo-instruct"),
+            "choices": [{"index": 0, "text": self.reply, "logprobs": None, "finish_reason": "stop"}],
+            "usage": self.usage(),
+        }
+
+    def embeddings(self, payload):
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for index, text in enumerate(inputs):
+            # Deterministic per input, so retrieval over fake embeddings is stable
+            generator = random.Random(zlib.crc32(str(text).encode()))
+            data.append({
+                "object": "embedding",
+                "index": index,
+                "embedding": [generator.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSIONS)],
+            })
+        return 200, {"object": "list", "data": data, "model": payload.get("model"), "usage": self.usage()}
+
+
+if __name__ == "__main__":
+    parser = parse_args("Fake OpenAI API", 8091)
+    parser.add_argument("--reply", default=REPLY, help="content of every completion")
+    args = parser.parse_args()
+    FakeOpenAIHandler.reply = args.reply
+    serve(FakeOpenAIHandler, args)
@@ -0,0 +1,125 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeServer(ThreadingHTTPServer):
+    """HTTP stand-in for an external API, with injected latency, errors and throttling.
+
+    Every response waits `latency` plus up to `jitter` seconds. A `throttle_rate`
+    fraction of requests gets a 429 with Retry-After, an `error_rate` fraction a 503.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, handler_class, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 seed=None):
+        super().__init__(address, handler_class)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def draw(self):
+        with self._lock:
+            return self.random.random(), self.random.uniform(0, self.jitter)
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Routes requests to handler methods by (method, path regex); GET /_stats returns the counts."""
+
+    # [(method, compiled path regex, handler method name)]
+    routes = []
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if method == "GET" and self.path == "/_stats":
+            return self.send_json(200, dict(self.server.counts))
+
+        for route_method, pattern, name in self.routes:
+            match = pattern.fullmatch(self.path.split("?", 1)[0])
+            if route_method == method and match:
+                break
+        else:
+            self.server.count("not_found")
+            return self.send_json(404, {"error": f"No fake for {method} {self.path}"})
+
+        draw, jitter = self.server.draw()
+        time.sleep(self.server.latency + jitter)
+        if draw < self.server.throttle_rate:
+            self.server.count(f"{name}:429")
+            return self.send_json(429, {"error": "Too many requests"}, {"Retry-After": "1"})
+        if draw < self.server.throttle_rate + self.server.error_rate:
+            self.server.count(f"{name}:503")
+            return self.send_json(503, {"error": "Injected error"})
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+        self.server.count(name)
+        status, response = getattr(self, name)(payload, **match.groupdict())
+        self.send_json(status, response)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def route(method, pattern, name):
+    return method, re.compile(pattern), name
+
+
+def parse_args(description, default_port):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+def serve(handler_class, args):
+    server = FakeServer(
+        (args.host, args.port), handler_class,
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, seed=args.seed,
+    )
+    print(f"{handler_class.__name__} listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+CORPUS_PATH = Path(__file__).parent.parent.parent / "tests" / "data" / "message_previews.txt"
+DEFAULT_MIX = "search=70,yes=10,more=10,conversations=10"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def load_recordings(path):
+    """Requests recorded by middlewares/record_middleware.py, one JSON object per line."""
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class SyntheticTraffic:
+    """Webhook requests shaped like Missive's, for when there are no recordings."""
+
+    def __init__(self, previews, mix, lookup_tag_id, seed=None):
+        self.previews = previews
+        self.endpoints, self.weights = zip(*mix.items())
+        self.lookup_tag_id = lookup_tag_id
+        self.random = random.Random(seed)
+
+    def webhook(self, conversation_id, phone, preview=None):
+        return {
+            "conversation": {
+                "id": conversation_id,
+                "shared_labels": [{"id": self.lookup_tag_id}] if self.lookup_tag_id else [],
+            },
+            "message": {"from_field": {"id": phone}, "preview": preview},
+        }
+
+    def request(self):
+        endpoint = self.random.choices(self.endpoints, self.weights)[0]
+        conversation_id = str(uuid.UUID(int=self.random.getrandbits(128)))
+        phone = f"+1313{self.random.randrange(10 ** 7):07d}"
+        if endpoint == "conversations":
+            return {"method": "GET", "path": f"/conversations/{conversation_id}",
+                    "query_string": f"reference={phone.lstrip('+')}", "body": ""}
+        preview = self.random.choice(self.previews) if endpoint == "search" else None
+        return {"method": "POST", "path": f"/{endpoint}", "query_string": "",
+                "body": json.dumps(self.webhook(conversation_id, phone, preview))}
+
+
+def endpoint_of(request):
+    return request["path"].strip("/").split("/")[0] or "/"
+
+
+class Replay:
+    """Sends requests open-loop: request i is due at start + i / rate, however slow the target is.
+
+    Latency is measured from when a request was due, not when a thread got to send it,
+    so a backed-up target shows up in the percentiles instead of lowering the rate.
+    """
+
+    def __init__(self, target, rate, concurrency, timeout):
+        self.target = target.rstrip("/")
+        self.rate = rate
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def send(self, request, due_at):
+        endpoint = endpoint_of(request)
+        url = f"{self.target}{request['path']}"
+        if request.get("query_string"):
+            url = f"{url}?{request['query_string']}"
+        try:
+            response = self.session().request(
+                request["method"], url, data=request.get("body") or None,
+                headers={"Content-Type": "application/json"}, timeout=self.timeout,
+            )
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        latency = time.monotonic() - due_at
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            self.statuses[endpoint][status] += 1
+
+    def run(self, requests_iter, count=None, duration=None):
+        started = time.monotonic()
+        futures = []
+        for index, request in enumerate(requests_iter):
+            due_at = started + index / self.rate
+            if (count is not None and index >= count) or (duration is not None and due_at - started >= duration):
+                break
+            delay = due_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(self.executor.submit(self.send, request, due_at))
+        for future in futures:
+            future.result()
+        self.executor.shutdown()
+        return time.monotonic() - started
+
+    def report(self, elapsed):
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        print(f"{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s (target {self.rate:g} req/s)")
+        print(f"{'endpoint'.ljust(14)} | {'count'.rjust(6)} | {'p50 ms'.rjust(8)} | {'p95 ms'.rjust(8)} | "
+              f"{'p99 ms'.rjust(8)} | {'max ms'.rjust(8)} | statuses")
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            statuses = ", ".join(f"{status}: {count}" for status, count in sorted(
+                self.statuses[endpoint].items(), key=lambda item: str(item[0])
+            ))
+            print(f"{endpoint.ljust(14)} | {str(len(latencies)).rjust(6)} | "
+                  + " | ".join(f"{value * 1000:8.1f}" for value in (
+                      percentile(latencies, 0.5), percentile(latencies, 0.95),
+                      percentile(latencies, 0.99), latencies[-1],
+                  ))
+                  + f" | {statuses}")
+
+
+def print_server_stats(target, timeout):
+    """Lookups run after the webhook returns 202; their latency is in the target's /jobs."""
+    try:
+        response = requests.get(f"{target.rstrip('/')}/jobs", timeout=timeout)
+        stats = response.json() if response.ok else {}
+    except (requests.RequestException, ValueError):
+        return
+    if "completed" not in stats:
+        return
+    print(f"jobs: completed {stats.get('completed')}, failed {stats.get('failed')}, rejected {stats.get('rejected')}, "
+          f"avg latency {stats.get('latency_avg_seconds', 0) * 1000:.1f} ms, "
+          f"max {stats.get('latency_max_seconds', 0) * 1000:.1f} ms")
+    for stage, percentiles in sorted(stats.get("stages", {}).items()):
+        print(f"  {stage.ljust(24)} p50 {percentiles['p50'] * 1000:8.1f} ms | p95 {percentiles['p95'] * 1000:8.1f} ms"
+              f" | p99 {percentiles['p99'] * 1000:8.1f} ms | {percentiles['count']} runs")
+
+
+def parse_mix(mix):
+    return {endpoint: float(weight) for endpoint, weight in (part.split("=") for part in mix.split(","))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay webhook traffic against the lookup service")
+    parser.add_argument("--target", default="http://localhost:8080")
+    parser.add_argument("--recordings", help="JSONL from RECORD_WEBHOOKS_PATH; synthetic traffic if omitted")
+    parser.add_argument("--rate", type=float, default=10, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to send for")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead")
+    parser.add_argument("--concurrency", type=int, default=64, help="max requests in flight")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="synthetic endpoint weights")
+    parser.add_argument("--lookup-tag-id", default=os.environ.get("MISSIVE_LOOKUP_TAG_ID"),
+                        help="label /more requires on the conversation")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.recordings:
+        recordings = load_recordings(args.recordings)
+        requests_iter = (recordings[index % len(recordings)] for index in range(10 ** 12))
+    else:
+        traffic = SyntheticTraffic(CORPUS_PATH.read_text().splitlines(), parse_mix(args.mix),
+                                   args.lookup_tag_id, args.seed)
+        requests_iter = iter(traffic.request, None)
+
+    replay = Replay(args.target, args.rate, args.concurrency, args.timeout)
+    elapsed = replay.run(requests_iter, count=args.requests, duration=None if args.requests else args.duration)
+    replay.report(elapsed)
+    print_server_stats(args.target, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Seconds `import main` may take before the check fails, 0 only reports
+STARTUP_IMPORT_BUDGET_SECONDS = float(os.environ.get("STARTUP_IMPORT_BUDGET_SECONDS") or 0)
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def import_times(module):
+    """{module: (self seconds, cumulative seconds, depth)} from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times[name] = (int(self_us) / 1e6, int(cumulative_us) / 1e6, (len(indent) - 1) // 2)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile how long importing the app takes")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20, help="slowest top-level imports to list")
+    parser.add_argument("--budget", type=float, default=STARTUP_IMPORT_BUDGET_SECONDS,
+                        help="fail if the import takes longer than this many seconds")
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total = times[args.module][1]
+    print(f"import {args.module}: {total:.2f}s")
+    # Direct imports of the module, which add up to its total
+    top_level = sorted(
+        ((name, cumulative) for name, (_, cumulative, depth) in times.items() if depth == 1),
+        key=lambda item: item[1], reverse=True,
+    )
+    for name, cumulative in top_level[:args.top]:
+        print(f"  {name.ljust(48)} {cumulative:6.3f}s")
+
+    if args.budget and total > args.budget:
+        print(f"import {args.module} took {total:.2f}s, over the {args.budget:g}s budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
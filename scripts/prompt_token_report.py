@@ -0,0 +1,11 @@
+from configs.query_engine.factory import schema_token_report
+
+
+def main():
+    print(f"{'variant'.ljust(20)} | {'full'.rjust(6)} | {'pruned'.rjust(6)} | saved")
+    for variant, (full, pruned) in schema_token_report().items():
+        print(f"{variant.ljust(20)} | {str(full).rjust(6)} | {str(pruned).rjust(6)} | {1 - pruned / full:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from sqlalchemy import text
 import datetime
 
 from configs.database import Session
+from libs.db_metrics import db_call_site
 from config import (
     IMPACT_LABEL_IDS,
     REPORTER_LABEL_IDS,
@@ -46,7 +47,8 @@ load_dotenv(override=True)
 
 class AnalyticsService:
     def __init__(self):
-        self.Session = Session()
+        # A new session for each report, so a service shared between threads doesn't share one
+        self.Session = Session
 
     def get_weekly_unsubscribe_by_audience_segment(self, session):
         return session.execute(GET_WEEKLY_UNSUBSCRIBE_BY_AUDIENCE_SEGMENT).fetchall()
@@ -106,6 +108,7 @@ class AnalyticsService:
     def get_broadcasts_content(self, session):
         return session.execute(GET_WEEKLY_BROADCAST_CONTENT).fetchall()
 
+    @db_call_site("analytics")
     def fetch_data_last_week(self):
         # Calculate the date of the last Monday
         today = datetime.date.today()
@@ -118,7 +121,7 @@ class AnalyticsService:
         last_monday_start = datetime.datetime.combine(last_monday, datetime.time.min)
         last_sunday_end = datetime.datetime.combine(last_sunday, datetime.time.max)
 
-        with self.Session as session:
+        with self.Session() as session:
             # Fetch data for the given week
             data = (
                 session.query(WeeklyReport)
@@ -131,8 +134,9 @@ class AnalyticsService:
 
         return format_weekly_report_data(data)
 
+    @db_call_site("analytics")
     def fetch_data(self):
-        with self.Session as session:
+        with self.Session() as session:
             # Fetch all the data here synchronously
             unsubscribed_messages = self.get_weekly_unsubscribe_by_audience_segment(session)
             broadcasts = self.get_weekly_broadcast_sent(session)
@@ -207,6 +211,7 @@ class AnalyticsService:
         session.add(new_report)
         session.commit()
 
+    @db_call_site("analytics")
     def send_weekly_report(self):
         # Fetch the data synchronously
         data = self.fetch_data()
@@ -284,13 +289,15 @@ class AnalyticsService:
         if unsubscribe_by_audience_segment_section:
             markdown_report.append(unsubscribe_by_audience_segment_section)
 
-        conversation_id = get_conversation_id(self.Session)
+        with self.Session() as session:
+            conversation_id = get_conversation_id(session)
         missive_client = MissiveAPI()
         missive_client.send_post_sync(
             markdown_report, conversation_id=conversation_id
         )
+        missive_client.close()
 
-        with self.Session as session:
+        with self.Session() as session:
             self.insert_weekly_report(
                 session,
                 datetime.datetime.now().isoformat(),
@@ -301,6 +308,7 @@ class AnalyticsService:
                 unsubscribes_by_audience_segment,
             )
 
+    @db_call_site("analytics")
     def fetch_average_data_last_4_weeks(self):
         # Calculate the start date for 4 weeks ago
         today = datetime.date.today()
@@ -348,7 +356,7 @@ class AnalyticsService:
             WHERE created_at >= :start_date AND created_at <= :end_date
         """)
 
-        with self.Session as session:
+        with self.Session() as session:
             result = session.execute(
                 query, {"start_date": start_datetime, "end_date": end_datetime}
             ).fetchone()
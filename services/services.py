@@ -1,174 +1,166 @@
 import os
-import time
 
 from flask import jsonify
 from loguru import logger
 from sqlalchemy.orm import aliased
 
 from configs.cache_template import get_template_content_by_name
-from configs.database import Session
+from configs.database import db_session
+from configs.query_engine.lookup import find_parcels
 from configs.query_engine.text_summary import generate_text_summary
 
 from libs.MissiveAPI import MissiveAPI
+from libs.conversation_state import conversation_state_store
+from libs.db_metrics import db_call_site
+from libs.sms_dispatcher import MERGE_OUTBOUND_SMS, OutboundMessage, SmsDispatcher
+from libs.stages import stage, timed_stage
 from configs.cache_template import get_rental_message, get_tax_message
-from models import LookupHistory, MiWayneDetroit, ResidentialRentalRegistrations, TwilioMessage, ConversationLabel, \
+from models import LookupHistory, MiWayneDetroit, ParcelRentalMatch, ParcelReply, TwilioMessage, ConversationLabel, \
     ConversationAssignee, Author, User, Comments
 from utils.address_normalizer import get_first_valid_normalized_address, extract_latest_address
 from utils.check_property_status import check_property_status
 from utils.map_keys_to_result import map_keys_to_result
-from constants.following_message import FollowingMessageType
+from utils.parcel_replies import REGISTERED_SUFFIX, classify_parcel
 
-from sqlalchemy import and_, case, func, or_
+from sqlalchemy import and_, case, or_
+from sqlalchemy.exc import SQLAlchemyError
 
 missive_client = MissiveAPI()
+# Keeps each conversation's replies in order and spaced out without blocking the caller
+sms_dispatcher = SmsDispatcher(missive_client.send_sms_sync)
 
 
-def search_service(query, conversation_id, to_phone, owner_query_engine_without_sunit):
-    session = Session()
-
+@db_call_site("search_service")
+def search_service(query, conversation_id, to_phone):
     # Run query engine to get address
-    normalized_address = get_first_valid_normalized_address([query])
-    address, sunit = extract_address_information(normalized_address)
-    rental_status_case = case(
-        (ResidentialRentalRegistrations.lat.isnot(None), "REGISTERED"), else_="UNREGISTERED"
-    ).label("rental_status")
+    with stage("normalize_address"):
+        normalized_address = get_first_valid_normalized_address([query])
+        address, sunit = extract_address_information(normalized_address)
 
     if not address:
         logger.error("Wrong format address", query)
+        conversation_state_store.delete(conversation_id)
         return handle_wrong_format(conversation_id=conversation_id, to_phone=to_phone)
     else:
-        if sunit:
-            results = (
-                session.query(
-                    MiWayneDetroit.address,
-                    rental_status_case,
-                    MiWayneDetroit.tax_status,
-                    MiWayneDetroit.szip5,
-                    MiWayneDetroit.tax_due,
-                )
-                .outerjoin(
-                    ResidentialRentalRegistrations,
-                    and_(
-                        func.ST_DWithin(
-                            MiWayneDetroit.wkb_geometry,
-                            ResidentialRentalRegistrations.wkb_geometry,
-                            0.001,
-                        ),
-                        func.strict_word_similarity(
-                            func.upper(MiWayneDetroit.saddstr),
-                            func.upper(ResidentialRentalRegistrations.street_name),
-                        )
-                        > 0.8,
-                        MiWayneDetroit.saddno == ResidentialRentalRegistrations.street_num,
-                    ),
-                )
-                .filter(
-                    MiWayneDetroit.address.ilike(f"{address.strip()}%"),
-                    or_(
-                        MiWayneDetroit.sunit.ilike(f"%{sunit}%"),
-                    ),
-                )
-                .all()
-            )
-        else:
-            results = (
-                session.query(
-                    MiWayneDetroit.address,
-                    rental_status_case,
-                    MiWayneDetroit.tax_status,
-                    MiWayneDetroit.szip5,
-                    MiWayneDetroit.tax_due,
-                )
-                .outerjoin(
-                    ResidentialRentalRegistrations,
-                    and_(
-                        func.ST_DWithin(
-                            MiWayneDetroit.wkb_geometry,
-                            ResidentialRentalRegistrations.wkb_geometry,
-                            0.001,
-                        ),
-                        func.strict_word_similarity(
-                            func.upper(MiWayneDetroit.saddstr),
-                            func.upper(ResidentialRentalRegistrations.street_name),
-                        )
-                        > 0.8,
-                        MiWayneDetroit.saddno == ResidentialRentalRegistrations.street_num,
-                    ),
-                )
-                .filter(
-                    MiWayneDetroit.address.ilike(f"{address.strip()}%"),
-                )
-                .all()
-            )
+        # Repeated lookups of an address are answered from the lookup result cache
+        with stage("find_parcels"):
+            lookup_result = find_parcels(address, sunit)
+        results = lookup_result.rows
 
     display_address = address if not sunit else address + " " + sunit
     if not results:
+        conversation_state_store.delete(conversation_id)
         return handle_no_match(display_address, conversation_id, to_phone)
 
-    address, rental_status, tax_status, zip_code, tax_due = results[0]
+    # /yes and /more answer from this instead of re-reading the conversation history. After
+    # a closest_match reply, YES confirms this first (closest) parcel, as the history lookup did.
+    with stage("conversation_state"):
+        conversation_state_store.set_parcel(conversation_id, results[0])
 
-    if not tax_status and tax_due and int(tax_due) > 0:
-        add_data_lookup_to_db(
-            address,
-            zip_code,
-            "TAX_DEBT",
-            rental_status,
-        )
-    elif not tax_status and tax_due and int(tax_due) > 0 or tax_status == "OK":
+    parcel = results[0]
+    classification = classify_parcel(parcel)
+    with stage("add_data_lookup_to_db"):
         add_data_lookup_to_db(
-            address,
-            zip_code,
-            "NO_TAX_DEBT",
-            rental_status,
-        )
-    else:
-        add_data_lookup_to_db(
-            address,
-            zip_code,
-            tax_status,
-            rental_status,
+            parcel.address,
+            parcel.szip5,
+            classification.lookup_tax_status,
+            classification.rental_status,
         )
 
     if len(results) > 1:
         return handle_ambiguous(display_address, conversation_id, to_phone)
 
-    # Missive API to adding tags
-    query_result = owner_query_engine_without_sunit.query(address)
+    # Replies pre-rendered at ingest make the lookup a key-value read
+    reply = get_parcel_reply(parcel.ogc_fid)
+    if reply is not None:
+        return send_match_replies(reply.first_message, reply.following_message, conversation_id, to_phone)
+
+    # The owner reply was rendered along with the lookup, no need to query again
+    query_result = lookup_result.response
 
     if "result" not in query_result.metadata:
         logger.error(query_result)
         return "", 200
 
-    owner_data = map_keys_to_result(query_result.metadata)
+    return handle_match(
+        query_result, conversation_id, to_phone, classification.rental_status,
+        classification.following_message_type,
+    )
 
-    following_message_type = ""
-    if "owner" in owner_data:
-        if "LAND BANK" in owner_data["owner"].upper():
-            following_message_type = FollowingMessageType.LAND_BACK
-        elif "UNCONFIRMED" in owner_data["tax_status"].upper():
-            following_message_type = FollowingMessageType.UNCONFIRMED_TAX_STATUS
-        else:
-            following_message_type = FollowingMessageType.DEFAULT
 
-    return handle_match(query_result, conversation_id, to_phone, rental_status, following_message_type)
+@db_call_site("yes_search_service")
+def yes_search_service(conversation_id, to_phone, owner_query_engine, owner_query_engine_without_sunit):
+    with stage("conversation_state"):
+        parcel = conversation_state_store.get_parcel(conversation_id)
+    reply = get_parcel_reply(parcel.ogc_fid) if parcel is not None else None
+    if reply is not None:
+        return send_match_replies(reply.first_message, None, conversation_id, to_phone)
 
+    if parcel is not None:
+        query_result = owner_query_engine.respond(parcel)
+        address, sunit = parcel.address, parcel.sunit
+    else:
+        with stage("conversation_history"):
+            messages = missive_client.extract_preview_content(conversation_id=conversation_id)
+        with stage("normalize_address"):
+            normalized_address = extract_latest_address(
+                messages=messages, conversation_id=conversation_id, to_phone=to_phone
+            )
+        if not normalized_address:
+            logger.error("Couldn't parse address from history messages", messages)
+            return {"message": "Couldn't parse address from history messages"}, 200
 
-def more_search_service(conversation_id, to_phone, tax_query_engine, tax_query_engine_without_sunit):
-    messages = missive_client.extract_preview_content(conversation_id=conversation_id)
-    normalized_address = extract_latest_address(messages, conversation_id, to_phone)
-    if not normalized_address:
-        logger.error("Couldn't parse address from history messages", messages)
-        return (
-            jsonify({"message": "Couldn't parse address from history messages"}),
-            200,
-        )
+        address, sunit = extract_address_information(normalized_address)
 
-    address, sunit = extract_address_information(normalized_address)
+        with stage("query_engine"):
+            if sunit:
+                query_result = owner_query_engine.query(address, sunit)
+            else:
+                query_result = owner_query_engine_without_sunit.query(address)
+
+    if "result" not in query_result.metadata:
+        logger.error(query_result)
+        display_address = address if not sunit else address + " " + sunit
+        return handle_no_match(display_address, conversation_id, to_phone)
 
-    if sunit:
-        query_result = tax_query_engine.query(str({"address": address, "sunit": sunit}))
+    owner_data = map_keys_to_result(query_result.metadata)
+    return handle_match(
+        response=query_result,
+        conversation_id=conversation_id,
+        to_phone=to_phone,
+        rental_status="REGISTERED" if owner_data.get("rental_status") == "IS" else "UNREGISTERED",
+    )
+
+
+@db_call_site("more_search_service")
+def more_search_service(conversation_id, to_phone, tax_query_engine, tax_query_engine_without_sunit):
+    with stage("conversation_state"):
+        parcel = conversation_state_store.get_parcel(conversation_id)
+    reply = get_parcel_reply(parcel.ogc_fid) if parcel is not None else None
+    if reply is not None:
+        return send_more_replies(reply.more_messages, conversation_id, to_phone)
+
+    if parcel is not None:
+        query_result = tax_query_engine.respond(parcel)
     else:
-        query_result = tax_query_engine_without_sunit.query(str({"address": {address}}))
+        with stage("conversation_history"):
+            messages = missive_client.extract_preview_content(conversation_id=conversation_id)
+        with stage("normalize_address"):
+            normalized_address = extract_latest_address(messages, conversation_id, to_phone)
+        if not normalized_address:
+            logger.error("Couldn't parse address from history messages", messages)
+            return (
+                jsonify({"message": "Couldn't parse address from history messages"}),
+                200,
+            )
+
+        address, sunit = extract_address_information(normalized_address)
+
+        with stage("query_engine"):
+            if sunit:
+                query_result = tax_query_engine.query(address, sunit)
+            else:
+                query_result = tax_query_engine_without_sunit.query(address)
 
     if "result" not in query_result.metadata:
         logger.error(query_result)
@@ -183,11 +175,7 @@ def handle_no_match(query, conversation_id, to_phone):
     content = get_template_content_by_name("no_match")
     if content:
         formatted_content = content.format(address=query)
-        missive_client.send_sms_sync(
-            formatted_content,
-            to_phone,
-            conversation_id,
-        )
+        sms_dispatcher.dispatch(conversation_id, to_phone, [OutboundMessage(formatted_content)])
         return {"result": formatted_content}, 200
     else:
         logger.exception("Could not find template no_match")
@@ -199,97 +187,86 @@ def handle_ambiguous(query, conversation_id, to_phone):
     content = get_template_content_by_name("closest_match")
     if content:
         formatted_content = content.format(address=query)
-        missive_client.send_sms_sync(
-            formatted_content,
-            to_phone,
-            conversation_id,
-        )
+        sms_dispatcher.dispatch(conversation_id, to_phone, [OutboundMessage(formatted_content)])
         return {"result": formatted_content}, 200
     else:
         logger.exception("Could not find template closest_match")
         return {"result": ""}, 200
 
 
+@timed_stage("handle_match")
 def handle_match(
         response,
         conversation_id,
         to_phone,
         rental_status="UNREGISTERED",
-        following_message_type="",
+        following_message_type=None,
 ):
     response = str(response)
     if rental_status == "REGISTERED":
-        response += "It is registered as a residential rental property"
+        response = response.rstrip() + REGISTERED_SUFFIX
 
-    # Missive API -> Send SMS template
-    missive_client.send_sms_sync(
-        str(response),
-        conversation_id=conversation_id,
-        to_phone=to_phone,
-        add_label_list=[os.environ.get("MISSIVE_LOOKUP_TAG_ID")],
-    )
+    following_message = ""
+    if following_message_type:
+        following_message = get_template_content_by_name(following_message_type.value)
 
-    time.sleep(2)
+    return send_match_replies(response, following_message, conversation_id, to_phone)
 
-    match following_message_type:
-        case FollowingMessageType.LAND_BACK:
-            following_message = get_template_content_by_name(FollowingMessageType.LAND_BACK)
-        case FollowingMessageType.UNCONFIRMED_TAX_STATUS:
-            following_message = get_template_content_by_name(FollowingMessageType.UNCONFIRMED_TAX_STATUS)
-        case FollowingMessageType.DEFAULT:
-            following_message = get_template_content_by_name(FollowingMessageType.DEFAULT)
-        case _:
-            following_message = ""
 
+def send_match_replies(first_message, following_message, conversation_id, to_phone):
+    add_label_list = [os.environ.get("MISSIVE_LOOKUP_TAG_ID")]
+    messages = [OutboundMessage(first_message, add_label_list, MERGE_OUTBOUND_SMS)]
     if following_message:
-        missive_client.send_sms_sync(
-            following_message,
-            conversation_id=conversation_id,
-            to_phone=to_phone,
-            add_label_list=[os.environ.get("MISSIVE_LOOKUP_TAG_ID")],
-        )
-    # Remove tags
-    return {"result": str(response)}, 200
+        messages.append(OutboundMessage(following_message, add_label_list, MERGE_OUTBOUND_SMS))
+
+    # Missive API -> Send SMS template
+    sms_dispatcher.dispatch(conversation_id, to_phone, messages)
+    return {"result": first_message}, 200
 
 
 def handle_wrong_format(conversation_id, to_phone):
     content = get_template_content_by_name("wrong_format")
     if content:
-        missive_client.send_sms_sync(
-            content,
-            conversation_id=conversation_id,
-            to_phone=to_phone,
-        )
+        sms_dispatcher.dispatch(conversation_id, to_phone, [OutboundMessage(content)])
         return {"result": content}, 200
     else:
         logger.exception("Could not find template wrong_format")
         return {"result": ""}, 200
 
 
+@timed_stage("process_statuses")
 def process_statuses(tax_status, rental_status, conversation_id, phone):
+    messages = []
     if tax_status and tax_status != "NO_TAX_DEBT":
-        missive_client.send_sms_sync(
-            get_tax_message(tax_status),
-            conversation_id=conversation_id,
-            to_phone=phone,
-        )
-        time.sleep(2)
+        messages.append(get_tax_message(tax_status))
 
     if rental_status:
-        missive_client.send_sms_sync(
-            get_rental_message(rental_status),
-            conversation_id=conversation_id,
-            to_phone=phone,
-        )
-        time.sleep(2)
+        messages.append(get_rental_message(rental_status))
 
     content = get_template_content_by_name("final")
     if content:
-        missive_client.send_sms_sync(
-            content,
-            conversation_id=conversation_id,
-            to_phone=phone,
-        )
+        messages.append(content)
+
+    send_more_replies(messages, conversation_id, phone)
+
+
+def send_more_replies(messages, conversation_id, phone):
+    sms_dispatcher.dispatch(
+        conversation_id, phone, [OutboundMessage(message, mergeable=MERGE_OUTBOUND_SMS) for message in messages]
+    )
+
+
+@timed_stage("get_parcel_reply")
+def get_parcel_reply(ogc_fid):
+    if ogc_fid is None:
+        return None
+    try:
+        return db_session.get(ParcelReply, ogc_fid)
+    except SQLAlchemyError as e:
+        db_session.rollback()
+        # e.g. before the first ingest has created parcel_replies
+        logger.warning(f"Could not read pre-rendered replies for parcel {ogc_fid}: {e}")
+        return None
 
 
 def extract_address_information(normalized_address):
@@ -304,18 +281,15 @@ def extract_address_information(normalized_address):
 
 
 def add_data_lookup_to_db(address, zip_code, tax_status, rental_status):
-    session = Session()
     try:
         new_data_lookup = LookupHistory(
             address=address, zip_code=zip_code, tax_status=tax_status, rental_status=rental_status
         )
-        session.add(new_data_lookup)
-        session.commit()
+        db_session.add(new_data_lookup)
+        db_session.commit()
     except Exception as e:
-        session.rollback()
+        db_session.rollback()
         raise e
-    finally:
-        session.close()
 
 
 def get_address_information(session, address):
@@ -324,7 +298,7 @@ def get_address_information(session, address):
 
     # Define the case statement for rental_status
     rental_status_case = case(
-        (ResidentialRentalRegistrations.lat.isnot(None), "IS"), else_="IS NOT"
+        (ParcelRentalMatch.record_id.isnot(None), "IS"), else_="IS NOT"
     ).label("rental_status")
 
     query = (
@@ -334,23 +308,7 @@ def get_address_information(session, address):
             MiWayneDetroit.tax_status,
             MiWayneDetroit.szip5,
         )
-        .outerjoin(
-            ResidentialRentalRegistrations,
-            and_(
-                func.ST_DWithin(
-                    MiWayneDetroit.wkb_geometry,
-                    ResidentialRentalRegistrations.wkb_geometry,
-                    0.001,
-                ),
-                func.strict_word_similarity(
-                    MiWayneDetroit.address,
-                    ResidentialRentalRegistrations.street_num
-                    + " "
-                    + ResidentialRentalRegistrations.street_name,
-                )
-                > 0.8,
-            ),
-        )
+        .outerjoin(ParcelRentalMatch, ParcelRentalMatch.ogc_fid == MiWayneDetroit.ogc_fid)
         .filter(
             MiWayneDetroit.address.ilike(f"{address.strip()}%"),
             or_(
@@ -365,79 +323,81 @@ def get_address_information(session, address):
     return results
 
 
+@db_call_site("get_conversation_data")
 def get_conversation_data(conversation_id, query_phone_number):
     try:
-        with Session() as session:
-            # Get the query phone number
-            phone_number = os.getenv('PHONE_NUMBER')
-            if not phone_number:
-                return None
-            phone_pair_1 = [query_phone_number + phone_number]
-            phone_pair_2 = [phone_number + query_phone_number]
-
-            # Query authors table
-            author = session.query(Author).filter(Author.phone_number == query_phone_number).first()
-            author_zipcode = author.zipcode if author else None
-            author_email = author.email if author else None
-
-            # Query conversations_assignees and users tables
-            UserAlias = aliased(User)
-            assignee_users = session.query(UserAlias.name).join(
-                ConversationAssignee, ConversationAssignee.user_id == UserAlias.id
-            ).filter(ConversationAssignee.conversation_id == conversation_id).all()
-            assignee_user_names = [user.name for user in assignee_users if user.name is not None]
-
-            label_ids = session.query(ConversationLabel.label_id).filter(
-                ConversationLabel.conversation_id == conversation_id
-            ).distinct().all()
-            label_ids = [label_id[0] for label_id in label_ids]
-
-            # Query TwilioMessage table
-            messages = session.query(TwilioMessage.preview).filter(
-                and_(
-                    or_(TwilioMessage.from_field == query_phone_number, TwilioMessage.to_field == query_phone_number),
-                    or_(TwilioMessage.references == phone_pair_1, TwilioMessage.references == phone_pair_2)
-                )
-            ).order_by(TwilioMessage.delivered_at).all()
-
-            first_reply = session.query(TwilioMessage.delivered_at).filter(
-                and_(
-                    TwilioMessage.from_field == query_phone_number,
-                    or_(TwilioMessage.references == phone_pair_1, TwilioMessage.references == phone_pair_2)
-                )
-            ).order_by(TwilioMessage.delivered_at).first()
-
-            # Query comments table
-            comments = session.query(Comments).filter(Comments.conversation_id == conversation_id).all()
-
-            comment_summary = generate_text_summary(comments, "A summary of all comments left in the thread by "
-                                                              "reporters over time. Recommendations the reporters "
-                                                              "made, handoffs to other reporters, process/case notes, "
-                                                              "phone call notes,")
-            impact_summary = generate_text_summary(messages, "A short summary of impact/conversation outcomes for "
-                                                             "this contact. Detailing whether their issues have "
-                                                             "consistently been addressed, or if they were unable to "
-                                                             "get the help they needed.")
-            message_summary = generate_text_summary(messages, "A summary detailing the contact's general tone and "
-                                                              "approach during the conversations. Here we could flag "
-                                                              "if a contact has been abusive or rude in their "
-                                                              "communications with Outlier staff. Also include "
-                                                              "relevant case notes (e.g., this person never follows "
-                                                              "up after we provide info), notes from phone calls.")
-
-            # Create a dictionary to store the conversation summary
-            conversation_summary = {
-                'author_zipcode': author_zipcode,
-                'author_email': author_email,
-                'assignee_user_name': assignee_user_names,
-                'first_reply': first_reply[0] if first_reply else None,
-                'labels': label_ids,
-                'comments': comment_summary.text,
-                'outcome': impact_summary.text,
-                'messages': message_summary.text
-            }
-
-            return conversation_summary
+        # Get the query phone number
+        phone_number = os.getenv('PHONE_NUMBER')
+        if not phone_number:
+            return None
+        phone_pair_1 = [query_phone_number + phone_number]
+        phone_pair_2 = [phone_number + query_phone_number]
+
+        # Query authors table
+        author = db_session.query(Author).filter(Author.phone_number == query_phone_number).first()
+        author_zipcode = author.zipcode if author else None
+        author_email = author.email if author else None
+
+        # Query conversations_assignees and users tables
+        UserAlias = aliased(User)
+        assignee_users = db_session.query(UserAlias.name).join(
+            ConversationAssignee, ConversationAssignee.user_id == UserAlias.id
+        ).filter(ConversationAssignee.conversation_id == conversation_id).all()
+        assignee_user_names = [user.name for user in assignee_users if user.name is not None]
+
+        label_ids = db_session.query(ConversationLabel.label_id).filter(
+            ConversationLabel.conversation_id == conversation_id
+        ).distinct().all()
+        label_ids = [label_id[0] for label_id in label_ids]
+
+        # Query TwilioMessage table
+        messages = db_session.query(TwilioMessage.preview).filter(
+            and_(
+                or_(TwilioMessage.from_field == query_phone_number, TwilioMessage.to_field == query_phone_number),
+                or_(TwilioMessage.references == phone_pair_1, TwilioMessage.references == phone_pair_2)
+            )
+        ).order_by(TwilioMessage.delivered_at).all()
+
+        first_reply = db_session.query(TwilioMessage.delivered_at).filter(
+            and_(
+                TwilioMessage.from_field == query_phone_number,
+                or_(TwilioMessage.references == phone_pair_1, TwilioMessage.references == phone_pair_2)
+            )
+        ).order_by(TwilioMessage.delivered_at).first()
+
+        # Query comments table
+        comments = db_session.query(Comments).filter(Comments.conversation_id == conversation_id).all()
+        # Give the connection back to the pool before the slow summaries
+        db_session.close()
+
+        comment_summary = generate_text_summary(comments, "A summary of all comments left in the thread by "
+                                                          "reporters over time. Recommendations the reporters "
+                                                          "made, handoffs to other reporters, process/case notes, "
+                                                          "phone call notes,")
+        impact_summary = generate_text_summary(messages, "A short summary of impact/conversation outcomes for "
+                                                         "this contact. Detailing whether their issues have "
+                                                         "consistently been addressed, or if they were unable to "
+                                                         "get the help they needed.")
+        message_summary = generate_text_summary(messages, "A summary detailing the contact's general tone and "
+                                                          "approach during the conversations. Here we could flag "
+                                                          "if a contact has been abusive or rude in their "
+                                                          "communications with Outlier staff. Also include "
+                                                          "relevant case notes (e.g., this person never follows "
+                                                          "up after we provide info), notes from phone calls.")
+
+        # Create a dictionary to store the conversation summary
+        conversation_summary = {
+            'author_zipcode': author_zipcode,
+            'author_email': author_email,
+            'assignee_user_name': assignee_user_names,
+            'first_reply': first_reply[0] if first_reply else None,
+            'labels': label_ids,
+            'comments': comment_summary.text,
+            'outcome': impact_summary.text,
+            'messages': message_summary.text
+        }
+
+        return conversation_summary
 
     except Exception as e:
         # Log the error for debugging purposes
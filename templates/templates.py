@@ -23,6 +23,11 @@ templates = {
         "If this doesn't look right or you have any questions text REPORTER and we'll follow up with you "
         "within 48 hours. Or if you want tips and extra info about tax debt or rules for rentals type MORE."
     ),
+    "owner_information": (
+        "The county has {owner} listed as the owner of {address}. This property has {tax_due} in "
+        "outstanding taxes according to the Wayne County Treasurer. It is listed as {tax_status} by "
+        "the Treasurer."
+    ),
     "has_tax_debt": (
         "If you own your home and have tax debt, the county does have payment plan options, and there are "
         "some other programs to help if you're having trouble paying off the debt. For payment plans with "
@@ -0,0 +1,38 @@
+import uuid
+from datetime import datetime, timezone
+
+from scripts.generate_benchmark_data import Dataset, copy_value, scaled_rows
+
+END = datetime(2026, 10, 19, tzinfo=timezone.utc)
+
+
+def generate_rows(seed):
+    dataset = Dataset(scaled_rows(0.002), seed, END, "+13135550100")
+    return {model.__tablename__: (columns, list(rows())) for model, columns, rows in dataset.loads()}
+
+
+def test_copy_value_escapes_the_copy_text_format():
+    assert copy_value(None) == r"\N"
+    assert copy_value(True) == "t"
+    assert copy_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+    assert copy_value(['+1313+1', 'say "hi"']) == '{"+1313+1","say \\\\"hi\\\\""}'
+    assert copy_value(END) == "2026-10-19T00:00:00+00:00"
+    assert copy_value(uuid.UUID(int=1)) == "00000000-0000-0000-0000-000000000001"
+
+
+def test_generated_rows_are_seeded_and_consistent():
+    tables = generate_rows(seed=7)
+    assert tables == generate_rows(seed=7)
+    assert tables != generate_rows(seed=8)
+
+    for columns, rows in tables.values():
+        assert all(len(row) == len(columns) for row in rows)
+
+    message_columns, messages = tables["twilio_messages"]
+    author_phones = {row[0] for row in tables["authors"][1]}
+    references = message_columns.index("references")
+    from_field = message_columns.index("from_field")
+    inbound = [message for message in messages if message[from_field] in author_phones]
+    assert inbound
+    # The pairs get_conversation_data matches messages on
+    assert all(message[references] == [message[from_field] + "+13135550100"] for message in inbound)
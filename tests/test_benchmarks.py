@@ -0,0 +1,181 @@
+import json
+import os
+import timeit
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from configs.cache_template import TemplateStore, get_template_content_by_name
+from configs.query_engine.lookup import LOOKUP_COL_KEYS, LookupResponse
+from libs.version_marker import VersionMarker
+from services.analytics.utils import (
+    calculate_percentage_change,
+    generate_conversation_metrics_section,
+    generate_conversation_outcomes_markdown,
+    generate_data_by_audience_segment_markdown,
+    generate_geographic_region_markdown,
+    generate_lookup_history_markdown,
+)
+from services.services import extract_address_information
+from utils.address_normalizer import NormalizationCache, get_first_valid_normalized_address
+from utils.check_property_status import check_property_status
+from utils.map_keys_to_result import map_keys_to_result
+
+# Timing is noisy on shared CI runners, so the benchmarks only run when asked for:
+#   RUN_BENCHMARKS=true python -m pytest -q tests/test_benchmarks.py
+# BENCHMARK_UPDATE_BASELINE=true records the results as the new baseline instead of comparing.
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS", "false").lower() == "true"
+UPDATE_BASELINE = os.environ.get("BENCHMARK_UPDATE_BASELINE", "false").lower() == "true"
+# Allowed slowdown over the baseline, 0.5 fails anything more than 50% slower
+BENCHMARK_THRESHOLD = float(os.environ.get("BENCHMARK_THRESHOLD", 0.5))
+BENCHMARK_ROUNDS = int(os.environ.get("BENCHMARK_ROUNDS", 3))
+BASELINE_PATH = Path(__file__).parent / "data" / "benchmark_baseline.json"
+CORPUS_PATH = Path(__file__).parent / "data" / "message_previews.txt"
+
+pytestmark = pytest.mark.skipif(not RUN_BENCHMARKS, reason="set RUN_BENCHMARKS=true to run the benchmarks")
+
+
+def reference_workload():
+    # Fixed pure-Python work the benchmarks are measured against, so a baseline recorded
+    # on one machine still holds on a faster or slower one
+    words = [f"{number} MAIN ST APT {number % 7}" for number in range(200)]
+    return sorted({word.lower(): len(word) for word in words}.items())
+
+
+def seconds_per_call(func, repeat=3):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+@pytest.fixture(scope="module")
+def results():
+    results = {}
+    yield results
+    if UPDATE_BASELINE and results:
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        baseline.update(results)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture
+def benchmark(results):
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+
+    def run(name, func):
+        # The reference is timed right before each round, so both see the same machine state,
+        # and the median round is kept
+        rounds = sorted(
+            (seconds / reference_seconds, seconds)
+            for reference_seconds, seconds in (
+                (seconds_per_call(reference_workload), seconds_per_call(func)) for _ in range(BENCHMARK_ROUNDS)
+            )
+        )
+        relative, seconds = rounds[len(rounds) // 2]
+        results[name] = {"relative": round(relative, 4), "seconds": seconds}
+        if UPDATE_BASELINE:
+            return
+        if name not in baseline:
+            pytest.skip(f"No baseline for {name}, record one with BENCHMARK_UPDATE_BASELINE=true")
+        allowed = baseline[name]["relative"] * (1 + BENCHMARK_THRESHOLD)
+        assert relative <= allowed, (
+            f"{name} took {seconds * 1e6:.1f} us/call, {relative:.3f}x the reference workload "
+            f"against a baseline of {baseline[name]['relative']:.3f}x (allowed {allowed:.3f}x)"
+        )
+
+    return run
+
+
+@pytest.fixture
+def previews():
+    return CORPUS_PATH.read_text().splitlines()
+
+
+def test_get_first_valid_normalized_address_cached(benchmark, previews):
+    cache = NormalizationCache()
+    with patch("utils.address_normalizer.normalization_cache", cache):
+        for preview in previews:
+            get_first_valid_normalized_address([preview])
+        benchmark("get_first_valid_normalized_address_cached",
+                  lambda: [get_first_valid_normalized_address([preview]) for preview in previews])
+
+
+def test_get_first_valid_normalized_address_uncached(benchmark, previews):
+    # Every entry is evicted as soon as it is stored, so each call parses the address
+    with patch("utils.address_normalizer.normalization_cache", NormalizationCache(max_size=0)):
+        benchmark("get_first_valid_normalized_address_uncached",
+                  lambda: [get_first_valid_normalized_address([preview]) for preview in previews])
+
+
+def test_extract_address_information(benchmark, previews):
+    normalized = [get_first_valid_normalized_address([preview]) for preview in previews]
+    normalized = [address for address in normalized if address is not None]
+    benchmark("extract_address_information", lambda: [extract_address_information(address) for address in normalized])
+
+
+def test_map_keys_to_result_and_check_property_status(benchmark):
+    response = LookupResponse(
+        metadata={"result": [["JOHN DOE", "IS", 1500.25, "FORFEITED"]], "col_keys": LOOKUP_COL_KEYS}
+    )
+    benchmark("map_keys_to_result", lambda: map_keys_to_result(response.metadata))
+    benchmark("check_property_status", lambda: check_property_status(response))
+
+
+def test_get_template_content_by_name(benchmark, tmp_path):
+    store = TemplateStore(
+        VersionMarker(str(tmp_path / "template_version")),
+        snapshot_path=str(tmp_path / "lookup_templates.json"),
+    )
+    templates = [{"id": index, "name": f"template_{index}", "content": f"Content {index}"} for index in range(40)]
+    with patch("configs.cache_template.get_lookup_templates", return_value=templates):
+        store.reload()
+    with patch("configs.cache_template.template_store", store):
+        benchmark("get_template_content_by_name", lambda: get_template_content_by_name("template_20"))
+
+
+WEEK = {
+    "conversation_metrics": {
+        "conversation_starters_sent": 1200, "broadcast_replies": 340, "text_ins": 95,
+        "reporter_conversations": 41, "unsubscribes": 12, "failed_deliveries": 30,
+    },
+    "lookup_history": {
+        "REGISTERED": 40, "UNREGISTERED": 160, "TAX_DEBT": 55, "NO_TAX_DEBT": 120, "COMPLIANT": 0, "FORECLOSED": 9,
+    },
+    "conversation_outcomes": {
+        "user satisfaction": 8, "problem addressed": 4, "unsatisfied": 1, "accountability gap": 2,
+        "crisis averted": 1, "future keyword": 3, "source": 2,
+    },
+    "unsubscribed_messages": {"Proactive": 3, "Receptive": 4, "Connected": 1, "Passive": 2, "Inactive": 2},
+    "replies": {"Proactive": 120, "Receptive": 90, "Connected": 70, "Passive": 40, "Inactive": 20},
+}
+LAST_WEEK = {
+    section: {key: value + index % 3 for index, (key, value) in enumerate(values.items())}
+    for section, values in WEEK.items()
+}
+
+
+def test_calculate_percentage_change(benchmark):
+    benchmark("calculate_percentage_change", lambda: calculate_percentage_change(LAST_WEEK, WEEK))
+
+
+def test_analytics_markdown(benchmark):
+    changes = calculate_percentage_change(LAST_WEEK, WEEK)
+    zip_codes = [("48205", 31), ("48228", 27), ("48219", 22), ("48235", 19), ("48224", 17)]
+
+    def render():
+        return [
+            generate_conversation_metrics_section(
+                WEEK["conversation_metrics"], changes["conversation_metrics"], changes["conversation_metrics"]
+            ),
+            generate_lookup_history_markdown(
+                WEEK["lookup_history"], changes["lookup_history"], changes["lookup_history"]
+            ),
+            generate_conversation_outcomes_markdown(
+                WEEK["conversation_outcomes"], changes["conversation_outcomes"], changes["conversation_outcomes"]
+            ),
+            generate_data_by_audience_segment_markdown(WEEK["replies"], changes["replies"], changes["replies"]),
+            generate_geographic_region_markdown(zip_codes),
+        ]
+
+    benchmark("analytics_markdown", render)
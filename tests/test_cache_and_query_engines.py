@@ -1,7 +1,12 @@
 import asyncio
+import os
 from unittest.mock import patch, MagicMock, AsyncMock
 from flask import Flask
 from flask_caching import Cache
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
 from configs.cache_template import (
     get_lookup_templates,
     init_lookup_templates_cache,
@@ -9,27 +14,54 @@ from configs.cache_template import (
     update_lookup_templates_cache,
     get_tax_message,
     get_rental_message,
+    TemplateStore,
 )
+from configs.query_engine.factory import QueryEngineFactory, describe_table, schema_token_report
+from configs.query_engine.lookup import LookupQueryEngine, LookupResultCache, build_lookup_query, find_parcels
 from configs.query_engine.owner_information import init_owner_query_engine
 from configs.query_engine.owner_information_without_sunit import init_owner_query_engine_without_sunit
 from configs.query_engine.tax_information import init_tax_query_engine
 from configs.query_engine.tax_information_without_sunit import init_tax_query_engine_without_sunit
-from configs.supabase import connect_to_supabase, run_websocket_listener
+from configs.supabase import (
+    TemplateChanges,
+    callback1,
+    connect_to_supabase,
+    listen_for_template_changes,
+    run_websocket_listener,
+)
+from cron.parcel_replies import parcel_rows_query
+from cron.rental_match import create_rental_matches_table
+from cron.rental_match_sql import BUILD_PARCEL_RENTAL_MATCHES
+from libs.host_lock import HostLock
+from libs.parcel_snapshot import ParcelRecord
+from libs.version_marker import VersionMarker
+from models import MiWayneDetroit
 
 # Mock data
 mock_templates = [
-    {"name": "no_match", "content": "No match for {address}"},
-    {"name": "wrong_format", "content": "Wrong format"},
-    {"name": "has_tax_debt", "content": "Has tax debt"},
+    {"id": 1, "name": "no_match", "content": "No match for {address}"},
+    {"id": 2, "name": "wrong_format", "content": "Wrong format"},
+    {"id": 3, "name": "has_tax_debt", "content": "Has tax debt"},
 ]
 
+
+
+def make_template_store(tmp_path, **kwargs):
+    return TemplateStore(
+        VersionMarker(str(tmp_path / "template_version")),
+        snapshot_path=str(tmp_path / "lookup_templates.json"),
+        **kwargs,
+    )
+
+
 # Initialize Flask app and cache for testing
 app = Flask(__name__)
 cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
 
 
 def test_get_lookup_templates():
-    with patch('configs.cache_template.session') as mock_session:
+    with patch('configs.cache_template.Session') as mock_session_factory:
+        mock_session = mock_session_factory.return_value.__enter__.return_value
         mock_query = MagicMock()
         mock_query.all.return_value = [type('Template', (object,), template) for template in mock_templates]
         mock_session.query.return_value = mock_query
@@ -39,18 +71,18 @@ def test_get_lookup_templates():
         assert templates[0]['name'] == mock_templates[0]['name']
 
 
-def test_init_lookup_templates_cache():
+def test_init_lookup_templates_cache(tmp_path):
+    store = make_template_store(tmp_path)
     with patch('configs.cache_template.get_lookup_templates', return_value=mock_templates), \
-            patch('configs.cache_template.cache') as mock_cache:
+            patch('configs.cache_template.template_store', store):
         init_lookup_templates_cache()
-        mock_cache.set.assert_called_once_with("lookup_templates",
-                                               {template['name']: template['content'] for template in mock_templates})
-
+        assert store.stats() == {"version": 0, "size": len(mock_templates), "reloads": 1, "changes": 0}
 
-def test_get_template_content_by_name():
-    with app.app_context(), patch('configs.cache_template.cache') as mock_cache:
-        mock_cache.get.return_value = {template['name']: template['content'] for template in mock_templates}
 
+def test_get_template_content_by_name(tmp_path):
+    store = make_template_store(tmp_path)
+    with patch('configs.cache_template.get_lookup_templates', return_value=mock_templates), \
+            patch('configs.cache_template.template_store', store):
         template_content = get_template_content_by_name("no_match")
         assert template_content == "No match for {address}"
 
@@ -60,13 +92,40 @@ def test_get_template_content_by_name():
         template_content = get_template_content_by_name("non_existent")
         assert template_content is None
 
+        # Loaded once, then read from the snapshot
+        assert store.stats()["reloads"] == 1
+
 
-def test_update_lookup_templates_cache():
+def test_update_lookup_templates_cache(tmp_path):
+    store = make_template_store(tmp_path)
+    version = store.version_marker
     with patch('configs.cache_template.get_lookup_templates', return_value=mock_templates), \
-            patch('configs.cache_template.cache') as mock_cache:
+            patch('configs.cache_template.template_store', store):
         update_lookup_templates_cache()
-        mock_cache.set.assert_called_once_with("lookup_templates",
-                                               {template['name']: template['content'] for template in mock_templates})
+        assert version.read() == 1
+        assert store.version() == 1
+        assert store.get("wrong_format") == "Wrong format"
+
+
+def test_template_store_follows_other_processes(tmp_path):
+    store = make_template_store(tmp_path, check_interval=0)
+    version = store.version_marker
+    with patch('configs.cache_template.get_lookup_templates', return_value=mock_templates):
+        assert store.get("no_match") == "No match for {address}"
+
+    changed = [{"id": 1, "name": "no_match", "content": "Nothing found"}]
+    with patch('configs.cache_template.get_lookup_templates', return_value=changed):
+        # Unchanged marker: no reload
+        assert store.get("no_match") == "No match for {address}"
+        # Another worker published a change
+        VersionMarker(version.path).bump()
+        assert store.get("no_match") == "Nothing found"
+        assert store.version() == 1
+
+    with patch('configs.cache_template.get_lookup_templates', side_effect=Exception("down")):
+        VersionMarker(version.path).bump()
+        # A failed reload keeps the last snapshot
+        assert store.get("no_match") == "Nothing found"
 
 
 def test_get_tax_message():
@@ -78,6 +137,9 @@ def test_get_tax_message():
         assert get_tax_message("FORECLOSED") == "Content for foreclosed"
         assert get_tax_message("FORFEITED") == "Content for forfeited"
         assert get_tax_message("NO_INFORMATION") is None
+        assert get_tax_message("UNKNOWN") == "Invalid tax status"
+        # Only the template for the requested status is resolved
+        assert mock_get_template.call_count == 3
 
 
 def test_get_rental_message():
@@ -90,12 +152,350 @@ def test_get_rental_message():
         assert get_rental_message("NO_INFORMATION") is None
 
 
-def test_run_websocket_listener():
+def test_lookup_query_engine_respond():
+    row = MagicMock(address="1234 MAIN ST", owner="JOHN DOE", rental_status="IS", tax_due=100.5,
+                    tax_status="OK", szip5="48201")
+    with patch('configs.query_engine.lookup.get_template_content_by_name',
+               return_value="{owner} owns {address}, owes {tax_due} and is {tax_status}"):
+        response = LookupQueryEngine().respond(row)
+
+    assert str(response) == "JOHN DOE owns 1234 MAIN ST, owes $100.50 and is OK"
+    assert response.metadata == {
+        "result": [["JOHN DOE", "IS", 100.5, "OK"]],
+        "col_keys": ["owner", "rental_status", "tax_due", "tax_status"],
+    }
+
+
+def test_build_lookup_query_uses_precomputed_rental_matches():
+    query = build_lookup_query(Session(), "1234 MAIN ST", "2")
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    assert "parcel_rental_matches.ogc_fid = address_lookup.mi_wayne_detroit.ogc_fid" in sql
+    assert "ST_DWithin" not in sql
+    assert "strict_word_similarity" not in sql
+
+
+def test_lookup_query_engine_falls_back_when_no_match():
+    fallback_engine = MagicMock()
+    with patch('configs.query_engine.lookup.db_session'), \
+            patch('configs.query_engine.lookup.lookup_result_cache', LookupResultCache()), \
+            patch('configs.query_engine.lookup.get_parcel_snapshot', return_value=None), \
+            patch('configs.query_engine.lookup.build_lookup_query') as mock_build_lookup_query:
+        mock_build_lookup_query.return_value.all.return_value = []
+
+        assert LookupQueryEngine().query("1234 MAIN ST").metadata == {}
+
+        response = LookupQueryEngine(fallback_engine=fallback_engine).query("1234 MAIN ST", "2")
+        fallback_engine.query.assert_called_once_with(str({"address": "1234 MAIN ST", "sunit": "2"}))
+        assert response == fallback_engine.query.return_value
+
+
+def test_find_parcels_is_cached_until_the_ingest_version_changes(tmp_path):
+    version = VersionMarker(str(tmp_path / "ingest_version"))
+    snapshot = MagicMock()
+    snapshot.search.return_value = [ParcelRecord(1, "1234 MAIN ST", "", "48201", "JOHN DOE", "IS", 0.0, "OK")]
+    with patch('configs.query_engine.lookup.lookup_result_cache', LookupResultCache(version=version)), \
+            patch('configs.query_engine.lookup.ingest_version', version), \
+            patch('configs.query_engine.lookup.get_parcel_snapshot', return_value=snapshot), \
+            patch('configs.query_engine.lookup.render_owner_information', return_value="reply"):
+        first = find_parcels("1234 Main St ")
+        assert find_parcels("1234 MAIN ST") is first
+        assert snapshot.search.call_count == 1
+        assert str(first.response) == "reply"
+
+        version.bump()
+        assert find_parcels("1234 MAIN ST") is not first
+        assert snapshot.search.call_count == 2
+
+
+def test_query_engine_factory_builds_lazily_once(tmp_path):
+    factory = QueryEngineFactory(cache_dir=str(tmp_path))
+    with patch.object(factory, '_build_engine') as mock_build_engine:
+        lazy_engine = factory.lazy("owner")
+        mock_build_engine.assert_not_called()
+
+        lazy_engine.query("question")
+        lazy_engine.query("another question")
+
+        mock_build_engine.assert_called_once_with("owner")
+        assert mock_build_engine.return_value.query.call_count == 2
+        assert "owner" in factory.timings
+
+        # The tax lookups share the owner engine
+        assert factory.get("tax") is factory.get("owner")
+        mock_build_engine.assert_called_once_with("owner")
+
+
+def test_query_engine_factory_skips_retriever_for_single_table(tmp_path):
+    factory = QueryEngineFactory(cache_dir=str(tmp_path))
+    with patch('configs.query_engine.factory.get_template_content_by_name',
+               side_effect=lambda name: f"{name} {{schema}} {{query_str}} {{dialect}}"), \
+            patch('configs.query_engine.text_to_sql.SQLDatabase'), \
+            patch('configs.query_engine.text_to_sql.OpenAI'), \
+            patch('configs.query_engine.text_to_sql.ObjectIndex') as mock_object_index, \
+            patch('configs.query_engine.text_to_sql.NLSQLTableQueryEngine') as mock_nl_sql_query_engine:
+        query_engine = factory.get("owner")
+
+    mock_object_index.from_objects.assert_not_called()
+    assert query_engine == mock_nl_sql_query_engine.return_value
+    assert mock_nl_sql_query_engine.call_args.kwargs["tables"] == ["mi_wayne_detroit"]
+    assert mock_nl_sql_query_engine.call_args.kwargs["context_query_kwargs"] == {
+        "mi_wayne_detroit": "search_context_with_sunit {schema} {query_str} {dialect}"
+    }
+
+
+def test_describe_table_prunes_columns():
+    description = describe_table(MiWayneDetroit.__table__, ["address", "owner", "tax_due"])
+    assert description == (
+        "Table 'mi_wayne_detroit' has columns: owner (VARCHAR), address (VARCHAR), tax_due (FLOAT), "
+        "and foreign keys: ."
+    )
+    assert "fema_flood_zone" in describe_table(MiWayneDetroit.__table__)
+
+
+def test_schema_token_report_shrinks_prompts():
+    with patch('tiktoken.encoding_for_model', side_effect=Exception("offline")):
+        report = schema_token_report()
+
+    assert set(report) == {"owner", "owner_without_sunit"}
+    for full_tokens, pruned_tokens in report.values():
+        assert pruned_tokens < full_tokens
+
+
+def test_query_engine_factory_caches_reflected_schema(tmp_path):
+    version = VersionMarker(str(tmp_path / "ingest_version"))
+    factory = QueryEngineFactory(cache_dir=str(tmp_path), version_marker=version)
+    with patch('configs.query_engine.text_to_sql.SQLDatabase') as mock_sql_database:
+        factory.sql_database
+        assert os.path.exists(factory.schema_cache_path(0))
+
+        cached_factory = QueryEngineFactory(cache_dir=str(tmp_path), version_marker=version)
+        cached_factory.sql_database
+        metadata = mock_sql_database.call_args.kwargs["metadata"]
+        assert metadata.schema == "address_lookup"
+        assert mock_sql_database.call_count == 2
+
+        # An ingest may have changed the tables: reflect again and drop the old cache
+        factory.sql_database
+        assert mock_sql_database.call_count == 2
+        version.bump()
+        factory.sql_database
+        assert mock_sql_database.call_count == 3
+        assert os.path.exists(factory.schema_cache_path(1))
+        assert not os.path.exists(factory.schema_cache_path(0))
+
+        # A newer version's cache, written by another worker, is left alone
+        open(factory.schema_cache_path(2), "wb").close()
+        factory._remove_older_schema_caches(1)
+        assert os.path.exists(factory.schema_cache_path(2))
+
+
+def test_run_websocket_listener(tmp_path):
     with patch('configs.supabase.asyncio.new_event_loop') as mock_new_event_loop, \
-            patch('configs.supabase.asyncio.set_event_loop') as mock_set_event_loop, \
-            patch('configs.supabase.asyncio.get_event_loop') as mock_get_event_loop, \
-            patch('configs.supabase.connect_to_supabase') as mock_connect_to_supabase:
+            patch('configs.supabase.asyncio.set_event_loop'), \
+            patch('configs.supabase.listener_lock', HostLock(str(tmp_path / "listener.lock"))), \
+            patch('configs.supabase.listen_for_template_changes', new=MagicMock()) as mock_listen:
         loop_mock = mock_new_event_loop.return_value
         run_websocket_listener()
-        mock_connect_to_supabase.assert_called_once()
-        loop_mock.run_forever.assert_called_once()
\ No newline at end of file
+        mock_listen.assert_called_once()
+        loop_mock.run_until_complete.assert_called_once_with(mock_listen.return_value)
+
+
+def test_run_websocket_listener_waits_for_the_host_lock(tmp_path):
+    leader = HostLock(str(tmp_path / "listener.lock"))
+    # flock locks belong to the open file, so a second HostLock contends even in-process
+    assert leader.try_acquire()
+    follower = HostLock(leader.path)
+    assert not follower.try_acquire()
+
+    def leader_exits(seconds):
+        leader.release()
+
+    with patch('configs.supabase.listener_lock', follower), \
+            patch('configs.supabase.time.sleep', side_effect=leader_exits) as mock_sleep, \
+            patch('configs.supabase.asyncio.new_event_loop'), \
+            patch('configs.supabase.asyncio.set_event_loop'), \
+            patch('configs.supabase.listen_for_template_changes', new=MagicMock()):
+        run_websocket_listener()
+
+    mock_sleep.assert_called_once()
+    assert follower.held()
+    follower.release()
+
+
+def test_listener_reconnects_with_backoff():
+    attempts = []
+
+    async def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("refused")
+        if len(attempts) == 3:
+            raise asyncio.CancelledError()
+
+    with patch('configs.supabase.connect_to_supabase', side_effect=connect), \
+            patch('configs.supabase.reconnect_delay', return_value=0) as mock_delay:
+        try:
+            asyncio.run(listen_for_template_changes())
+        except asyncio.CancelledError:
+            pass
+
+    assert len(attempts) == 3
+    assert [call.args[0] for call in mock_delay.call_args_list] == [0, 1]
+
+
+def test_connect_to_supabase_resubscribes_and_reloads():
+    socket = MagicMock()
+    socket._connect = AsyncMock()
+    socket._close = AsyncMock()
+    socket._listen = AsyncMock()
+    # Still running when the listener returns, so it has to be cancelled
+    socket._keep_alive = lambda: asyncio.sleep(60)
+    channel = socket.set_channel.return_value
+    channel._join = AsyncMock()
+    with patch('configs.supabase.Socket', return_value=socket), \
+            patch('configs.supabase.template_changes') as mock_changes:
+        asyncio.run(connect_to_supabase())
+
+    channel.on.assert_called_once_with("*", callback1)
+    channel._join.assert_awaited_once()
+    mock_changes.reload.assert_called_once()
+    socket._close.assert_awaited_once()
+
+
+def test_template_store_follows_published_templates(tmp_path):
+    leader = make_template_store(tmp_path)
+    follower = make_template_store(tmp_path, check_interval=0)
+    with patch('configs.cache_template.get_lookup_templates', return_value=mock_templates):
+        follower.reload()
+        leader.reload()
+        leader.apply([{"id": 2, "name": "wrong_format", "content": "Try again"}], set())
+
+    # Read from the published file, not the database
+    with patch('configs.cache_template.get_lookup_templates', side_effect=Exception("down")):
+        assert follower.get("wrong_format") == "Try again"
+        assert follower.version() == leader.version() == 1
+
+
+def test_template_store_applies_changes_without_reloading(tmp_path):
+    store = make_template_store(tmp_path)
+    version = store.version_marker
+    with patch('configs.cache_template.get_lookup_templates', return_value=mock_templates) as mock_load:
+        store.reload()
+        names = store.apply(
+            [{"id": 2, "name": "wrong_format", "content": "Try again"}, {"id": 4, "name": "final", "content": "Bye"}],
+            {3},
+        )
+        assert mock_load.call_count == 1
+
+    assert names == {"wrong_format", "final", "has_tax_debt"}
+    assert store.get("wrong_format") == "Try again"
+    assert store.get("final") == "Bye"
+    assert store.get("has_tax_debt") is None
+    # Published for the other workers, without reloading here
+    assert version.read() == 1
+    assert store.version() == 1
+
+
+def test_template_changes_coalesces_payloads():
+    store = MagicMock()
+    store.apply.return_value = {"final"}
+    changes = TemplateChanges(store, debounce=60)
+    with patch('configs.supabase.rerender_parcel_replies') as mock_rerender:
+        changes.add({"type": "INSERT", "record": {"id": 4, "name": "final", "content": "Bye"}, "old_record": {}})
+        changes.add({"type": "UPDATE", "record": {"id": 4, "name": "final", "content": "Bye!"}, "old_record": {}})
+        changes.add({"type": "DELETE", "record": None, "old_record": {"id": 3}})
+        changes._timer.cancel()
+        changes.flush()
+
+    store.apply.assert_called_once_with([{"id": 4, "name": "final", "content": "Bye!"}], {3})
+    store.publish.assert_not_called()
+    mock_rerender.assert_called_once_with(["final"])
+
+
+def test_template_changes_reloads_on_subscribe_and_gaps():
+    store = MagicMock()
+    store.publish.return_value = set()
+    changes = TemplateChanges(store, debounce=60)
+    with patch('configs.supabase.template_changes', changes), \
+            patch('configs.supabase.rerender_parcel_replies') as mock_rerender:
+        callback1({"message": "Subscribed to PostgreSQL", "status": "ok"})
+        changes._timer.cancel()
+        changes.flush()
+        store.publish.assert_called_once()
+
+        # The server leaves the record out of payloads that are too large
+        callback1({"type": "UPDATE", "record": {}, "old_record": {}, "errors": ["Error 413: Payload Too Large"]})
+        changes._timer.cancel()
+        changes.flush()
+        assert store.publish.call_count == 2
+        store.apply.assert_not_called()
+        mock_rerender.assert_not_called()
+
+
+def test_parcel_rows_query_reads_precomputed_rental_matches():
+    sql = str(parcel_rows_query().compile(dialect=postgresql.dialect()))
+
+    assert "LEFT OUTER JOIN address_lookup.parcel_rental_matches" in sql
+    assert "ST_DWithin" not in sql
+
+
+def test_create_rental_matches_table_before_the_first_ingest(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'lookup.sqlite3'}")
+
+    @event.listens_for(engine, "connect")
+    def attach_schema(connection, record):
+        connection.execute(f"ATTACH DATABASE '{tmp_path / 'address_lookup.sqlite3'}' AS address_lookup")
+
+    with patch('cron.rental_match.engine', engine):
+        create_rental_matches_table()
+        # Leaves the table an ingest already built alone
+        create_rental_matches_table()
+
+    assert inspect(engine).has_table("parcel_rental_matches", schema="address_lookup")
+
+
+def test_parcel_rental_matches_keep_one_registration_per_parcel():
+    build = " ".join(BUILD_PARCEL_RENTAL_MATCHES[1].split())
+    assert build.startswith("CREATE TABLE address_lookup.parcel_rental_matches_new AS SELECT DISTINCT ON (mi_wayne_detroit.ogc_fid)")
+    assert build.endswith(
+        "ORDER BY mi_wayne_detroit.ogc_fid, match_score DESC, residential_rental_registrations.date_status DESC NULLS LAST"
+    )
+    assert "ADD PRIMARY KEY (ogc_fid)" in BUILD_PARCEL_RENTAL_MATCHES[2]
+
+
+# Needs PostGIS and pg_trgm; everything runs in its own schema and is rolled back
+@pytest.mark.skipif(not os.environ.get("BENCHMARK_DATABASE_URL"), reason="set BENCHMARK_DATABASE_URL to run")
+def test_parcel_with_several_registrations_gets_one_match_on_postgres():
+    engine = create_engine(os.environ["BENCHMARK_DATABASE_URL"])
+    schema = "test_rental_match"
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(text(f"CREATE SCHEMA {schema}"))
+            connection.execute(text(
+                f"CREATE TABLE {schema}.mi_wayne_detroit "
+                "(ogc_fid integer, saddno varchar, saddstr varchar, wkb_geometry geometry)"
+            ))
+            connection.execute(text(
+                f"CREATE TABLE {schema}.residential_rental_registrations (record_id varchar, "
+                "street_num varchar, street_name varchar, date_status timestamptz, wkb_geometry geometry)"
+            ))
+            connection.execute(text(
+                f"INSERT INTO {schema}.mi_wayne_detroit VALUES (1, '1234', 'MAIN', ST_MakePoint(-83.05, 42.33))"
+            ))
+            connection.execute(text(
+                f"INSERT INTO {schema}.residential_rental_registrations VALUES "
+                "('old', '1234', 'MAIN', '2020-01-01', ST_MakePoint(-83.05, 42.33)), "
+                "('new', '1234', 'MAIN', '2023-01-01', ST_MakePoint(-83.05, 42.33))"
+            ))
+            for statement in BUILD_PARCEL_RENTAL_MATCHES:
+                connection.execute(text(statement.replace("address_lookup", schema)))
+
+            rows = connection.execute(text(f"SELECT ogc_fid, record_id FROM {schema}.parcel_rental_matches")).all()
+        finally:
+            transaction.rollback()
+
+    # The lookup used to get a row per registration, and answered closest_match for one parcel
+    assert [tuple(row) for row in rows] == [(1, "new")]
+
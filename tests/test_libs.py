@@ -0,0 +1,413 @@
+import asyncio
+import queue
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from sqlalchemy import create_engine, text
+from urllib3.exceptions import NewConnectionError
+
+from libs.MissiveAPI import MissiveAPI
+from libs.connection_leaks import ConnectionLeakDetector
+from libs.db_metrics import InstrumentedQueuePool, db_call_site, instrument_engine, statement_seconds
+from libs.conversation_state import ConversationStateStore
+from libs.job_queue import JobQueue
+from libs.metrics import MetricsRegistry
+from libs.parcel_snapshot import ParcelRecord, ParcelSnapshot, write_parcel_snapshot
+from libs.rate_limit import TokenBucket
+from libs.sms_dispatcher import OutboundMessage, SmsDispatcher
+from libs import stages
+from libs.version_marker import VersionMarker
+from libs.warmup import Warmup
+
+
+def test_parcel_snapshot_search(tmp_path):
+    path = str(tmp_path / "parcel_snapshot.bin")
+    records = [
+        ParcelRecord(1, "120 MAIN ST", "", "48201", "JANE DOE", "IS NOT", None, "OK"),
+        ParcelRecord(2, "12 MAIN ST", "APT 2", "48201", "JOHN DOE", "IS", 1500.25, "FORFEITED"),
+        ParcelRecord(3, "12 MAIN ST", "APT 3", "48201", "JOHN DOE", "IS", 0.0, "OK"),
+        ParcelRecord(4, "1 ELM ST", None, None, None, "IS NOT", None, None),
+    ]
+    assert write_parcel_snapshot(records, path) == 4
+
+    snapshot = ParcelSnapshot(path)
+    assert len(snapshot) == 4
+    assert [record.ogc_fid for record in snapshot.search("12 main st")] == [2, 3]
+    assert snapshot.search("12 MAIN ST", "apt 2") == [records[1]]
+    assert [record.ogc_fid for record in snapshot.search("12")] == [2, 3, 1]
+    assert snapshot.search("1 ELM ST") == [ParcelRecord(4, "1 ELM ST", "", "", "", "IS NOT", None, "")]
+    assert snapshot.search("99 MAIN ST") == []
+
+
+def test_parcel_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / "parcel_snapshot.bin"
+    path.write_bytes(b"not a snapshot")
+
+    with pytest.raises(ValueError):
+        ParcelSnapshot(str(path))
+
+
+def test_job_queue_runs_jobs_and_records_stats():
+    job_queue = JobQueue(workers=2, max_size=10)
+    results = []
+
+    assert job_queue.enqueue("append", results.append, 1)
+    assert job_queue.enqueue("fail", lambda: 1 / 0)
+    job_queue.join()
+
+    stats = job_queue.stats()
+    assert results == [1]
+    assert stats["enqueued"] == 2
+    assert stats["completed"] == 1
+    assert stats["failed"] == 1
+    assert stats["depth"] == 0
+    assert stats["latency_max_seconds"] >= stats["latency_avg_seconds"] > 0
+
+
+def test_job_queue_enqueue_during_start_is_not_lost(monkeypatch):
+    job_queue = JobQueue(workers=1, max_size=10)
+    results = []
+    starting = threading.Event()
+    make_queue = queue.Queue
+
+    def slow_queue(*args, **kwargs):
+        # Hold the first request inside _start while a second one comes in
+        starting.set()
+        time.sleep(0.05)
+        return make_queue(*args, **kwargs)
+
+    monkeypatch.setattr("libs.job_queue.queue.Queue", slow_queue)
+    first = threading.Thread(target=job_queue.enqueue, args=("append", results.append, 1))
+    first.start()
+    starting.wait()
+    job_queue.enqueue("append", results.append, 2)
+    first.join()
+
+    deadline = time.monotonic() + 5
+    while len(results) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(results) == [1, 2]
+
+
+def test_job_queue_rejects_when_full():
+    job_queue = JobQueue(workers=1, max_size=1)
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    assert job_queue.enqueue("block", block)
+    started.wait()
+    assert job_queue.enqueue("queued", lambda: None)
+    assert not job_queue.enqueue("rejected", lambda: None)
+    assert job_queue.stats()["rejected"] == 1
+
+    release.set()
+    job_queue.join()
+
+
+class RecordingSender:
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, message, to_phone, conversation_id=None, add_label_list=None):
+        self.sent.append((conversation_id, message, add_label_list, time.monotonic()))
+
+
+def test_sms_dispatcher_keeps_order_and_gap_without_blocking():
+    sender = RecordingSender()
+    dispatcher = SmsDispatcher(sender, min_gap=0.05, workers=2)
+
+    start = time.monotonic()
+    dispatcher.dispatch("a", "+1", [OutboundMessage("a1"), OutboundMessage("a2"), OutboundMessage("a3")])
+    dispatcher.dispatch("b", "+2", [OutboundMessage("b1")])
+    assert time.monotonic() - start < 0.05
+    assert dispatcher.wait_idle(5)
+
+    conversation_a = [sent for sent in sender.sent if sent[0] == "a"]
+    assert [sent[1] for sent in conversation_a] == ["a1", "a2", "a3"]
+    assert all(later[3] - earlier[3] >= 0.05 for earlier, later in zip(conversation_a, conversation_a[1:]))
+    # Other conversations are not held up behind "a"
+    assert [sent[1] for sent in sender.sent].index("b1") < 2
+
+
+def test_sms_dispatcher_merges_adjacent_mergeable_messages():
+    sender = RecordingSender()
+    dispatcher = SmsDispatcher(sender, min_gap=0.01, max_merged_length=20)
+
+    dispatcher.dispatch(None, "+1", [
+        OutboundMessage("one", ["tag"], True),
+        OutboundMessage("two", ["tag"], True),
+        OutboundMessage("three", None, True),
+        OutboundMessage("a much longer reply", None, True),
+    ])
+    assert dispatcher.wait_idle(5)
+
+    assert [(sent[0], sent[1], sent[2]) for sent in sender.sent] == [
+        (None, "one\n\ntwo", ["tag"]),
+        (None, "three", None),
+        (None, "a much longer reply", None),
+    ]
+
+
+def test_missive_api_reuses_one_pooled_session():
+    client = MissiveAPI(pool_size=3)
+    session = client.session
+    session.request = MagicMock(return_value=MagicMock(status_code=200))
+
+    client.send_sms_batch([
+        {"message": "one", "to_phone": "+1", "conversation_id": "c1"},
+        {"message": "two", "to_phone": "+1", "conversation_id": "c1"},
+    ])
+
+    assert client.session is session
+    assert session.adapters["https://"]._pool_maxsize == 3
+    bodies = [call.kwargs["data"] for call in session.request.call_args_list]
+    assert '"body": "one"' in bodies[0] and '"conversation": "c1"' in bodies[0]
+    assert '"body": "two"' in bodies[1]
+    assert all(call.kwargs["timeout"] == client.timeout for call in session.request.call_args_list)
+    client.close()
+
+
+def test_missive_api_batch_async_keeps_conversation_order():
+    client = MissiveAPI()
+    sent = []
+
+    async def send_sms_async(message, to_phone, conversation_id=None):
+        # The first conversation's first message is the slowest, yet its second waits for it
+        await asyncio.sleep(0.02 if message == "a1" else 0)
+        sent.append(message)
+        return message
+
+    client.send_sms_async = send_sms_async
+    results = asyncio.run(client.send_sms_batch_async([
+        {"message": "a1", "to_phone": "+1", "conversation_id": "a"},
+        {"message": "b1", "to_phone": "+2", "conversation_id": "b"},
+        {"message": "a2", "to_phone": "+1", "conversation_id": "a"},
+    ]))
+
+    assert results == ["a1", "b1", "a2"]
+    assert sent == ["b1", "a1", "a2"]
+
+
+def test_missive_api_discards_sessions_of_finished_event_loops():
+    client = MissiveAPI()
+
+    async def get_session():
+        return await client._get_async_session()
+
+    first = asyncio.run(get_session())
+    second = asyncio.run(get_session())
+
+    assert first is not second
+    assert first.closed and first.connector is None
+    assert list(client._async_sessions.values()) == [second]
+    second.detach()
+
+
+def test_token_bucket_spaces_out_bursts():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve(max_wait=0.1) is None
+    assert bucket.acquire(max_wait=1)
+
+
+def test_missive_api_retries_throttled_requests(monkeypatch):
+    monkeypatch.setattr("libs.MissiveAPI.time.sleep", lambda seconds: None)
+    client = MissiveAPI(rate_limiter=TokenBucket(rate=1000, capacity=1000), max_retries=2)
+    throttled = MagicMock(status_code=429, headers={"Retry-After": "1"})
+    ok = MagicMock(status_code=200)
+    client.session.request = MagicMock(side_effect=[throttled, ok])
+
+    assert client.send_sms_sync("hello", "+1") is ok
+    assert client.stats() == {"sent": 1, "throttled": 0, "retried": 1, "dropped": 0}
+
+    client.session.request = MagicMock(return_value=MagicMock(status_code=503, headers={}))
+    assert client.get_conversation_messages("c1") is None
+    assert client.session.request.call_count == 3
+    assert client.stats()["dropped"] == 1
+
+
+def test_missive_api_only_retries_sends_that_never_reached_missive(monkeypatch):
+    monkeypatch.setattr("libs.MissiveAPI.time.sleep", lambda seconds: None)
+    client = MissiveAPI(rate_limiter=TokenBucket(rate=1000, capacity=1000), max_retries=2)
+    ok = MagicMock(status_code=200)
+
+    # Missive may have sent the SMS before answering 503 or before the read timed out
+    unavailable = MagicMock(status_code=503, headers={})
+    unavailable.raise_for_status.side_effect = requests.exceptions.HTTPError("503")
+    for failure in (unavailable, requests.exceptions.ReadTimeout("read timed out")):
+        client.session.request = MagicMock(side_effect=[failure, ok])
+        assert client.send_sms_sync("hello", "+1") is None
+        assert client.session.request.call_count == 1
+
+    refused = requests.exceptions.ConnectionError(MagicMock(reason=NewConnectionError(None, "refused")))
+    for failure in (requests.exceptions.ConnectTimeout("connect timed out"), refused):
+        client.session.request = MagicMock(side_effect=[failure, ok])
+        assert client.send_sms_sync("hello", "+1") is ok
+        assert client.session.request.call_count == 2
+
+
+def test_conversation_state_store_round_trip_and_expiry(tmp_path):
+    store = ConversationStateStore(str(tmp_path / "state.sqlite3"), ttl=60)
+    parcel = ParcelRecord(1, "120 MAIN ST", "2", "48201", "JANE DOE", "IS", 12.5, "OK")
+
+    store.set_parcel("c1", parcel)
+    assert store.get_parcel("c1") == parcel
+    assert store.get_parcel("c2") is None
+
+    store.delete("c1")
+    assert store.get_parcel("c1") is None
+
+    expired = ConversationStateStore(store.path, ttl=-1)
+    expired.set_parcel("c3", parcel)
+    assert store.get_parcel("c3") is None
+    assert store.purge_expired() == 1
+
+    # set also purges, once purge_interval has passed
+    expired.set_parcel("c4", parcel)
+    purging = ConversationStateStore(store.path, ttl=60, purge_interval=0)
+    purging.set_parcel("c5", parcel)
+    assert store.connection.execute("SELECT conversation_id FROM conversation_state").fetchall() == [("c5",)]
+
+
+def test_version_marker_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "version")
+    writer, reader = VersionMarker(path), VersionMarker(path)
+
+    assert reader.read() == 0
+    assert writer.bump() == 1
+    assert writer.bump() == 2
+    assert reader.read() == 2
+
+
+def test_connection_leak_detector_reports_held_connections(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'leaks.sqlite3'}")
+    detector = ConnectionLeakDetector(engine, threshold=0.05, interval=60)
+
+    def hold_connection():
+        return engine.connect()
+
+    connection = hold_connection()
+    connection.execute(text("SELECT 1"))
+    with engine.connect() as returned:
+        returned.execute(text("SELECT 1"))
+    time.sleep(0.1)
+
+    leaks = detector.leaks()
+    assert len(leaks) == 1
+    assert "hold_connection" in leaks[0]["stack"]
+    assert leaks[0]["thread"] == threading.current_thread().name
+    assert detector.stats()["leaked"] == 1
+
+    connection.close()
+    assert detector.leaks() == []
+    assert detector.stats()["checked_out"] == 0
+
+
+def test_metrics_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests_total = registry.counter("requests_total", "Requests", labelnames=("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    registry.gauge("queue_depth", "Depth", function=lambda: 3)
+
+    requests_total.inc(route="/search")
+    requests_total.inc(2, route="/search")
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/search"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert 'queue_depth 3' in text
+    with pytest.raises(ValueError):
+        requests_total.inc(method="GET")
+
+
+def test_db_metrics_time_statements_by_call_site(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.sqlite3'}", poolclass=InstrumentedQueuePool)
+    registry = MetricsRegistry()
+    instrument_engine(engine, registry)
+
+    with db_call_site("test_site"), engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("SELECT 2"))
+
+    count = [
+        value for name, labels, value in statement_seconds.samples()
+        if name == "db_statement_seconds_count" and ("call_site", "test_site") in labels
+    ]
+    assert count == [2]
+    assert "db_pool_checked_out 0" in registry.render()
+
+
+def test_summary_reports_quantiles_of_recent_observations():
+    summary = MetricsRegistry().summary("stage_seconds", "Stages", labelnames=("stage",), window=100)
+    for value in range(1, 201):
+        summary.observe(value / 1000, stage="find_parcels")
+
+    quantiles, count, total = summary.snapshot()[("find_parcels",)]
+    # Only the last 100 observations count for the quantiles
+    assert quantiles == {0.5: 0.151, 0.95: 0.196, 0.99: 0.2}
+    assert count == 200
+    assert total == pytest.approx(20.1)
+
+
+def test_stages_are_timed_and_can_be_switched_off(monkeypatch):
+    with stages.stage("test_stage"):
+        time.sleep(0.01)
+
+    @stages.timed_stage("test_decorated_stage")
+    def decorated():
+        return "result"
+
+    assert decorated() == "result"
+    percentiles = stages.stage_percentiles()
+    assert percentiles["test_stage"]["count"] == 1
+    assert percentiles["test_stage"]["p50"] >= 0.01
+    assert percentiles["test_decorated_stage"]["count"] == 1
+    assert stages.traced_job("job", decorated)() == "result"
+
+    monkeypatch.setattr(stages, "STAGE_TIMING_ENABLED", False)
+    with stages.stage("test_stage"):
+        pass
+    assert stages.timed_stage("test_decorated_stage")(decorated) is decorated
+    assert stages.traced_job("job", decorated) is decorated
+    assert stages.stage_percentiles()["test_stage"]["count"] == 1
+
+
+def test_warmup_retries_failed_steps_until_ready():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise ConnectionError("database is starting up")
+
+    warmup = Warmup(retry_seconds=0.01)
+    warmup.step("first", lambda: None)
+    warmup.step("flaky", flaky)
+    assert not warmup.stats()["ready"]
+    assert warmup.stats()["steps"]["flaky"] == {"ready": False}
+
+    thread = warmup.start()
+    assert warmup.start() is None
+    thread.join(timeout=5)
+
+    assert warmup.stats()["ready"]
+    assert len(attempts) == 2
+    stats = warmup.stats()
+    assert stats["started"] and stats["steps"]["flaky"]["ready"]
+
@@ -0,0 +1,64 @@
+import json
+import threading
+
+import requests
+from flask import Flask, request
+
+from middlewares.record_middleware import RecordMiddleware
+from scripts.loadtest.fake_missive import FakeMissiveHandler
+from scripts.loadtest.fake_server import FakeServer
+from scripts.loadtest.replay import SyntheticTraffic, percentile
+
+
+def test_record_middleware_records_webhooks_and_passes_the_body_on(tmp_path):
+    path = tmp_path / "webhooks.jsonl"
+    app = Flask(__name__)
+
+    @app.route("/search", methods=["POST"])
+    def search():
+        return request.get_json()["message"]["preview"]
+
+    @app.route("/health")
+    def health():
+        return "ok"
+
+    app.wsgi_app = RecordMiddleware(app.wsgi_app, str(path))
+    client = app.test_client()
+    payload = {"message": {"preview": "1234 Main St"}}
+
+    assert client.post("/search?x=1", json=payload).get_data(as_text=True) == "1234 Main St"
+    assert client.get("/health").status_code == 200
+
+    [recorded] = [json.loads(line) for line in path.read_text().splitlines()]
+    assert recorded["method"] == "POST"
+    assert recorded["path"] == "/search"
+    assert recorded["query_string"] == "x=1"
+    assert json.loads(recorded["body"]) == payload
+
+
+def test_fake_missive_serves_drafts_and_injects_throttling():
+    server = FakeServer(("127.0.0.1", 0), FakeMissiveHandler, throttle_rate=0.5, seed=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        statuses = [
+            requests.post(f"{base}/v1/drafts", json={"drafts": {"body": "hi"}}, timeout=5).status_code
+            for _ in range(20)
+        ]
+        stats = requests.get(f"{base}/_stats", timeout=5).json()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert set(statuses) == {200, 429}
+    assert sum(stats.values()) == 20
+
+
+def test_synthetic_traffic_is_seeded():
+    mix = {"search": 1, "conversations": 1}
+    first, again = (SyntheticTraffic(["1 Main St"], mix, "tag", seed=3) for _ in range(2))
+    requests_sent = [first.request() for _ in range(10)]
+
+    assert requests_sent == [again.request() for _ in range(10)]
+    assert {request["method"] for request in requests_sent} == {"GET", "POST"}
+    assert percentile([1, 2, 3, 4], 0.5) == 3
@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock, patch
+
+from configs.query_engine.lookup import LookupResponse
+from constants.following_message import FollowingMessageType
+from libs.sms_dispatcher import OutboundMessage
+from services.services import handle_match, yes_search_service
+
+
+@patch("services.services.sms_dispatcher")
+@patch("services.services.get_template_content_by_name", return_value="No match for {address}")
+@patch("services.services.extract_latest_address",
+       return_value={"address_line_1": "1234 MAIN ST", "address_line_2": "APT 2"})
+@patch("services.services.missive_client")
+@patch("services.services.conversation_state_store")
+def test_yes_search_service_replies_no_match(
+        mock_state_store, mock_missive_client, mock_extract_latest_address, mock_get_template, mock_dispatcher
+):
+    mock_state_store.get_parcel.return_value = None
+    owner_query_engine = MagicMock()
+    owner_query_engine.query.return_value = LookupResponse()
+
+    result = yes_search_service("c1", "+1", owner_query_engine, MagicMock())
+
+    assert result == ({"result": "No match for 1234 MAIN ST APT 2"}, 200)
+    mock_dispatcher.dispatch.assert_called_once_with("c1", "+1", [OutboundMessage("No match for 1234 MAIN ST APT 2")])
+
+
+@patch.dict("os.environ", {"MISSIVE_LOOKUP_TAG_ID": "lookup"})
+@patch("services.services.sms_dispatcher")
+@patch("services.services.get_template_content_by_name", side_effect=lambda name: f"template {name}")
+def test_handle_match_dispatches_the_following_message(mock_get_template, mock_dispatcher):
+    handle_match(LookupResponse("JOHN DOE owns 1234 MAIN ST"), "c1", "+1",
+                 following_message_type=FollowingMessageType.LAND_BACK)
+
+    # Templates are looked up by the enum's value, the template name
+    mock_get_template.assert_called_once_with(FollowingMessageType.LAND_BACK.value)
+    conversation_id, to_phone, messages = mock_dispatcher.dispatch.call_args.args
+    assert (conversation_id, to_phone) == ("c1", "+1")
+    assert [message.body for message in messages] == [
+        "JOHN DOE owns 1234 MAIN ST", f"template {FollowingMessageType.LAND_BACK.value}"
+    ]
+    assert all(message.add_label_list == ["lookup"] for message in messages)
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+# Only imported on first use or by the warm-up thread, see libs/warmup.py
+LAZY_MODULES = ("llama_index", "openai", "scourgify", "usaddress", "paramiko", "tiktoken")
+
+
+def test_importing_main_does_not_load_lazy_modules():
+    env = {
+        **os.environ,
+        "SUMMARY_CONVO_SIDEBAR_ADDRESS": "http://localhost",
+        "DATABASE_URL": os.environ.get("DATABASE_URL", "postgresql://u:p@localhost/db"),
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, main; print(' '.join(sorted(sys.modules)))"],
+        capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    loaded = {name.split(".")[0] for name in result.stdout.split()}
+    assert not loaded & set(LAZY_MODULES)
@@ -2,14 +2,24 @@ import hashlib
 import hmac
 import json
 import os
+from pathlib import Path
 from unittest.mock import Mock, patch
 
+from scourgify import NormalizeAddress
+
+from constants.following_message import FollowingMessageType
+from libs.parcel_snapshot import ParcelRecord
 from middlewares.missive_middleware import AuthMiddleware
 from utils.address_normalizer import (
+    NormalizationCache,
     check_address_format,
+    get_first_valid_normalized_address,
+    normalization_cache,
 )
 from utils.check_property_status import check_property_status
+from utils.fast_address_normalizer import fast_normalize_address
 from utils.map_keys_to_result import map_keys_to_result
+from utils.parcel_replies import classify_parcel, render_parcel_replies
 
 
 def test_map_keys_to_result_with_proper_data():
@@ -304,3 +314,109 @@ class TestCheckAddressFormat:
         assert check_address_format("123") is None
         assert check_address_format("Broadway Avenue") is None
         assert check_address_format("18936 Littlefield St, Detroit, MI 48235") is None
+
+
+def test_normalization_cache_lru_and_ttl():
+    cache = NormalizationCache(max_size=2, ttl=60)
+    cache.set("a", {"address_line_1": "A"})
+    cache.set("b", None)
+    assert cache.get("b") is None
+    assert cache.get("a") == {"address_line_1": "A"}
+
+    # "b" is now the least recently used entry
+    cache.set("c", {"address_line_1": "C"})
+    cache.get("b")
+    assert cache.stats() == {
+        "size": 2, "max_size": 2, "hits": 1, "negative_hits": 1, "misses": 1, "evictions": 1, "hit_rate": 2 / 3,
+    }
+
+    expired = NormalizationCache(ttl=-1)
+    expired.set("a", None)
+    expired.get("a")
+    assert expired.stats()["misses"] == 1
+
+
+@patch("utils.address_normalizer.scourgify_normalize")
+def test_get_first_valid_normalized_address_is_memoized(mock_normalize_address):
+    def normalize(address):
+        if address == "12 not an address":
+            raise ValueError(address)
+        return {"address_line_1": address.upper()}
+
+    mock_normalize_address.side_effect = normalize
+    normalization_cache.clear()
+    # Neither goes through the fast path, which would skip scourgify
+    history = ["12 not an address", "123 main st, detroit"]
+
+    first = get_first_valid_normalized_address(history)
+    first["address_line_1"] = "changed"
+    assert get_first_valid_normalized_address(history) == {"address_line_1": "123 MAIN ST, DETROIT"}
+    assert mock_normalize_address.call_count == 2
+    assert normalization_cache.stats()["negative_hits"] == 1
+
+
+def scourgify_normalize(address):
+    try:
+        return dict(NormalizeAddress(address).normalize())
+    except Exception:
+        return None
+
+
+def test_fast_address_normalizer_matches_scourgify_on_message_previews():
+    previews = (Path(__file__).parent / "data" / "message_previews.txt").read_text().splitlines()
+
+    fast_path = [preview for preview in previews if fast_normalize_address(preview) is not None]
+    for preview in fast_path:
+        assert dict(fast_normalize_address(preview)) == scourgify_normalize(preview), preview
+
+    # Most of the address forms we get are the simple ones
+    assert len(fast_path) > len(previews) / 2
+
+
+def test_fast_address_normalizer_forms():
+    assert fast_normalize_address("5300 West Grand Boulevard") == {
+        "address_line_1": "5300 W GRAND BLVD", "address_line_2": None, "city": None, "state": None, "postal_code": None,
+    }
+    assert fast_normalize_address("1200 lafayette blvd, #12B")["address_line_2"] == "# 12B"
+    assert fast_normalize_address("2761 E Jefferson Ave. Apartment 4")["address_line_2"] == "APT 4"
+
+    # Left to scourgify: street names usaddress may tag otherwise, city/state, unknown types
+    assert fast_normalize_address("3400 Michigan Ave") is None
+    assert fast_normalize_address("1234 Main St, Detroit, MI 48201") is None
+    assert fast_normalize_address("8801 Lodge Fwy") is None
+    assert fast_normalize_address("I live at 1234 Main St") is None
+
+
+def test_classify_parcel():
+    parcel = ParcelRecord(1, "1234 MAIN ST", "", "48201", "DETROIT LAND BANK AUTHORITY", "IS", 0.0, "OK")
+    assert classify_parcel(parcel) == (
+        "NO_TAX_DEBT", "REGISTERED", FollowingMessageType.LAND_BACK, "NO_TAX_DEBT", "REGISTERED",
+    )
+
+    parcel = parcel._replace(owner=None, rental_status="IS NOT", tax_due=250.0, tax_status=None)
+    assert classify_parcel(parcel) == ("TAX_DEBT", "UNREGISTERED", FollowingMessageType.DEFAULT, "TAX_DEBT", "UNREGISTERED")
+
+    parcel = parcel._replace(tax_status="UNCONFIRMED")
+    assert classify_parcel(parcel).following_message_type == FollowingMessageType.UNCONFIRMED_TAX_STATUS
+
+
+def test_render_parcel_replies():
+    templates = {
+        "owner_information": "{owner} owns {address} and owes {tax_due}.",
+        "match_second_message": "Text MORE.",
+        "has_tax_debt": "Tax help.",
+        "registered": "Registered rules.",
+        "final": "Final.",
+    }
+    parcel = ParcelRecord(1, "1234 MAIN ST", "", "48201", "JOHN DOE", "IS", 250.0, None)
+
+    replies = render_parcel_replies(parcel, templates)
+
+    assert replies.first_message == (
+        "JOHN DOE owns 1234 MAIN ST and owes $250.00. It is registered as a residential rental property"
+    )
+    assert replies.following_message == "Text MORE."
+    assert replies.more_messages == ["Tax help.", "Registered rules.", "Final."]
+    assert replies.template_names == [
+        "owner_information", "match_second_message", "has_tax_debt", "registered", "final",
+    ]
@@ -1,11 +1,100 @@
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 
-from scourgify import NormalizeAddress
+from dotenv import load_dotenv
 
 from libs.MissiveAPI import MissiveAPI
+from utils.fast_address_normalizer import fast_normalize_address
+
+load_dotenv(override=True)
+
+ADDRESS_CACHE_SIZE = int(os.environ.get("ADDRESS_CACHE_SIZE", 10000))
+ADDRESS_CACHE_TTL = float(os.environ.get("ADDRESS_CACHE_TTL", 24 * 60 * 60))
 
 missive_client = MissiveAPI()
 
+_MISSING = object()
+
+
+class NormalizationCache:
+    """Bounded LRU of scourgify results keyed by the raw string, entries expire after `ttl`.
+
+    Strings scourgify could not parse are cached as None, so a history scan doesn't
+    re-tag the same chatter on every follow-up.
+    """
+
+    def __init__(self, max_size=ADDRESS_CACHE_SIZE, ttl=ADDRESS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self._counts["misses"] += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._counts["hits" if entry[0] is not None else "negative_hits"] += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counts["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["negative_hits"] + self._counts["misses"]
+            hits = self._counts["hits"] + self._counts["negative_hits"]
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                **self._counts,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+
+normalization_cache = NormalizationCache()
+
+
+def scourgify_normalize(address):
+    # scourgify pulls in usaddress and geocoder, so it is imported for the first
+    # address the fast path can't handle rather than at startup
+    from scourgify import NormalizeAddress
+    return NormalizeAddress(address).normalize()
+
+
+def normalize_address(address):
+    """Memoized `NormalizeAddress(address).normalize()`; None if it can't be normalized.
+
+    Simple one-line addresses are normalized by the fast path, scourgify parses the rest.
+    """
+    normalized = normalization_cache.get(address)
+    if normalized is _MISSING:
+        normalized = fast_normalize_address(address)
+        if normalized is None:
+            try:
+                normalized = scourgify_normalize(address)
+            except Exception:
+                normalized = None
+        normalization_cache.set(address, normalized)
+
+    # Callers get their own copy, the cached result must not be modified
+    return normalized.copy() if normalized is not None else None
+
 
 def check_address_format(address):
     # Regex pattern to capture three parts of the address
@@ -28,17 +117,13 @@ def get_first_valid_normalized_address(address_list):
     for address in address_list:
         # Check if the first character of the address is a digit and if the address contains a space
         if address and address[0].isdigit() and " " in address:
-            try:
-                # Try to normalize the address
-                normalized_address = NormalizeAddress(address).normalize()
+            normalized_address = normalize_address(address)
 
-                # If normalization is successful, return the normalized address
+            # If normalization is successful, return the normalized address,
+            # otherwise continue to the next address
+            if normalized_address is not None:
                 return normalized_address
 
-            except Exception:
-                # If normalization fails, ignore the exception and continue to the next address
-                continue
-
     # If no valid address is found, return None
     return None
 
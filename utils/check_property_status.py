@@ -2,7 +2,10 @@ from utils.map_keys_to_result import map_keys_to_result
 
 
 def check_property_status(response):
-    owner_data = map_keys_to_result(response.metadata)
+    return property_statuses(map_keys_to_result(response.metadata))
+
+
+def property_statuses(owner_data):
     rental_status = ""
     tax_status = ""
     if "rental_status" in owner_data:
@@ -0,0 +1,117 @@
+import functools
+import os
+import re
+from collections import OrderedDict, namedtuple
+
+import yaml
+
+ADDRESS_CONSTANTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "address_constants.yaml")
+
+with open(ADDRESS_CONSTANTS_PATH) as file:
+    _config = yaml.safe_load(file)
+
+
+def _abbreviations(table, words):
+    """`table` restricted to `words`, which may be written out or already abbreviated."""
+    abbreviations = set(table.values())
+    return {
+        word: table.get(word, word)
+        for word in words
+        if table.get(word) or word in abbreviations
+    }
+
+
+FastPathTables = namedtuple("FastPathTables", "street_types occupancy_types directionals reserved_words")
+
+
+@functools.lru_cache(maxsize=None)
+def fast_path_tables():
+    # scourgify's package import pulls in usaddress, so its tables are read on the first
+    # address that gets this far rather than at startup
+    from scourgify import address_constants
+
+    # Abbreviated with the tables scourgify normalizes with, so both paths agree, but only
+    # for the street and occupancy types address_constants.yaml allows on the fast path.
+    street_types = _abbreviations(address_constants.STREET_TYPE_ABBREVIATIONS, _config["FAST_PATH_STREET_TYPES"])
+    occupancy_types = _abbreviations(
+        address_constants.OCCUPANCY_TYPE_ABBREVIATIONS, _config["FAST_PATH_OCCUPANCY_TYPES"]
+    )
+
+    # usaddress tags the diagonals (NE, NORTHWEST, ...) inconsistently, they go to scourgify
+    directionals = {
+        directional: abbreviation
+        for directional, abbreviation in address_constants.DIRECTIONAL_REPLACEMENTS.items()
+        if len(abbreviation) == 1
+    }
+    directionals.update({abbreviation: abbreviation for abbreviation in directionals.values()})
+
+    # Words usaddress may read as something other than part of a street name. Addresses
+    # whose street name contains one of them are left to scourgify.
+    reserved_words = (
+        set(address_constants.STREET_TYPE_ABBREVIATIONS)
+        | set(address_constants.STREET_TYPE_ABBREVIATIONS.values())
+        | set(address_constants.OCCUPANCY_TYPE_ABBREVIATIONS)
+        | set(address_constants.OCCUPANCY_TYPE_ABBREVIATIONS.values())
+        | set(address_constants.DIRECTIONAL_REPLACEMENTS)
+        | set(address_constants.DIRECTIONAL_REPLACEMENTS.values())
+        | set(address_constants.STATE_ABBREVIATIONS)
+        | set(address_constants.STATE_ABBREVIATIONS.values())
+        | set(address_constants.CITY_ABBREVIATIONS)
+        | {"DETROIT", "MI", "MICHIGAN", "USA", "PO", "BOX", "AND", "OF", "THE"}
+    )
+    return FastPathTables(street_types, occupancy_types, directionals, reserved_words)
+
+
+# "1234 [W] MAIN [STREET] ST[.] [[,] APT[.] 2B | #2B]"
+SIMPLE_ADDRESS = re.compile(
+    r"^(?P<number>[1-9]\d{0,5})"
+    r"(?:\s+(?P<directional>[A-Z]+)\.?)?"
+    r"\s+(?P<name>[A-Z]{2,}(?:\s+[A-Z]{2,}){0,2})"
+    r"\s+(?P<street_type>[A-Z]+)\.?"
+    r"(?:\s*,?\s+(?:(?P<occupancy>[A-Z]+)\.?\s+|#\s*)(?P<identifier>[A-Z]?\d+[A-Z]?))?$"
+)
+
+
+def fast_normalize_address(address):
+    """Normalize the simple one-line address forms without usaddress.
+
+    Returns the same dict as `NormalizeAddress(address).normalize()`, or None when the
+    address isn't one of the forms handled here and scourgify has to parse it.
+    """
+    match = SIMPLE_ADDRESS.match(" ".join(address.upper().split()))
+    if match is None:
+        return None
+
+    tables = fast_path_tables()
+    directional, name, street_type, occupancy = match.group("directional", "name", "street_type", "occupancy")
+    if street_type not in tables.street_types:
+        return None
+    if directional is not None and directional not in tables.directionals:
+        # Not a directional we handle, so the first word of the street name (or a
+        # diagonal, which then makes the name reserved)
+        name = f"{directional} {name}"
+        directional = None
+    if any(word in tables.reserved_words for word in name.split()):
+        return None
+
+    address_line_1 = [match.group("number")]
+    if directional is not None:
+        address_line_1.append(tables.directionals[directional])
+    address_line_1 += [name, tables.street_types[street_type]]
+
+    address_line_2 = None
+    if match.group("identifier") is not None:
+        if occupancy is None and "#" in tables.occupancy_types:
+            address_line_2 = f"# {match.group('identifier')}"
+        elif occupancy in tables.occupancy_types:
+            address_line_2 = f"{tables.occupancy_types[occupancy]} {match.group('identifier')}"
+        else:
+            return None
+
+    return OrderedDict(
+        address_line_1=" ".join(address_line_1),
+        address_line_2=address_line_2,
+        city=None,
+        state=None,
+        postal_code=None,
+    )
@@ -0,0 +1,77 @@
+from collections import namedtuple
+
+from configs.cache_template import RENTAL_STATUS_TEMPLATES, TAX_STATUS_TEMPLATES
+from configs.query_engine.lookup import render_owner_information
+from constants.following_message import FollowingMessageType
+from utils.check_property_status import property_statuses
+
+REGISTERED_SUFFIX = " It is registered as a residential rental property"
+
+# lookup_tax_status/rental_status are what /search records in the lookup history,
+# more_tax_status/more_rental_status what /more answers with (see check_property_status).
+ParcelClassification = namedtuple(
+    "ParcelClassification",
+    ["lookup_tax_status", "rental_status", "following_message_type", "more_tax_status", "more_rental_status"],
+)
+
+ParcelReplies = namedtuple("ParcelReplies", ["first_message", "following_message", "more_messages", "template_names"])
+
+
+def classify_parcel(row):
+    """Statuses the SMS flow derives from a lookup row (a ParcelRecord or query row)."""
+    tax_status, tax_due = row.tax_status, row.tax_due
+    if not tax_status and tax_due and int(tax_due) > 0:
+        lookup_tax_status = "TAX_DEBT"
+    elif tax_status == "OK":
+        lookup_tax_status = "NO_TAX_DEBT"
+    else:
+        lookup_tax_status = tax_status
+
+    if "LAND BANK" in (row.owner or "").upper():
+        following_message_type = FollowingMessageType.LAND_BACK
+    elif "UNCONFIRMED" in (tax_status or "").upper():
+        following_message_type = FollowingMessageType.UNCONFIRMED_TAX_STATUS
+    else:
+        following_message_type = FollowingMessageType.DEFAULT
+
+    more_statuses = property_statuses(
+        {"rental_status": row.rental_status, "tax_status": tax_status, "tax_due": tax_due}
+    )
+    more_tax_status, more_rental_status = more_statuses or (None, None)
+
+    return ParcelClassification(
+        lookup_tax_status,
+        "REGISTERED" if row.rental_status == "IS" else "UNREGISTERED",
+        following_message_type,
+        more_tax_status,
+        more_rental_status,
+    )
+
+
+def render_parcel_replies(row, templates):
+    """Every SMS a lookup of `row` sends, rendered from the `templates` name -> content mapping.
+
+    `template_names` lists the templates the replies were rendered from, so they can be
+    re-rendered when one of them changes.
+    """
+    classification = classify_parcel(row)
+    template_names = ["owner_information", classification.following_message_type.value]
+
+    first_message = render_owner_information(row, templates.get("owner_information") or "")
+    if classification.rental_status == "REGISTERED":
+        first_message = first_message.rstrip() + REGISTERED_SUFFIX
+
+    more_names = []
+    if classification.more_tax_status and classification.more_tax_status != "NO_TAX_DEBT":
+        more_names.append(TAX_STATUS_TEMPLATES.get(classification.more_tax_status))
+    if classification.more_rental_status:
+        more_names.append(RENTAL_STATUS_TEMPLATES.get(classification.more_rental_status))
+    more_names = [name for name in more_names if name] + ["final"]
+    template_names += more_names
+
+    return ParcelReplies(
+        first_message,
+        templates.get(classification.following_message_type.value) or "",
+        [templates[name] for name in more_names if templates.get(name)],
+        template_names,
+    )
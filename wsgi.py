@@ -1,5 +1,6 @@
-from main import app, start_mqtt
+from main import app, start_mqtt, start_warmup
 
 if __name__ == "__main__":
     start_mqtt()
+    start_warmup()
     app.run()